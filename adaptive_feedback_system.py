@@ -1,6 +1,7 @@
 from typing import Dict
 from content_based_recommender import ContentBasedRecommender
 from nutrition_calculator import NutritionCalculator
+from plan_history import PlanHistoryStore
 
 
 class AdaptiveFeedbackSystem:
@@ -8,9 +9,15 @@ class AdaptiveFeedbackSystem:
     Analyzes user feedback and adjusts recommendations accordingly
     """
     
-    def __init__(self, recommender: ContentBasedRecommender):
+    def __init__(self, recommender: ContentBasedRecommender, history: PlanHistoryStore = None):
+        """
+        Args:
+            recommender: Recommender generating the plans
+            history: Store of past plans and feedback; without it no repeats are avoided across plans
+        """
         self.recommender = recommender
         self.nutrition_calc = NutritionCalculator()
+        self.history = history
     
     def analyze_weight_progress(self, user_profile: Dict, feedback: Dict):
         """
@@ -118,14 +125,19 @@ class AdaptiveFeedbackSystem:
         return adjustments
     
     def generate_updated_meal_plan(self, user_id: int, feedback: Dict, 
-                                 user_profile: Dict):
+                                 user_profile: Dict, previous_plan: Dict = None):
         """
         Generate updated meal plan based on feedback
+
+        With the previous plan, only the meals the feedback affects are
+        re-planned (rejected recipes, meals off the new calorie or macro
+        targets), unless the user asked for more variety.
         
         Args:
             user_id: User ID
-            feedback: User feedback data
+            feedback: User feedback data, 'rejected_recipes' lists recipe names to replace
             user_profile: Current user profile
+            previous_plan: Plan the feedback is about, the plan is regenerated from scratch without it
         
         Returns:
             Tuple of (updated_meal_plan, adjustment_message)
@@ -141,24 +153,31 @@ class AdaptiveFeedbackSystem:
         
         # Adjust calories if needed
         if weight_analysis['calorie_adjustment'] != 0:
-            current_target = updated_profile.get('target_calories', 
-                self.nutrition_calc.calculate_target_calories(
-                    self.nutrition_calc.calculate_tdee(
-                        updated_profile.get('bmr', 1500), 
-                        updated_profile['activity_level']
-                    ), 
-                    updated_profile['weight_goal']
-                )
-            )
+            current_target = self.recommender.calculate_user_targets(updated_profile)['target_calories']
             updated_profile['target_calories'] = current_target + weight_analysis['calorie_adjustment']
-        
-        # Get recent recipes to avoid repetition
-        recent_recipes = self.get_recent_recipes(user_id, days=14)
-        
-        # Generate new meal plan
-        updated_meal_plan, nutrition_summary = self.recommender.generate_meal_plan(
-            updated_profile, days=7, recent_recipes=recent_recipes
-        )
+
+        replanned = None
+        if previous_plan is not None and not satisfaction_analysis['increase_variety']:
+            # Keep every meal the feedback does not touch
+            updated_meal_plan, nutrition_summary, replanned = self.recommender.update_meal_plan(
+                previous_plan, user_profile,
+                calorie_delta=weight_analysis['calorie_adjustment'],
+                rejected_recipes=feedback.get('rejected_recipes', []),
+                macro_adjustments=satisfaction_analysis['dietary_adjustments']
+            )
+        else:
+            # Get recent recipes to avoid repetition
+            recent_recipes = self.get_recent_recipes(user_id, days=14)
+
+            # Generate new meal plan
+            updated_meal_plan, nutrition_summary = self.recommender.generate_meal_plan(
+                updated_profile, days=7, recent_recipes=recent_recipes
+            )
+
+        # Remember the feedback and the new plan for the next round
+        if self.history is not None:
+            self.history.record_feedback(user_id, feedback)
+            self.history.record_plan(user_id, updated_meal_plan, nutrition_summary=nutrition_summary)
         
         # Create adjustment message
         message_parts = []
@@ -172,21 +191,24 @@ class AdaptiveFeedbackSystem:
         if satisfaction_analysis['dietary_adjustments']:
             message_parts.append(f"Adjusted macronutrients: {', '.join(satisfaction_analysis['dietary_adjustments'])}")
         
+        if replanned is not None:
+            message_parts.append(f"Replaced {len(replanned)} meals")
+
         adjustment_message = "; ".join(message_parts) if message_parts else "Plan optimized based on your feedback"
         
         return updated_meal_plan, adjustment_message
     
     def get_recent_recipes(self, user_id: int, days: int = 14):
         """
-        Get recently used recipe IDs for a user
+        Get recently planned recipes for a user from the plan history
         
         Args:
             user_id: User ID
             days: Number of days to look back
         
         Returns:
-            List of recent recipe IDs
+            List of recent recipe names, most recent first (empty without a history store)
         """
-        # This would typically query the database
-        # For now, return empty list - implement based on your database structure
-        return []
\ No newline at end of file
+        if self.history is None:
+            return []
+        return self.history.get_recent_recipes(user_id, days=days)
\ No newline at end of file
@@ -0,0 +1,329 @@
+'''
+Benchmark harness for the recommender hot paths
+
+Runs the filters, scoring, selection and full plan generation against the
+real recipe CSV and against synthetic catalogs sampled from its
+distributions, and writes latency percentiles, throughput and peak memory
+as JSON so runs can be compared.
+
+Usage:
+    python benchmark.py --csv new_recipe_set.csv --sizes 10000 100000 1000000 --output bench.json
+    python benchmark.py --sizes --days --startup
+'''
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from content_based_recommender import ContentBasedRecommender, check_portion_range
+from planner_stats import PlannerStats
+from recipe_catalog import RecipeCatalog
+
+BENCH_PROFILE = {
+    'age': 30,
+    'gender': 'male',
+    'height': 175,
+    'weight': 75,
+    'activity_level': 'moderately_active',
+    'weight_goal': 'loss',
+    'dietary_pref': 'vegetarian',
+    'allergies': ['nuts'],
+}
+
+# Per-row scoring through DataFrame.apply is only timed on a sample this large
+PER_ROW_SAMPLE = 2000
+
+# Run in a fresh interpreter per cold start, prints its timings as the last line of JSON
+STARTUP_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+from content_based_recommender import ContentBasedRecommender
+from planner_stats import PlannerStats
+imported = time.perf_counter()
+source, path, profile = sys.argv[1], sys.argv[2], json.loads(sys.argv[3])
+if source == 'snapshot':
+    recommender = ContentBasedRecommender.from_snapshot(path)
+else:
+    recommender = ContentBasedRecommender.from_csv(path, lazy_text=True)
+loaded = time.perf_counter()
+recommender.generate_meal_plan(profile, days=7)
+planned = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'load_ms': (loaded - imported) * 1000,
+    'first_plan_ms': (planned - loaded) * 1000,
+    'pandas_imported': 'pandas' in sys.modules
+}))
+'''
+
+
+def make_synthetic_catalog(recipes_df: pd.DataFrame, n_recipes: int, seed: int = 0):
+    '''
+    Synthetic catalog with the same category/meal type/allergen mix as recipes_df
+
+    Rows are sampled with replacement. Nutrients get multiplicative
+    log-normal noise so the calorie and macro distributions keep their
+    shape without being exact copies. Names are made unique, and the long
+    instruction text is left out to keep large catalogs in memory.
+    '''
+    rng = np.random.default_rng(seed)
+    sample = recipes_df.iloc[rng.integers(0, len(recipes_df), n_recipes)].reset_index(drop=True)
+
+    synthetic = pd.DataFrame({
+        'name': [f'{name} #{i}' for i, name in enumerate(sample['name'].astype(str))],
+        'ingredients': sample['ingredients'],
+        'instructions': '',
+        'category': sample['category'],
+    })
+    for column in ['calories', 'carbs', 'fats', 'fiber', 'protein', 'sugar', 'cholesterol']:
+        noise = rng.lognormal(mean=0.0, sigma=0.1, size=n_recipes)
+        synthetic[column] = np.round(sample[column].to_numpy(dtype=np.float64) * noise, 1)
+    synthetic['meal_type'] = sample['meal_type']
+    synthetic['allergies_free'] = sample['allergies_free']
+    return synthetic
+
+
+def time_operation(operation, repeats: int, warmup: int = 1):
+    '''
+    Run an operation repeatedly and summarize its latency and peak memory
+
+    Returns:
+        Dictionary with latency percentiles in milliseconds, throughput per second and peak memory in bytes
+    '''
+    for _ in range(warmup):
+        operation()
+
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        operation()
+        latencies.append(time.perf_counter() - start)
+
+    # Separate traced run, tracemalloc slows the code down too much to time it
+    tracemalloc.start()
+    operation()
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'repeats': repeats,
+        'mean_ms': round(float(latencies_ms.mean()), 3),
+        'p50_ms': round(float(np.percentile(latencies_ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(latencies_ms, 95)), 3),
+        'p99_ms': round(float(np.percentile(latencies_ms, 99)), 3),
+        'max_ms': round(float(latencies_ms.max()), 3),
+        'throughput_per_s': round(float(repeats / latencies_ms.sum() * 1000), 2) if latencies_ms.sum() > 0 else None,
+        'peak_memory_bytes': int(peak_bytes)
+    }
+
+
+def benchmark_catalog(recipes_df: pd.DataFrame, label: str, repeats: int, plan_days, nearest_k: int = None,
+                      portion_range=None):
+    '''
+    Benchmark every hot path of the recommender on one catalog
+
+    With nearest_k, plan generation is also timed with nearest-neighbour
+    candidate generation (see ContentBasedRecommender nearest_k). With
+    portion_range, it is also timed with portion scaling, counting the
+    slots that fell back to their whole meal type with and without it.
+    '''
+    results = {'catalog': label, 'recipes': int(len(recipes_df)), 'operations': {}}
+    operations = results['operations']
+
+    start = time.perf_counter()
+    recommender = ContentBasedRecommender(recipes_df)
+    results['build_seconds'] = round(time.perf_counter() - start, 4)
+
+    profile = dict(BENCH_PROFILE)
+    plan_context = recommender.calculate_user_targets(profile)
+    target_calories = plan_context['target_calories']
+    goal = plan_context['goal']
+    activity_level = plan_context['activity_level']
+    meal_type = 'dinner'
+    meal_target_calories = round(target_calories * plan_context['meal_distribution'][meal_type], 2)
+
+    suitable = recommender.filter_by_dietary_preferences(recommender.recipes_df, profile)
+    meal_recipes = suitable[suitable['meal_type'] == meal_type]
+    window_recipes = recommender.filter_recipes_by_calorie_window(meal_recipes, meal_target_calories)
+    if window_recipes.empty:
+        window_recipes = meal_recipes
+    per_row_sample = window_recipes.head(PER_ROW_SAMPLE)
+
+    operations['filter_by_dietary_preferences'] = time_operation(
+        lambda: recommender.filter_by_dietary_preferences(recommender.recipes_df, profile), repeats
+    )
+    operations['filter_recipes_by_calorie_window'] = time_operation(
+        lambda: recommender.filter_recipes_by_calorie_window(meal_recipes, meal_target_calories), repeats
+    )
+    operations['calculate_nutritional_score_per_row'] = time_operation(
+        lambda: per_row_sample.apply(
+            lambda x: recommender.calculate_nutritional_score(x, target_calories, activity_level, meal_type, goal), axis=1
+        ),
+        max(1, repeats // 10)
+    )
+    operations['calculate_nutritional_score_per_row']['rows'] = int(len(per_row_sample))
+    operations['calculate_nutritional_scores_batch'] = time_operation(
+        lambda: recommender.calculate_nutritional_scores(window_recipes, target_calories, activity_level, meal_type, goal),
+        repeats
+    )
+    operations['calculate_nutritional_scores_batch']['rows'] = int(len(window_recipes))
+
+    scored = window_recipes.copy()
+    scored['score'] = recommender.calculate_nutritional_scores(scored, target_calories, activity_level, meal_type, goal)
+    operations['select_diverse_recipes'] = time_operation(
+        lambda: recommender.select_diverse_recipes(scored, n_options=5), repeats
+    )
+
+    for days in plan_days:
+        # Clear the candidate cache so every run pays for filtering and scoring
+        def plan():
+            recommender.candidate_cache.clear()
+            recommender.generate_meal_plan(profile, days=days)
+        stats = time_operation(plan, max(1, repeats // max(1, days // 7)))
+        stats['plans_per_s'] = stats.pop('throughput_per_s')
+        operations[f'generate_meal_plan_{days}d'] = stats
+
+    if nearest_k:
+        start = time.perf_counter()
+        recommender.nearest_k = nearest_k
+        recommender.get_nutrient_index()
+        results['nearest_index_build_seconds'] = round(time.perf_counter() - start, 4)
+        for days in plan_days:
+            def plan():
+                recommender.candidate_cache.clear()
+                recommender.generate_meal_plan(profile, days=days)
+            stats = time_operation(plan, max(1, repeats // max(1, days // 7)))
+            stats['plans_per_s'] = stats.pop('throughput_per_s')
+            operations[f'generate_meal_plan_{days}d_nearest_{nearest_k}'] = stats
+        recommender.nearest_k = None
+
+    if portion_range:
+        fallbacks = {}
+        for scaling in (None, tuple(portion_range)):
+            recommender.portion_range = scaling
+            recommender.candidate_cache.clear()
+            planner_stats = PlannerStats()
+            recommender.generate_meal_plan(profile, days=1, stats=planner_stats)
+            fallbacks['scaled' if scaling else 'unscaled'] = planner_stats.counters['window_fallbacks']
+        results['window_fallbacks'] = fallbacks
+        for days in plan_days:
+            def plan():
+                recommender.candidate_cache.clear()
+                recommender.generate_meal_plan(profile, days=days)
+            stats = time_operation(plan, max(1, repeats // max(1, days // 7)))
+            stats['plans_per_s'] = stats.pop('throughput_per_s')
+            operations[f'generate_meal_plan_{days}d_portions'] = stats
+        recommender.portion_range = None
+    return results
+
+
+def measure_time_to_first_plan(csv_path: str, snapshot_dir: str, repeats: int = 5):
+    '''
+    Time cold starts to a first 7-day plan, each in a fresh interpreter
+
+    Compares loading through the CSV's catalog (built beforehand, so CSV
+    parsing is not counted) with loading a recommender snapshot saved with
+    save_snapshot, which is written first when missing.
+
+    Returns:
+        Dictionary per source with median import, load, first plan and total
+        milliseconds, total including the interpreter start
+    '''
+    here = os.path.dirname(os.path.abspath(__file__))
+    csv_path = os.path.abspath(csv_path)
+    snapshot_dir = os.path.abspath(snapshot_dir)
+    ContentBasedRecommender.from_snapshot(snapshot_dir, catalog=RecipeCatalog(csv_path))
+
+    results = {}
+    for source, path in [('catalog', csv_path), ('snapshot', snapshot_dir)]:
+        runs = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            completed = subprocess.run(
+                [sys.executable, '-c', STARTUP_SCRIPT, source, path, json.dumps(BENCH_PROFILE)],
+                cwd=here, capture_output=True, text=True, check=True
+            )
+            run = json.loads(completed.stdout.strip().splitlines()[-1])
+            run['total_ms'] = (time.perf_counter() - start) * 1000
+            runs.append(run)
+        results[source] = {
+            name: round(float(np.median([run[name] for run in runs])), 1)
+            for name in ['import_ms', 'load_ms', 'first_plan_ms', 'total_ms']
+        }
+        results[source]['repeats'] = repeats
+        results[source]['pandas_imported'] = any(run['pandas_imported'] for run in runs)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the meal planner hot paths')
+    parser.add_argument('--csv', default='new_recipe_set.csv', help='Recipe CSV used as the real catalog and sampling source')
+    parser.add_argument('--sizes', type=int, nargs='*', default=[10000, 100000, 1000000], help='Synthetic catalog sizes')
+    parser.add_argument('--days', type=int, nargs='*', default=[1, 7, 30], help='Plan lengths for generate_meal_plan')
+    parser.add_argument('--repeats', type=int, default=20, help='Timed repetitions per operation')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--nearest-k', type=int, default=None, help='Also time plans with nearest-neighbour candidates')
+    parser.add_argument('--portion-range', type=float, nargs=2, default=None, metavar=('MIN', 'MAX'),
+                        help='Also time plans with meals scaled between MIN and MAX servings')
+    parser.add_argument('--startup', action='store_true',
+                        help='Also time cold starts to the first plan, from the catalog and from a snapshot')
+    parser.add_argument('--snapshot-dir', default=None, help='Recommender snapshot for --startup, next to the CSV by default')
+    parser.add_argument('--output', default=None, help='JSON results file, printed to stdout when omitted')
+    args = parser.parse_args()
+    try:
+        check_portion_range(args.portion_range)
+    except ValueError as error:
+        parser.error(str(error))
+
+    recipes_df = pd.read_csv(args.csv)
+    catalogs = [(os.path.basename(args.csv), recipes_df)]
+    catalogs += [(f'synthetic-{size}', None) for size in args.sizes]
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'profile': BENCH_PROFILE,
+        'results': []
+    }
+    for label, catalog_df in catalogs:
+        if catalog_df is None:
+            catalog_df = make_synthetic_catalog(recipes_df, int(label.split('-')[1]), seed=args.seed)
+        print(f'Benchmarking {label} ({len(catalog_df)} recipes)...', file=sys.stderr)
+        report['results'].append(benchmark_catalog(catalog_df, label, args.repeats, args.days, nearest_k=args.nearest_k,
+                                                 portion_range=args.portion_range))
+
+    if args.startup:
+        print('Timing cold starts to the first plan...', file=sys.stderr)
+        snapshot_dir = args.snapshot_dir or os.path.splitext(args.csv)[0] + '.snapshot'
+        report['time_to_first_plan'] = measure_time_to_first_plan(args.csv, snapshot_dir)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    for result in report['results']:
+        print(f"\n{result['catalog']} ({result['recipes']} recipes, build {result['build_seconds']}s)", file=sys.stderr)
+        for name, stats in result['operations'].items():
+            print(f"  {name:<40} p50 {stats['p50_ms']:>10.3f} ms  p95 {stats['p95_ms']:>10.3f} ms  peak {stats['peak_memory_bytes'] / 1e6:>8.1f} MB", file=sys.stderr)
+    for source, stats in report.get('time_to_first_plan', {}).items():
+        print(f"\nTime to first plan from {source}: {stats['total_ms']} ms (import {stats['import_ms']} ms, "
+              f"load {stats['load_ms']} ms, plan {stats['first_plan_ms']} ms)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
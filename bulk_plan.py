@@ -0,0 +1,244 @@
+'''
+Non-interactive bulk meal planning
+
+Reads user profiles from a CSV or JSON Lines file, validates them with the
+same rules as the interactive prompts and streams one JSON line per
+profile as soon as its batch is planned. Only one batch of profiles and
+plans is held in memory, so the input can be arbitrarily long. Progress
+and a throughput summary go to stderr.
+
+Usage:
+    python bulk_plan.py profiles.csv --output plans.jsonl
+    python bulk_plan.py profiles.jsonl --workers 4 --days 7 > plans.jsonl
+    python bulk_plan.py profiles.csv --snapshot new_recipe_set.snapshot --output plans.jsonl
+
+CSV files need a header with age, height, weight, gender, activity_level
+and weight_goal columns, optionally dietary_pref, allergies (e.g.
+'gluten;nuts') and user_id. Each output line is either
+{"line": ..., "user_id": ..., "meal_plan": ..., "nutrition_summary": ...}
+or {"line": ..., "user_id": ..., "errors": [...]} for a rejected profile.
+'''
+import argparse
+import csv
+import itertools
+import json
+import sys
+import time
+from typing import Dict, List
+
+from content_based_recommender import ContentBasedRecommender, check_portion_range
+from parallel_planner import ParallelMealPlanner
+from profile_validation import DAYS_RANGE, MIN_RECIPE_REPEATS, validate_profile
+from recipe_catalog import RecipeCatalog
+
+
+def read_profiles(path: str, input_format: str = None):
+    '''
+    Yield (line number, raw profile) pairs one at a time
+
+    Args:
+        path: CSV or JSON Lines file, '-' for stdin
+        input_format: 'csv' or 'jsonl', guessed from the file extension when not given
+    '''
+    if input_format is None:
+        input_format = 'csv' if path.lower().endswith('.csv') else 'jsonl'
+    f = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8', newline='')
+    try:
+        if input_format == 'csv':
+            # Line 1 is the header
+            for line_number, row in enumerate(csv.DictReader(f), start=2):
+                yield line_number, {key: value for key, value in row.items() if value not in (None, '')}
+        else:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    profile = json.loads(line)
+                except json.JSONDecodeError as e:
+                    profile = {'_error': f'Invalid JSON: {e}'}
+                if not isinstance(profile, dict):
+                    profile = {'_error': 'Expected a JSON object'}
+                yield line_number, profile
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+class BulkPlanner:
+    '''
+    Plans validated profiles batch by batch, in this process or across a ParallelMealPlanner pool
+    '''
+    def __init__(self, csv_path: str, workers: int = 1, days: int = 7, max_recipe_repeats: int = 3, seed: int = 0,
+                 snapshot_dir: str = None, alternates: int = 0, portion_range=None):
+        '''
+        Args:
+            alternates: Ranked alternates per meal, for swapping meals without planning again
+            portion_range: (min, max) servings meals are scaled within to hit their calorie targets
+            snapshot_dir: Recommender snapshot to start from instead of the catalog, saved
+                from the catalog when missing or stale
+
+        Raises:
+            ValueError: When portion_range is not a (min, max) pair with 0 < min <= max
+        '''
+        portion_range = check_portion_range(portion_range)
+        self.days = days
+        self.max_recipe_repeats = max_recipe_repeats
+        self.seed = seed
+        self.alternates = alternates
+        self.recommender = None
+        self.pool = None
+        if workers > 1:
+            self.pool = ParallelMealPlanner(
+                csv_path, processes=workers, snapshot_dir=snapshot_dir, portion_range=portion_range
+            ).start()
+        elif snapshot_dir is not None:
+            self.recommender = ContentBasedRecommender.from_snapshot(
+                snapshot_dir, catalog=RecipeCatalog(csv_path), portion_range=portion_range
+            )
+        else:
+            self.recommender = ContentBasedRecommender.from_csv(csv_path, lazy_text=True)
+            self.recommender.portion_range = portion_range
+
+    def plan_batch(self, profiles: List[Dict], start_index: int):
+        '''
+        Returns:
+            List of (meal_plan, nutrition_summary) in input order
+        '''
+        if self.pool is not None:
+            result = self.pool.generate_meal_plans(
+                profiles, days=self.days, max_recipe_repeats=self.max_recipe_repeats, seed=self.seed,
+                alternates=self.alternates
+            )
+        else:
+            result = self.recommender.generate_meal_plans(
+                profiles, days=self.days, max_recipe_repeats=self.max_recipe_repeats, seed=self.seed,
+                start_index=start_index, alternates=self.alternates
+            )
+        return result['plans']
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+
+
+def run(planner: BulkPlanner, profiles, output, batch_size: int = 256, progress_every: int = 1000):
+    '''
+    Validate, plan and write every profile, one JSON line each
+
+    Users without a user_id are seeded by their line number, so a profile
+    plans the same whatever the batch size or worker count.
+
+    Args:
+        profiles: Iterable of (line number, raw profile) from read_profiles
+        output: Text file the JSON lines are written to
+        batch_size: Profiles planned at a time, bounds the memory held
+        progress_every: Profiles between progress lines on stderr, 0 for none
+
+    Returns:
+        Summary dictionary with counts, seconds and plans per second
+    '''
+    counts = {'read': 0, 'planned': 0, 'invalid': 0, 'failed': 0}
+    start = time.perf_counter()
+    next_progress = progress_every
+
+    profiles = iter(profiles)
+    while True:
+        batch = list(itertools.islice(profiles, batch_size))
+        if not batch:
+            break
+        counts['read'] += len(batch)
+
+        results = {}
+        valid = []
+        for line_number, raw_profile in batch:
+            profile, errors = validate_profile(raw_profile)
+            if '_error' in raw_profile:
+                errors = [raw_profile['_error']]
+            if errors:
+                results[line_number] = {'errors': errors}
+                counts['invalid'] += 1
+            else:
+                profile.setdefault('user_id', line_number)
+                valid.append((line_number, profile))
+
+        if valid:
+            try:
+                plans = planner.plan_batch([profile for _, profile in valid], valid[0][0])
+            except Exception:
+                # Plan one by one so a single bad profile does not fail its whole batch
+                plans = []
+                for line_number, profile in valid:
+                    try:
+                        plans.extend(planner.plan_batch([profile], line_number))
+                    except Exception as e:
+                        plans.append(e)
+            for (line_number, _), plan in zip(valid, plans):
+                if isinstance(plan, Exception):
+                    results[line_number] = {'errors': [f'{type(plan).__name__}: {plan}']}
+                    counts['failed'] += 1
+                else:
+                    results[line_number] = {'meal_plan': plan[0], 'nutrition_summary': plan[1]}
+                    counts['planned'] += 1
+
+        for line_number, raw_profile in batch:
+            record = {'line': line_number, 'user_id': raw_profile.get('user_id', line_number)}
+            record.update(results[line_number])
+            output.write(json.dumps(record) + '\n')
+        output.flush()
+
+        if progress_every and counts['read'] >= next_progress:
+            elapsed = time.perf_counter() - start
+            print(f"{counts['read']} profiles, {counts['read'] / elapsed:.1f}/s", file=sys.stderr)
+            next_progress += progress_every
+
+    total_seconds = time.perf_counter() - start
+    counts['total_seconds'] = round(total_seconds, 3)
+    counts['plans_per_second'] = round(counts['planned'] / total_seconds, 1) if total_seconds > 0 else None
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plan meals for every profile of a CSV or JSON Lines file')
+    parser.add_argument('profiles', help="CSV or JSON Lines file of user profiles, '-' for stdin")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default=None, help='Input format, guessed from the extension by default')
+    parser.add_argument('--output', default='-', help="JSON Lines output file, '-' for stdout")
+    parser.add_argument('--csv', default='new_recipe_set.csv', help='Recipe CSV, its catalog is built next to it')
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--max-recipe-repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0, help='Base seed of the per-user random generators')
+    parser.add_argument('--alternates', type=int, default=0, help='Ranked swap alternates per meal')
+    parser.add_argument('--portion-range', type=float, nargs=2, default=None, metavar=('MIN', 'MAX'),
+                        help='Scale meals between MIN and MAX servings to hit their calorie targets, e.g. 0.5 2')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes, 1 plans in this process')
+    parser.add_argument('--snapshot', default=None, help='Recommender snapshot directory to start from')
+    parser.add_argument('--batch-size', type=int, default=256, help='Profiles planned and written at a time')
+    parser.add_argument('--progress-every', type=int, default=1000, help='Profiles between progress lines, 0 for none')
+    args = parser.parse_args()
+    # Same limits as the plan service
+    if not DAYS_RANGE[0] <= args.days <= DAYS_RANGE[1]:
+        parser.error(f'--days must be between {DAYS_RANGE[0]} and {DAYS_RANGE[1]}, got {args.days}')
+    if args.max_recipe_repeats < MIN_RECIPE_REPEATS:
+        parser.error(f'--max-recipe-repeats must be at least {MIN_RECIPE_REPEATS}, got {args.max_recipe_repeats}')
+    try:
+        check_portion_range(args.portion_range)
+    except ValueError as error:
+        parser.error(str(error))
+
+    planner = BulkPlanner(args.csv, workers=args.workers, days=args.days,
+                          max_recipe_repeats=args.max_recipe_repeats, seed=args.seed, snapshot_dir=args.snapshot,
+                          alternates=args.alternates, portion_range=args.portion_range)
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        summary = run(planner, read_profiles(args.profiles, args.format), output,
+                      batch_size=args.batch_size, progress_every=args.progress_every)
+    finally:
+        planner.close()
+        if output is not sys.stdout:
+            output.close()
+    print(json.dumps(summary), file=sys.stderr)
+    if summary['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
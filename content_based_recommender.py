@@ -1,18 +1,525 @@
-from typing import Dict, List
-import pandas as pd
+from __future__ import annotations
+
+import hashlib
+import itertools
+import json
+import os
+import pickle
+import time
+from typing import TYPE_CHECKING, Dict, List, Tuple
 import numpy as np
-from scipy.special import softmax
 
+from meal_plan_optimizer import MealPlanOptimizer
 from nutrition_calculator import NutritionCalculator
+from plan_cache import CandidateCache
+from planner_stats import NULL_STATS, PlannerStats
+from recipe_catalog import (CATEGORICAL_COLUMNS, FLAG_COLUMNS, LONG_TEXT_COLUMNS, NUTRIENT_COLUMNS, TEXT_COLUMNS,
+                            CatalogText, FrameText, RecipeCatalog, _encode_text, arrays_to_frame, hash_names,
+                            normalize_recipes)
+from recipe_index import DIET_CATEGORIES, CalorieIndex, DietaryIndex, NutrientIndex
+from shopping_list import ParsedIngredients, aggregate_ingredients, parse_ingredients
+# pandas, SciPy and the ingredient index are imported where they are first needed,
+# so a recommender loaded from a snapshot plans without ever importing them
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Versions for catalogs given as plain DataFrames
+_frame_versions = itertools.count(1)
+
+# Bump whenever the snapshot layout changes so old snapshots are refused
+SNAPSHOT_VERSION = 2
+
+# Number of recent meals the variety and ingredient-diversity penalties look back on
+RECENT_MEALS = 15
+
+# Distinct recipes a meal slot's calorie window must offer before the search stops widening,
+# the same as the number of top candidates each selection draws from
+MIN_SLOT_CANDIDATES = 5
+
+# Closest recipe names of each meal type kept to top up the alternates of slots whose candidates run short
+ALTERNATE_FILL_NAMES = 24
+
+# Macro target scaled by each dietary adjustment of the feedback loop
+MACRO_ADJUSTMENTS = {
+    'increase_protein': ('protein', 1.15),
+    'reduce_carbs': ('carbs', 0.85)
+}
+
+
+def _softmax(values: np.ndarray):
+    '''
+    Same as scipy.special.softmax over a 1-D array, without importing SciPy
+    '''
+    exp_shifted = np.exp(values - np.max(values, keepdims=True))
+    return exp_shifted / np.sum(exp_shifted, keepdims=True)
+
+
+def read_snapshot_meta(snapshot_dir: str):
+    '''
+    Returns the metadata of a recommender snapshot or None when no snapshot was saved there
+    '''
+    meta_path = os.path.join(snapshot_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def check_portion_range(portion_range):
+    '''
+    Validate a (min, max) servings range, see ContentBasedRecommender
+
+    Returns:
+        The range as a tuple of floats, or None when no range is given
+
+    Raises:
+        ValueError: When portion_range is not a (min, max) pair with 0 < min <= max
+    '''
+    if portion_range is None:
+        return None
+    portion_range = tuple(float(scale) for scale in portion_range)
+    if len(portion_range) != 2 or not 0 < portion_range[0] <= portion_range[1] < np.inf:
+        raise ValueError(f'portion_range must be (min, max) with 0 < min <= max, got {portion_range}')
+    return portion_range
+
+
+def _save_array(path: str, values: np.ndarray):
+    # Written then renamed, so processes that memory-mapped the old file keep a valid copy
+    with open(path + '.tmp', 'wb') as f:
+        np.save(f, values)
+    os.replace(path + '.tmp', path)
 
 class ContentBasedRecommender:
     '''
     Core recommendation engine using content-based filtering
     It maches user nutritional needs with recipe attributes
     '''
-    def __init__(self, recipes_df:pd.DataFrame):
-        self.recipes_df = recipes_df
+    MEAL_TYPES = ['breakfast', 'lunch', 'dinner', 'snack']
+
+    def __init__(self, recipes_df:pd.DataFrame = None, catalog_arrays: Dict = None, catalog_version: str = None,
+                 candidate_cache: CandidateCache = None, recipe_text: CatalogText = None, nearest_k: int = None,
+                 portion_range: Tuple[float, float] = None):
+        '''
+        Args:
+            recipes_df: Recipe DataFrame, raw or normalized. None leaves the recommender
+                empty until set_recipes or load_snapshot is called
+            catalog_arrays: Optional arrays from RecipeCatalog.load_arrays. Nutrient
+                columns are scored from these directly (e.g. memory-mapped) instead
+                of being copied out of recipes_df
+            catalog_version: Identifies the recipe data in cache keys, generated when not given
+            candidate_cache: Cache of prepared plan contexts, a default-sized one is created when not given
+            recipe_text: Lazy text columns of a catalog, recipes_df then only holds the
+                numeric, categorical and flag columns (see from_catalog with lazy_text).
+                When not given, the text columns are split off recipes_df
+            nearest_k: When set, each meal slot scores only the nearest_k recipes closest
+                to its nutrient targets (see NutrientIndex) instead of its whole calorie window
+            portion_range: (min, max) servings a meal may be scaled to, e.g. (0.5, 2.0). When set,
+                every candidate is scaled within the range to land on its meal's calorie target,
+                scored on the scaled nutrients and planned with its 'servings'
+
+        Raises:
+            ValueError: When portion_range is not a (min, max) pair of positive numbers
+        '''
         self.nutrition_calc = NutritionCalculator()
+        self.optimizer = MealPlanOptimizer(self)
+        self.candidate_cache = candidate_cache if candidate_cache is not None else CandidateCache()
+        self.catalog = None
+        self.catalog_mmap_mode = None
+        self.catalog_lazy_text = False
+        self.nearest_k = nearest_k
+        self.portion_range = portion_range
+        self.snapshot_dir = None
+        self._frame_source = None
+        self._recipes_df = None
+        if recipes_df is not None:
+            self.set_recipes(recipes_df, catalog_arrays=catalog_arrays, catalog_version=catalog_version,
+                             recipe_text=recipe_text)
+
+    @property
+    def recipes_df(self):
+        '''
+        Slim recipe frame without the long text columns
+
+        Recommenders loaded from a snapshot, or from a catalog with lazy_text,
+        plan on its arrays alone, their frame is only assembled (and pandas
+        imported) when first asked for.
+        '''
+        if self._recipes_df is None and self._frame_source is not None:
+            arrays, categories = self._frame_source
+            self._recipes_df = arrays_to_frame(arrays, categories, text_columns=[])
+        return self._recipes_df
+
+    @recipes_df.setter
+    def recipes_df(self, recipes_df: pd.DataFrame):
+        self._recipes_df = recipes_df
+
+    @property
+    def portion_range(self):
+        '''
+        (min, max) servings meals are scaled within, None when meals are not scaled
+        '''
+        return self._portion_range
+
+    @portion_range.setter
+    def portion_range(self, portion_range: Tuple[float, float]):
+        # Validated on every assignment, so workers and CLIs cannot set an inverted range
+        self._portion_range = check_portion_range(portion_range)
+
+    def set_recipes(self, recipes_df: pd.DataFrame, catalog_arrays: Dict = None, catalog_version: str = None,
+                    recipe_text: CatalogText = None):
+        '''
+        Replace the recipe catalog, rebuilding the indexes and invalidating cached candidates
+
+        The recommender keeps a slim recipes_df without the long text columns.
+        Ingredients and instructions are only fetched for the selected recipes.
+        '''
+        recipes_df = normalize_recipes(recipes_df)
+        self.snapshot_dir = None
+        self._frame_source = None
+        if recipe_text is None:
+            recipe_text = FrameText(recipes_df)
+        self.recipe_text = recipe_text
+        self.recipes_df = recipes_df.drop(columns=[column for column in LONG_TEXT_COLUMNS if column in recipes_df.columns])
+        self.dietary_index = DietaryIndex(
+            self.recipes_df, allergies_free=lambda: recipe_text.column('allergies_free')
+        )
+        self.calorie_index = CalorieIndex(self.recipes_df)
+        # Built (or loaded from the catalog directory) on first use, see get_ingredient_index
+        self.ingredient_index = None
+        # Built on first use, see get_nutrient_index
+        self.nutrient_index = None
+        # Parsed (or loaded from the catalog directory) on first use, see get_parsed_ingredients
+        self.parsed_ingredients = None
+
+        # Recipes are addressed by integer ID (row position); the planner works on these arrays
+        self.nutrients = {
+            column: catalog_arrays[column] if catalog_arrays is not None else self.recipes_df[column].to_numpy(dtype=np.float64)
+            for column in ['calories', 'protein', 'carbs', 'fats', 'fiber'] if column in self.recipes_df.columns
+        }
+        # Recipes sharing a name share a code, usage and variety are tracked per name.
+        # Codes are positions in the sorted name hashes, so names never have to be kept in memory
+        if catalog_arrays is not None and 'name.hash' in catalog_arrays:
+            name_hashes = catalog_arrays['name.hash']
+        else:
+            name_hashes = hash_names(self.recipes_df['name'])
+        self.name_hashes, self.name_codes = np.unique(name_hashes, return_inverse=True)
+
+        self.catalog_version = catalog_version if catalog_version is not None else f'frame-{next(_frame_versions)}'
+        self.candidate_cache.clear()
+
+    @classmethod
+    def from_csv(cls, csv_path: str, lazy_text: bool = False):
+        '''
+        Build the recommender from a recipe CSV through its precompiled catalog.
+        The catalog is rebuilt automatically when the CSV changes.
+        '''
+        return cls.from_catalog(RecipeCatalog(csv_path), lazy_text=lazy_text)
+
+    @classmethod
+    def from_catalog(cls, catalog: RecipeCatalog, mmap_mode: str = None, lazy_text: bool = False):
+        '''
+        Build the recommender from a precompiled catalog
+
+        Args:
+            catalog: RecipeCatalog to load (rebuilt first if its CSV changed)
+            mmap_mode: 'r' memory-maps the catalog files read-only, so processes
+                loading the same catalog share one physical copy of the nutrient arrays
+            lazy_text: Keep names, ingredients and instructions in the memory-mapped
+                catalog and only decode them for the selected recipes. The recipe frame
+                is only kept while the indexes are built and reassembled when asked for
+                (see recipes_df). Together with mmap_mode='r' this plans over catalogs
+                larger than memory
+        '''
+        arrays, meta = catalog.load_arrays(mmap_mode=mmap_mode)
+        recommender = cls(
+            catalog.to_frame(arrays, meta, text_columns=[] if lazy_text else TEXT_COLUMNS), catalog_arrays=arrays,
+            catalog_version=catalog.get_version(meta), recipe_text=CatalogText(arrays) if lazy_text else None
+        )
+        recommender.catalog = catalog
+        recommender.catalog_mmap_mode = mmap_mode
+        recommender.catalog_lazy_text = lazy_text
+        if lazy_text:
+            recommender._release_frame(arrays, meta)
+        return recommender
+
+    @classmethod
+    def from_snapshot(cls, snapshot_dir: str, mmap_mode: str = 'r', catalog: RecipeCatalog = None,
+                      candidate_cache: CandidateCache = None, nearest_k: int = None,
+                      portion_range: Tuple[float, float] = None):
+        '''
+        Load a recommender saved with save_snapshot
+
+        Nothing is parsed or rebuilt, the recipe and index arrays are mapped
+        back in as saved. pandas is not imported until something needs the
+        recipe frame, which planning does not.
+
+        Args:
+            snapshot_dir: Directory written by save_snapshot
+            mmap_mode: 'r' memory-maps the snapshot read-only, so processes loading the
+                same snapshot share one physical copy of it
+            catalog: When given, a missing snapshot or one saved from another version of
+                the catalog is saved again from it first, and refresh_catalog follows it
+            candidate_cache, nearest_k, portion_range: As in __init__
+
+        Raises:
+            ValueError: When no catalog is given and snapshot_dir holds no snapshot of the current version
+        '''
+        if catalog is not None:
+            meta = read_snapshot_meta(snapshot_dir)
+            catalog_meta = catalog.build() if catalog.is_stale() else catalog.read_meta()
+            if (meta is None or meta.get('version') != SNAPSHOT_VERSION
+                    or meta['catalog_version'] != catalog.get_version(catalog_meta)):
+                cls.from_catalog(catalog, mmap_mode='r', lazy_text=True).save_snapshot(snapshot_dir)
+
+        recommender = cls(candidate_cache=candidate_cache, nearest_k=nearest_k, portion_range=portion_range)
+        recommender.load_snapshot(snapshot_dir, mmap_mode=mmap_mode)
+        if catalog is not None:
+            recommender.catalog = catalog
+            recommender.catalog_mmap_mode = mmap_mode
+            recommender.catalog_lazy_text = True
+        return recommender
+
+    def get_ingredient_index(self):
+        '''
+        Ingredient TF-IDF index of the recipes
+
+        Catalog-backed recommenders store it in the catalog directory (and
+        snapshot-loaded ones in the snapshot), so it is only rebuilt when the
+        CSV changes.
+        '''
+        if self.ingredient_index is None:
+            from ingredient_index import IngredientIndex
+
+            path = None
+            if self.snapshot_dir is not None:
+                path = os.path.join(self.snapshot_dir, 'ingredients.tfidf.npz')
+            elif self.catalog is not None:
+                path = os.path.join(self.catalog.catalog_dir, 'ingredients.tfidf.npz')
+            self.ingredient_index = IngredientIndex.load_or_build(
+                path, self.recipe_text, len(self.name_codes), self.catalog_version
+            )
+        return self.ingredient_index
+
+    def get_parsed_ingredients(self):
+        '''
+        Parsed ingredient lists of every recipe, used for shopping lists
+
+        Stored next to the catalog (or in the snapshot) like the ingredient
+        index, so free text is parsed once per CSV version.
+        '''
+        if self.parsed_ingredients is None:
+            path = None
+            if self.snapshot_dir is not None:
+                path = os.path.join(self.snapshot_dir, 'ingredients.parsed.npz')
+            elif self.catalog is not None:
+                path = os.path.join(self.catalog.catalog_dir, 'ingredients.parsed.npz')
+            self.parsed_ingredients = ParsedIngredients.load_or_build(
+                path, self.recipe_text, len(self.name_codes), self.catalog_version
+            )
+        return self.parsed_ingredients
+
+    def get_nutrient_index(self):
+        '''
+        KD-tree index over the recipes' nutrient vectors, used when nearest_k is set
+        '''
+        if self.nutrient_index is None:
+            path = os.path.join(self.snapshot_dir, 'nutrients.kdtree.pkl') if self.snapshot_dir is not None else None
+            if path is not None and os.path.exists(path):
+                with open(path, 'rb') as f:
+                    self.nutrient_index = pickle.load(f)
+            else:
+                self.nutrient_index = NutrientIndex(self.recipes_df)
+        return self.nutrient_index
+
+    def save_snapshot(self, snapshot_dir: str, build_indexes: bool = True):
+        '''
+        Save the fully initialized recommender so from_snapshot can map it back in
+
+        The snapshot is a directory of .npy files: the recipe columns in the
+        catalog layout (nutrients, categorical codes, flags and text blobs),
+        the name codes and the dietary and calorie index arrays, plus the
+        ingredient TF-IDF index, the nutrient KD-trees and the parsed
+        ingredient lists. meta.json is
+        written last, so a half-written snapshot is never loaded.
+
+        Args:
+            snapshot_dir: Directory to write, created when missing
+            build_indexes: Build the ingredient and nutrient indexes and parse the ingredient lists first so they are saved
+                too, otherwise only the indexes built so far are saved
+
+        Returns:
+            Snapshot metadata
+        '''
+        import pandas as pd
+
+        os.makedirs(snapshot_dir, exist_ok=True)
+        meta_path = os.path.join(snapshot_dir, 'meta.json')
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+
+        recipes_df = self.recipes_df
+        n_recipes = len(self.name_codes)
+        arrays = {}
+        for column in NUTRIENT_COLUMNS:
+            arrays[column] = (recipes_df[column].to_numpy(dtype=np.float64) if column in recipes_df.columns
+                              else np.full(n_recipes, np.nan))
+        categories = {}
+        for column in CATEGORICAL_COLUMNS:
+            values = pd.Categorical(recipes_df[column])
+            arrays[f'{column}.codes'] = values.codes.astype(np.int16)
+            categories[column] = [str(category) for category in values.categories]
+        for column in FLAG_COLUMNS:
+            arrays[column] = recipes_df[column].to_numpy(dtype=bool)
+        for column in TEXT_COLUMNS:
+            if isinstance(self.recipe_text, CatalogText):
+                data = self.recipe_text.arrays[f'{column}.data']
+                offsets = self.recipe_text.arrays[f'{column}.offsets']
+            else:
+                values = pd.Series(self.recipe_text.column(column), dtype=object).fillna('').astype(str).tolist()
+                data, offsets = _encode_text(values)
+            arrays[f'{column}.data'], arrays[f'{column}.offsets'] = data, offsets
+        arrays['name.hashes'] = self.name_hashes
+        arrays['name.codes'] = self.name_codes
+
+        dietary_arrays, dietary_meta = self.dietary_index.to_arrays()
+        arrays.update({f'dietary.{name}': values for name, values in dietary_arrays.items()})
+        calorie_arrays, calorie_meta = self.calorie_index.to_arrays()
+        arrays.update({f'calorie.{name}': values for name, values in calorie_arrays.items()})
+
+        for name, values in arrays.items():
+            _save_array(os.path.join(snapshot_dir, f'{name}.npy'), values)
+        # Leftovers of an older snapshot, e.g. index arrays of a meal type that no longer exists
+        for file_name in os.listdir(snapshot_dir):
+            if file_name.endswith('.npy') and file_name[:-4] not in arrays:
+                os.remove(os.path.join(snapshot_dir, file_name))
+
+        if build_indexes:
+            self.get_ingredient_index()
+            self.get_nutrient_index()
+            self.get_parsed_ingredients()
+        if self.ingredient_index is not None:
+            self.ingredient_index.save(os.path.join(snapshot_dir, 'ingredients.tfidf.npz'))
+        if self.parsed_ingredients is not None:
+            self.parsed_ingredients.save(os.path.join(snapshot_dir, 'ingredients.parsed.npz'))
+        if self.nutrient_index is not None:
+            with open(os.path.join(snapshot_dir, 'nutrients.kdtree.pkl.tmp'), 'wb') as f:
+                pickle.dump(self.nutrient_index, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(os.path.join(snapshot_dir, 'nutrients.kdtree.pkl.tmp'),
+                       os.path.join(snapshot_dir, 'nutrients.kdtree.pkl'))
+
+        meta = {
+            'version': SNAPSHOT_VERSION,
+            'catalog_version': self.catalog_version,
+            'rows': n_recipes,
+            'categories': categories,
+            'nutrients': list(self.nutrients),
+            'dietary_index': dietary_meta,
+            'calorie_index': calorie_meta
+        }
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        return meta
+
+    def load_snapshot(self, snapshot_dir: str, mmap_mode: str = 'r'):
+        '''
+        Replace the recipes with a snapshot saved by save_snapshot, invalidating cached candidates
+
+        Args:
+            mmap_mode: Passed to np.load for the recipe and index arrays, 'r' memory-maps
+                them read-only. Text columns are always memory-mapped
+
+        Raises:
+            ValueError: When snapshot_dir holds no snapshot of the current version
+        '''
+        meta = read_snapshot_meta(snapshot_dir)
+        if meta is None or meta.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f'No recommender snapshot of version {SNAPSHOT_VERSION} in {snapshot_dir}, '
+                             'save one with save_snapshot')
+
+        arrays = {}
+        for file_name in os.listdir(snapshot_dir):
+            if file_name.endswith('.npy'):
+                name = file_name[:-4]
+                is_text = name.endswith('.data') or name.endswith('.offsets')
+                arrays[name] = np.load(os.path.join(snapshot_dir, file_name), mmap_mode='r' if is_text else mmap_mode)
+
+        recipe_text = CatalogText(arrays)
+        self.recipe_text = recipe_text
+        self._recipes_df = None
+        self._frame_source = (arrays, meta['categories'])
+        self.snapshot_dir = snapshot_dir
+        self.dietary_index = DietaryIndex.from_arrays(
+            {name[len('dietary.'):]: values for name, values in arrays.items() if name.startswith('dietary.')},
+            meta['dietary_index'], allergies_free=lambda: recipe_text.column('allergies_free')
+        )
+        self.calorie_index = CalorieIndex.from_arrays(
+            {name[len('calorie.'):]: values for name, values in arrays.items() if name.startswith('calorie.')},
+            meta['calorie_index']
+        )
+        # Loaded from the snapshot directory on first use
+        self.ingredient_index = None
+        self.nutrient_index = None
+        self.parsed_ingredients = None
+
+        self.nutrients = {column: arrays[column] for column in meta['nutrients']}
+        self.name_hashes, self.name_codes = arrays['name.hashes'], arrays['name.codes']
+        self.catalog_version = meta['catalog_version']
+        self.candidate_cache.clear()
+
+    def find_similar_recipes(self, recipe, k: int = 10, user_profile: Dict = None):
+        '''
+        Recipes with the most similar ingredients ("more like this")
+
+        Args:
+            recipe: Recipe ID or recipe name (the first recipe with that name is used)
+            k: Number of recipes to return
+            user_profile: Optional profile, only recipes fitting its diet and allergies are returned
+
+        Returns:
+            List of dictionaries with recipe_id, name, meal_type, calories and similarity, most similar first
+        '''
+        if isinstance(recipe, str):
+            name_code = self.get_name_codes([recipe])[0]
+            if name_code < 0:
+                raise ValueError(f"Unknown recipe '{recipe}'")
+            recipe = int(np.flatnonzero(self.name_codes == name_code)[0])
+
+        candidate_mask = self.get_suitable_mask(user_profile) if user_profile is not None else None
+        recipe_ids, similarities = self.get_ingredient_index().most_similar(recipe, k=k, candidate_mask=candidate_mask)
+        return [
+            {
+                'recipe_id': int(recipe_id),
+                'name': self.recipe_text.get(recipe_id, 'name'),
+                'meal_type': self.dietary_index.meal_type_of(recipe_id),
+                'calories': float(self.nutrients['calories'][recipe_id]),
+                'similarity': round(float(similarity), 4)
+            }
+            for recipe_id, similarity in zip(recipe_ids, similarities)
+        ]
+
+    def refresh_catalog(self):
+        '''
+        Reload the recipes when the catalog's CSV changed since they were loaded
+
+        Returns:
+            True if the recipes were reloaded (and the candidate cache cleared)
+        '''
+        if self.catalog is None or not self.catalog.is_stale():
+            return False
+        arrays, meta = self.catalog.load_arrays(mmap_mode=self.catalog_mmap_mode)
+        lazy_text = self.catalog_lazy_text
+        self.set_recipes(self.catalog.to_frame(arrays, meta, text_columns=[] if lazy_text else TEXT_COLUMNS),
+                         catalog_arrays=arrays, catalog_version=self.catalog.get_version(meta),
+                         recipe_text=CatalogText(arrays) if lazy_text else None)
+        if lazy_text:
+            self._release_frame(arrays, meta)
+        return True
+
+    def _release_frame(self, arrays: Dict, meta: Dict):
+        # The indexes are built, planning only needs the catalog arrays from here on.
+        # Dropping the frame keeps each process at the shared (memory-mapped) arrays
+        self._recipes_df = None
+        self._frame_source = (arrays, meta['categories'])
 
     def get_meal_distribution(self, goal:str, activity_level:str):
         '''
@@ -88,47 +595,86 @@ class ContentBasedRecommender:
         '''
         Filter recipes based on dietary preferences and allergies
         '''
-        filtered_recipes = recipe.copy()
+        if recipe is self.recipes_df:
+            return recipe[self.get_suitable_mask(user_profile)]
 
-        #Filter by dietary preference
-        dietary_pref:str = user_profile.get('dietary_pref', 'non-veg')
+        recipe = normalize_recipes(recipe)
+        return recipe[self.get_suitable_mask(user_profile, DietaryIndex(recipe))]
 
-        if dietary_pref == 'vegan':
-            filtered_recipes = filtered_recipes[filtered_recipes['category'].str.lower() == dietary_pref.lower()]
-        elif dietary_pref == 'vegetarian':
-            filtered_recipes = filtered_recipes[filtered_recipes['category'].str.lower().isin(['vegan', 'vegetarian'])]
-        
-        # Filter by allergies
+    def get_suitable_mask(self, user_profile: Dict, index: DietaryIndex = None, stats: PlannerStats = NULL_STATS):
+        '''
+        Boolean mask over the indexed recipes that fit the user's diet and allergies
+
+        Args:
+            user_profile: User profile with dietary_pref and allergies
+            index: DietaryIndex to use, defaults to the one built for recipes_df
+            stats: Optional PlannerStats collecting timings and counters
+        '''
+        if index is None:
+            index = self.dietary_index
+
+        dietary_pref:str = user_profile.get('dietary_pref', 'non-veg')
         allergies = user_profile.get('allergies', [])
+        if isinstance(allergies, str):
+            allergies = [allergies]
 
-        
-        if allergies and allergies !=[]:
-            # Converting user allergies to match the format in the column (e.g gluten-free, nuts-free etch)
-            allergy_filters = [f"{a}-free" for a in allergies]
-            strict_filtered = filtered_recipes[filtered_recipes['allergies_free'].apply(
-                        lambda free_list: all(af in free_list for af in allergy_filters)
-                        )]
-            if len(strict_filtered) >=20:
-                return strict_filtered
-            
-            relaxed_filtered = filtered_recipes[filtered_recipes['allergies_free'].apply(
-                                    lambda free_list: any(af in free_list for af in allergy_filters)
-                                    )]
-            if len(relaxed_filtered) >0:
-                print(f"Relaxed allergy filtering applied due to limited options")
-                return relaxed_filtered
+        # Diet and allergy bitsets, relaxing to "free from any allergen" when too few recipes match
+        with stats.timer('filter'):
+            suitable_bits, relaxed = index.suitable_bits(dietary_pref.lower(), allergies)
+            suitable_mask = index.unpack(suitable_bits)
+        if relaxed:
+            stats.count('relaxed_allergy_fallbacks', allergies=list(allergies))
+        return suitable_mask
+
+
+    def get_meal_targets(self, target_calories: float, activity_level: str, meal_type: str, goal: str = 'maintain'):
+        '''
+        Per-meal calorie, macro and fiber targets derived from the daily target
+
+        Returns:
+            Dictionary with calories, protein, carbs, fat and fiber targets for the meal
+        '''
+        meal_distribution = self.get_meal_distribution(goal, activity_level)
+        macro_distribution = self.get_macro_distribution(goal=goal, meal_type=meal_type)
 
-        # # Filter recipes that are free from all user allergens
-        # filtered_recipes = filtered_recipes[filtered_recipes['allergies_free'].apply(
-        #     lambda free_list: all(af in free_list for af in allergy_filters)
-        #     )]
-        return filtered_recipes
+        meal_target_calories = round(target_calories * meal_distribution[meal_type], 2)
+        return {
+            'calories': meal_target_calories,
+            'protein': round((meal_target_calories * macro_distribution['protein']) / 4, 2),
+            'carbs': round((meal_target_calories * macro_distribution['carbs']) / 4, 2),
+            'fat': round((meal_target_calories * macro_distribution['fat']) / 9, 2),
+            'fiber': 6.0 if meal_type in ['breakfast', 'lunch', 'dinner'] else 3.0,
+            'protein_ratio': macro_distribution['protein']
+        }
 
+    def get_score_weights(self, goal: str, meal_type: str):
+        '''
+        Goal-based score weightings with meal-specific adjustments
+        '''
+        # Goal-based weightings
+        if goal == 'loss':
+            weights = {'calories': 0.40, 'protein': 0.30, 'carbs': 0.15, 'fat': 0.10, 'fiber':0.10}
+        elif goal == 'gain':
+            weights = {'calories': 0.40, 'protein': 0.25, 'carbs': 0.25, 'fat': 0.10, 'fiber':0.10}
+        else:
+            weights = {'calories': 0.40, 'protein': 0.25, 'carbs': 0.25, 'fat': 0.10, 'fiber':0.10}
+
+        # Meal-specific adjustments
+        if meal_type == 'breakfast':
+            weights['protein'] *= 1.2
+        elif meal_type == 'dinner' and goal == 'loss':
+            weights['calories'] *= 1.3
+        elif meal_type == 'snack':
+            weights['fat'] *= 1.2
+        return weights
 
     def calculate_nutritional_score(self, recipe: pd.Series, target_calories: float, activity_level: str, meal_type: str, goal: str = 'maintain'):
         '''
         Scoring algorithm using Gaussian decay to match nutritional targets smoothly.
         Rewards closeness and punishes large mismatches softly.
+
+        Scores a single recipe; this is the reference implementation for
+        calculate_nutritional_scores, which scores whole columns at once.
         '''
     
         def gaussian_decay(actual, target, tolerance=0.05):
@@ -138,16 +684,13 @@ class ContentBasedRecommender:
             """
             return np.exp(-((actual - target) ** 2) / (2 * (tolerance * target) ** 2))
     
-        # Get meal and macro distributions
-        meal_distribution = self.get_meal_distribution(goal, activity_level)
-        macro_distribution = self.get_macro_distribution(goal=goal, meal_type=meal_type)
-    
-        meal_target_calories = round(target_calories * meal_distribution[meal_type], 2) 
-        meal_protein_target = round((meal_target_calories * macro_distribution['protein']) / 4, 2)
-        meal_carb_target = round((meal_target_calories * macro_distribution['carbs']) / 4,2)
-        meal_fat_target = round((meal_target_calories * macro_distribution['fat']) / 9,2)
-
-        meal_fiber_target = 6.0 if meal_type in ['breakfast', 'lunch', 'dinner'] else 3.0
+        # Get meal targets
+        targets = self.get_meal_targets(target_calories, activity_level, meal_type, goal)
+        meal_target_calories = targets['calories']
+        meal_protein_target = targets['protein']
+        meal_carb_target = targets['carbs']
+        meal_fat_target = targets['fat']
+        meal_fiber_target = targets['fiber']
     
         # Compute individual scores using Gaussian decay
         calorie_score = round(gaussian_decay(recipe['calories'], meal_target_calories, tolerance=0.05),2)
@@ -156,21 +699,7 @@ class ContentBasedRecommender:
         fat_score = round(gaussian_decay(recipe['fats'], meal_fat_target, ),2)
         fiber_score = round(gaussian_decay(recipe.get('fiber', 0), meal_fiber_target, ), 2)
 
-        # Goal-based weightings
-        if goal == 'loss':
-            weights = {'calories': 0.40, 'protein': 0.30, 'carbs': 0.15, 'fat': 0.10, 'fiber':0.10}
-        elif goal == 'gain':
-            weights = {'calories': 0.40, 'protein': 0.25, 'carbs': 0.25, 'fat': 0.10, 'fiber':0.10}
-        else:
-            weights = {'calories': 0.40, 'protein': 0.25, 'carbs': 0.25, 'fat': 0.10, 'fiber':0.10}
-
-        # Meal-specific adjustments
-        if meal_type == 'breakfast':
-            weights['protein'] *= 1.2
-        elif meal_type == 'dinner' and goal == 'loss':
-            weights['calories'] *= 1.3
-        elif meal_type == 'snack':
-            weights['fat'] *= 1.2
+        weights = self.get_score_weights(goal, meal_type)
 
         # Weighted total score
         total_score = (
@@ -193,13 +722,69 @@ class ContentBasedRecommender:
 
     # Bonus for balanced macro profile (especially protein ratio)
         recipe_protein_ratio = (recipe['protein'] * 4) / recipe['calories']
-        target_protein_ratio = macro_distribution['protein']
+        target_protein_ratio = targets['protein_ratio']
         if abs(recipe_protein_ratio - target_protein_ratio) <= 0.05:
             bonus += 0.02
 
         final_score = min(total_score + bonus, 1.0)
         return final_score
 
+    def calculate_nutritional_scores(self, recipes: pd.DataFrame, target_calories: float, activity_level: str, meal_type: str, goal: str = 'maintain'):
+        '''
+        Vectorized version of calculate_nutritional_score.
+        Scores every recipe in one pass over the nutrient columns and gives the
+        same numbers as the per-row function.
+
+        Args:
+            recipes: DataFrame (or dict of arrays) with calories, protein, carbs, fats and fiber
+            target_calories: Daily target calories
+
+        Returns:
+            NumPy array of scores aligned with the rows of recipes
+        '''
+        targets = self.get_meal_targets(target_calories, activity_level, meal_type, goal)
+        weights = self.get_score_weights(goal, meal_type)
+
+        calories = np.asarray(recipes['calories'], dtype=np.float64)
+        protein = np.asarray(recipes['protein'], dtype=np.float64)
+        carbs = np.asarray(recipes['carbs'], dtype=np.float64)
+        fats = np.asarray(recipes['fats'], dtype=np.float64)
+        if 'fiber' in recipes:
+            fiber = np.asarray(recipes['fiber'], dtype=np.float64)
+        else:
+            fiber = np.zeros_like(calories)
+
+        def gaussian_decay(actual, target, tolerance=0.05):
+            return np.exp(-((actual - target) ** 2) / (2 * (tolerance * target) ** 2))
+
+        # Individual scores, rounded exactly like the per-row version
+        calorie_score = np.round(gaussian_decay(calories, targets['calories']), 2)
+        protein_score = np.round(gaussian_decay(protein, targets['protein']), 2)
+        carb_score = np.round(gaussian_decay(carbs, targets['carbs']), 2)
+        fat_score = np.round(gaussian_decay(fats, targets['fat']), 2)
+        fiber_score = np.round(gaussian_decay(fiber, targets['fiber']), 2)
+
+        total_score = (
+            weights['calories'] * calorie_score +
+            weights['protein'] * protein_score +
+            weights['carbs'] * carb_score +
+            weights['fat'] * fat_score +
+            weights['fiber'] * fiber_score
+        )
+
+        # Bonus tiers
+        with np.errstate(divide='ignore', invalid='ignore'):
+            calorie_diff = np.abs(calories - targets['calories']) / targets['calories']
+            recipe_protein_ratio = (protein * 4) / calories
+        bonus = np.select(
+            [calorie_diff <= 0.02, calorie_diff <= 0.05, protein >= targets['protein'] * 0.8],
+            [0.05, 0.03, 0.03],
+            default=0.0
+        )
+        bonus = bonus + np.where(np.abs(recipe_protein_ratio - targets['protein_ratio']) <= 0.05, 0.02, 0.0)
+
+        return np.minimum(total_score + bonus, 1.0)
+
 
     def add_variety_penalty(self, recipes: pd.DataFrame, recent_recipes:List[str], penalty_factor: float = 0.6):
         '''
@@ -250,28 +835,231 @@ class ContentBasedRecommender:
         
         # Apply temperature scaling
         scaled_scores = scores / temperature
-        probabilities = softmax(scaled_scores)
+        probabilities = _softmax(scaled_scores)
         
         # Select based on weighted probability
         selected_idx = np.random.choice(len(top_recipes), p=probabilities)
-        return top_recipes.iloc[0]
+        return top_recipes.iloc[selected_idx]
     
+    def get_variety_penalties(self, recent_codes: List[int], penalty_factor: float = 0.6, candidate_codes: np.ndarray = None):
+        '''
+        Array version of add_variety_penalty
+
+        Args:
+            recent_codes: Name codes of recently used recipes, most recent first (-1 for unknown names)
+            candidate_codes: Name codes to return penalties for, all name codes when not given
+
+        Returns:
+            Multiplicative penalty per candidate code (or per name code)
+        '''
+        if candidate_codes is None:
+            candidate_codes = np.arange(len(self.name_hashes))
+        recent_codes = np.asarray(recent_codes, dtype=np.int64)
+        #Decay penality for older recipes
+        decay_factors = np.array([penalty_factor * (0.8 ** i) for i in range(len(recent_codes))])
+        known = recent_codes >= 0
+        if not known.any() or len(candidate_codes) == 0:
+            return np.ones(len(candidate_codes))
+
+        # One combined factor per recent name, then a single lookup for every candidate
+        recent_names, inverse = np.unique(recent_codes[known], return_inverse=True)
+        name_penalties = np.ones(len(recent_names))
+        np.multiply.at(name_penalties, inverse, decay_factors[known])
+        positions = np.minimum(np.searchsorted(recent_names, candidate_codes), len(recent_names) - 1)
+        return np.where(recent_names[positions] == candidate_codes, name_penalties[positions], 1.0)
+
+    def get_usage_penalties(self, usage_counts: np.ndarray):
+        '''
+        Array version of the repeat penalty in select_diverse_recipes
+
+        Returns:
+            Multiplicative penalty per name code
+        '''
+        return np.where(usage_counts >= 2, 0.1 ** usage_counts, 1.0)
+
+    def select_diverse_index(self, scores: np.ndarray, n_options: int = 3, candidate_mask: np.ndarray = None,
+                             rng: np.random.Generator = None):
+        '''
+        Array version of select_diverse_recipes
+
+        Args:
+            scores: Penalized candidate scores
+            n_options: Number of top recipes to randomly select from
+            candidate_mask: Optional boolean mask of candidates allowed to be picked
+            rng: Random generator for the weighted draw, defaults to the global NumPy state
+
+        Returns:
+            Position in scores of the selected candidate, None if nothing can be picked
+        '''
+        valid = ~np.isnan(scores)
+        if candidate_mask is not None:
+            valid &= candidate_mask
+        positions = np.flatnonzero(valid)
+        if len(positions) == 0:
+            return None
+        values = scores[positions]
+
+        #Get top N scores, best first and in catalog order between equal scores like nlargest
+        n_options = min(n_options, len(values))
+        top = np.argpartition(-values, n_options - 1)[:n_options]
+        top = top[np.lexsort((top, -values[top]))]
+
+        # Temperature-based selection (higher temperature = more exploration)
+        temperature = 0.3
+        probabilities = _softmax(values[top] / temperature)
+        if rng is None:
+            selected_idx = np.random.choice(n_options, p=probabilities)
+        else:
+            selected_idx = rng.choice(n_options, p=probabilities)
+        return positions[top[selected_idx]]
+
     def filter_recipes_by_calorie_window(self, recipes_df: pd.DataFrame, meal_target_calories:float, window:float = 0.05):
         '''
-        Filters recipes to only those within ±2% window of target calories
+        Filters recipes to only those within ±window of target calories
         '''
         lower_bound = meal_target_calories * (1 - window)
         upper_bound = meal_target_calories * (1 + window)
         filtered = recipes_df[(recipes_df['calories'] >= lower_bound) & (recipes_df['calories'] <= upper_bound)]
         return filtered
-    def generate_meal_plan(self, user_profile: Dict, days: int = 7, 
-                          recent_recipes: List[str] = None, max_recipe_repeats: int = 3):
+
+    def find_candidate_ids(self, meal_type: str, meal_target_calories: float, suitable_mask: np.ndarray,
+                           window: float = 0.05, max_window: float = 0.25, window_step: float = 0.05,
+                           stats: PlannerStats = NULL_STATS, portion_range: Tuple[float, float] = None,
+                           min_candidates: int = 1):
+        '''
+        IDs of suitable recipes of a meal type within a calorie window, using the sorted calorie index
+
+        The window starts at ±window and is widened by window_step up to
+        ±max_window while it holds fewer than min_candidates recipe names.
+        With a portion_range, a window too thin on its own also takes every
+        recipe some scale within the range brings inside it before it is
+        widened. When ±max_window is still too thin, the window keeps
+        widening past it, recipe by recipe in order of calorie distance,
+        until it holds min_candidates names, so a narrow diet does not end up
+        planning the same few recipes every day.
+
+        Args:
+            meal_type: Meal type partition to search
+            meal_target_calories: Calorie target of the meal
+            suitable_mask: Boolean mask over recipes_df from get_suitable_mask
+            portion_range: (min, max) servings a recipe may be scaled to
+            min_candidates: Distinct recipe names the window must hold, see get_min_candidates
+
+        Returns:
+            Sorted array of recipe IDs (empty if the meal type has fewer than min_candidates suitable names)
+        '''
+        current_window = window
+        while current_window <= max_window + 1e-9:
+            positions = self.calorie_index.window(
+                meal_type,
+                meal_target_calories * (1 - current_window),
+                meal_target_calories * (1 + current_window)
+            )
+            positions = positions[suitable_mask[positions]]
+            if self.count_names(positions) >= min_candidates:
+                if current_window > window:
+                    stats.count('window_widened', meal_type=meal_type, window=round(current_window, 2))
+                # Catalog order keeps tie-breaking between equal scores stable
+                return np.sort(positions)
+
+            if portion_range is not None:
+                # Too thin, so add every recipe some scale within the range brings inside the window
+                min_scale, max_scale = portion_range
+                scaled = self.calorie_index.window(
+                    meal_type,
+                    meal_target_calories * (1 - current_window) / max_scale,
+                    meal_target_calories * (1 + current_window) / min_scale
+                )
+                positions = np.union1d(positions, scaled[suitable_mask[scaled]])
+                if self.count_names(positions) >= min_candidates:
+                    stats.count('window_scaled', meal_type=meal_type, window=round(current_window, 2))
+                    return positions
+            current_window += window_step
+
+        # Closest recipes up to and including the one that brings in the last name needed
+        positions = self.calorie_index.nearest(meal_type, meal_target_calories)
+        positions = positions[suitable_mask[positions]]
+        _, first = np.unique(self.name_codes[positions], return_index=True)
+        if len(first) < min_candidates:
+            return np.empty(0, dtype=np.int64)
+        positions = positions[:np.sort(first)[min_candidates - 1] + 1]
+        widest = np.abs(self.nutrients['calories'][positions[-1]] - meal_target_calories) / meal_target_calories
+        stats.count('window_widened', meal_type=meal_type, window=round(float(widest), 2))
+        return np.sort(positions)
+
+    def find_fill_ids(self, meal_type: str, meal_target_calories: float, suitable_mask: np.ndarray,
+                      n_names: int = ALTERNATE_FILL_NAMES):
+        '''
+        IDs of the suitable recipes of a meal type closest to a calorie target, one per name
+
+        Only the closest recipes are partitioned out and sorted, not the
+        whole meal type.
+
+        Returns:
+            Array of up to n_names recipe IDs, closest first
+        '''
+        if meal_type not in self.calorie_index.positions:
+            return np.empty(0, dtype=np.int64)
+        suitable = suitable_mask[self.calorie_index.positions[meal_type]]
+        positions = self.calorie_index.positions[meal_type][suitable]
+        distances = np.abs(self.calorie_index.calories[meal_type][suitable] - meal_target_calories)
+        # Spare recipes make up for recipes sharing a name
+        n_closest = min(len(positions), 2 * n_names)
+        while True:
+            closest = np.arange(len(positions))
+            if n_closest < len(positions):
+                closest = np.argpartition(distances, n_closest - 1)[:n_closest]
+            closest = closest[np.argsort(distances[closest], kind='stable')]
+            _, first = np.unique(self.name_codes[positions[closest]], return_index=True)
+            if len(first) >= n_names or n_closest == len(positions):
+                break
+            n_closest = len(positions)
+        return positions[closest[np.sort(first)[:n_names]]]
+
+    def count_names(self, recipe_ids: np.ndarray):
+        '''
+        Number of distinct recipe names among recipe IDs
+        '''
+        if len(recipe_ids) <= 1:
+            return len(recipe_ids)
+        return len(np.unique(self.name_codes[recipe_ids]))
+
+    def get_min_candidates(self, days: int, max_recipe_repeats: int):
+        '''
+        Distinct recipes each meal slot needs so a plan of days can stay within max_recipe_repeats
+
+        Never fewer than MIN_SLOT_CANDIDATES, so every selection has a real choice.
+        '''
+        return max(-(-days // max(max_recipe_repeats, 1)), MIN_SLOT_CANDIDATES)
+
+    def get_portion_scales(self, calories: np.ndarray, meal_target_calories: float):
+        '''
+        Servings of each recipe that bring it closest to a meal's calorie target within portion_range
+
+        Scales are rounded to hundredths, so a planned meal's nutrients are its
+        per-serving nutrients times the servings shown.
+        '''
+        min_scale, max_scale = self.portion_range
+        with np.errstate(divide='ignore'):
+            scales = meal_target_calories / np.asarray(calories, dtype=np.float64)
+        return np.clip(np.round(scales, 2), min_scale, max_scale)
+
+    def find_recipes_in_calorie_window(self, meal_type: str, meal_target_calories: float, suitable_mask: np.ndarray,
+                                       window: float = 0.05, max_window: float = 0.25, window_step: float = 0.05):
+        '''
+        DataFrame version of find_candidate_ids
+        '''
+        return self.recipes_df.iloc[self.find_candidate_ids(
+            meal_type, meal_target_calories, suitable_mask, window=window, max_window=max_window, window_step=window_step
+        )]
+
+    def calculate_user_targets(self, user_profile: Dict):
         """
-        Generate optimized meal plan with improved algorithm
+        Daily nutritional targets of a user
+
+        Returns:
+            Dictionary with bmr, tdee, target_calories, target_macros, goal, activity_level and meal_distribution
         """
-        if recent_recipes is None:
-            recent_recipes = []
-        
         # Calculate nutritional needs
         bmr = self.nutrition_calc.calculate_bmr(
             user_profile['weight'], user_profile['height'], 
@@ -279,142 +1067,550 @@ class ContentBasedRecommender:
         )
         
         tdee = self.nutrition_calc.calculate_tdee(bmr, user_profile['activity_level'])
-        target_calories = self.nutrition_calc.calculate_target_calories(tdee, user_profile['weight_goal'])
+        if user_profile.get('target_calories') is not None:
+            # Set by the feedback loop when it adjusts the calories
+            target_calories = float(user_profile['target_calories'])
+        else:
+            target_calories = self.nutrition_calc.calculate_target_calories(tdee, user_profile['weight_goal'])
         target_macros = self.nutrition_calc.calculate_macros(target_calories= target_calories, weight_goal=user_profile['weight_goal'], body_weight=user_profile['weight'], activity_level=user_profile['activity_level'])
         
-        # Filter recipes
-        suitable_recipes = self.filter_by_dietary_preferences(self.recipes_df, user_profile)
-        
-        meal_plan = {}
-        used_recipes = recent_recipes.copy()
-        # Track how many times each recipe is used
-        recipe_usage_count = {}
         goal = user_profile.get('weight_goal', 'maintain')
         activity_level = user_profile.get('activity_level', 'lightly_active')
-        
-        meal_types = ['breakfast', 'lunch', 'dinner', 'snack']
-        # Pre calulating available recipes per meal type
-        meal_type_recipes = {}
-        for meal_type in meal_types:
-            meal_type_recipes[meal_type] = suitable_recipes[suitable_recipes['meal_type'].str.lower() == meal_type.lower()].copy()
-            print(f"Available {meal_type} recipes: {len(meal_type_recipes[meal_type])}")
-        for day in range(1, days + 1):
-            daily_meals = {}
-            daily_totals = {'calories': 0, 'protein': 0, 'carbs': 0, 'fat': 0}
-            
-            print(f"\n---Planning Day {day} ---")
-            for meal_type in meal_types:
-                # Get meal-specific recipes
-                meal_recipes = suitable_recipes[
-                    suitable_recipes['meal_type'].str.lower() == meal_type.lower()
-                ].copy()
-
-                # Calculating target calories for this meal
-                meal_distribution = self.get_meal_distribution(goal, activity_level)
-                meal_target_calories = round(target_calories * meal_distribution[meal_type],2)
-
-                meal_recipes = self.filter_recipes_by_calorie_window(
-                    meal_recipes,
-                    meal_target_calories=meal_target_calories,
-                    window=0.05
+        return {
+            'bmr': bmr,
+            'tdee': tdee,
+            'target_calories': target_calories,
+            'target_macros': target_macros,
+            'goal': goal,
+            'activity_level': activity_level,
+            'meal_distribution': self.get_meal_distribution(goal, activity_level)
+        }
+
+    def get_filter_key(self, user_profile: Dict):
+        """
+        Hashable key of the profile fields that decide the suitable recipe set
+        """
+        allergies = user_profile.get('allergies', [])
+        if isinstance(allergies, str):
+            allergies = [allergies]
+        return (user_profile.get('dietary_pref', 'non-veg').lower(), tuple(sorted(set(allergies))))
+
+    def prepare_meal_plan(self, user_profile: Dict, stats: PlannerStats = NULL_STATS,
+                          min_candidates: int = MIN_SLOT_CANDIDATES, pool_window: float = None, pool_size: int = 1):
+        """
+        Planning phase 1: everything that only depends on the profile
+
+        Computes the nutritional targets, filters the suitable recipes and
+        scores the candidates of every meal type once. The result is reused
+        for every day of the plan.
+
+        Contexts are cached per normalized profile and catalog version, so
+        repeated profiles skip straight to the per-day selection.
+
+        Args:
+            min_candidates: Distinct recipes each meal slot needs, see get_min_candidates
+            pool_window, pool_size: Candidate pools of the optimized planner, see prepare_meal_candidates
+
+        Returns:
+            Plan context dictionary with targets and scored candidates per meal type
+        """
+        cache_key = (self.catalog_version, self.nearest_k, self.portion_range, min_candidates,
+                     pool_window, pool_size) + self.get_profile_key(user_profile)
+        cached_context = self.candidate_cache.get(cache_key)
+        if cached_context is not None:
+            stats.count('cache_hits')
+            return dict(cached_context)
+        stats.count('cache_misses')
+
+        plan_context = self.calculate_user_targets(user_profile)
+        plan_context['meal_candidates'] = self.prepare_meal_candidates(
+            self.get_suitable_mask(user_profile, stats=stats), plan_context['target_calories'],
+            plan_context['goal'], plan_context['activity_level'], stats=stats,
+            dietary_pref=user_profile.get('dietary_pref', 'non-veg'), min_candidates=min_candidates,
+            pool_window=pool_window, pool_size=pool_size, filter_key=self.get_filter_key(user_profile)
+        )
+        self.candidate_cache.put(cache_key, plan_context)
+        return dict(plan_context)
+
+    def get_profile_key(self, user_profile: Dict):
+        """
+        Hashable key of every profile field that affects the prepared plan context
+        """
+        return (
+            float(user_profile['age']),
+            float(user_profile['height']),
+            float(user_profile['weight']),
+            str(user_profile['gender']).lower(),
+            user_profile['activity_level'],
+            user_profile['weight_goal'],
+            None if user_profile.get('target_calories') is None else float(user_profile['target_calories']),
+        ) + self.get_filter_key(user_profile)
+
+    def prepare_meal_candidates(self, suitable_mask: np.ndarray, target_calories: float, goal: str, activity_level: str,
+                                stats: PlannerStats = NULL_STATS, dietary_pref: str = None,
+                                min_candidates: int = MIN_SLOT_CANDIDATES, pool_window: float = None,
+                                pool_size: int = 1, filter_key: Tuple = None):
+        """
+        Calorie-window candidates of every meal type with their base scores
+
+        With nearest_k set, the candidates are instead the nearest_k suitable
+        recipes closest to each meal's nutrient targets. With portion_range
+        set, candidates are scaled onto the meal's calorie target and scored
+        on their scaled nutrients, and a thin window also takes every
+        recipe that can be scaled into it, so a slot rarely falls back to its
+        whole meal type. A slot whose widest window still holds fewer than
+        min_candidates recipe names falls back to its whole meal type, so the
+        repeat limit can be kept.
+
+        Args:
+            suitable_mask: Boolean mask over recipes_df from get_suitable_mask
+            target_calories: Daily target calories
+            dietary_pref: Limits the nearest-neighbour search to the diet's categories
+            min_candidates: Distinct recipes each meal slot needs, see get_min_candidates
+            pool_window: When set, each meal type also gets a 'pool' of every suitable recipe
+                within ±pool_window of its calorie target, scored the same way, for the
+                optimized planner (see MealPlanOptimizer)
+            pool_size: Distinct recipe names a pool must hold, thinner pools keep widening
+                like the candidate windows (see find_candidate_ids)
+            filter_key: get_filter_key of the profile suitable_mask was made for, lets the
+                nearest-neighbour search remember which of its partitions the mask touches
+
+        Returns:
+            Dictionary of meal type to {'ids': recipe IDs, 'scores': base scores, 'fill': the
+            meal type's closest recipes scored the same way (see fill_alternates)}, plus 'scales'
+            (servings of each candidate) with portion_range set and 'pool' with pool_window set
+        """
+        meal_distribution = self.get_meal_distribution(goal, activity_level)
+
+        meal_candidates = {}
+        for meal_type in self.MEAL_TYPES:
+            # Calculating target calories for this meal
+            meal_target_calories = round(target_calories * meal_distribution[meal_type],2)
+
+            with stats.timer('window'):
+                if self.nearest_k:
+                    targets = self.get_meal_targets(target_calories, activity_level, meal_type, goal)
+                    candidate_ids = self.get_nutrient_index().nearest(
+                        meal_type,
+                        [targets['calories'], targets['protein'], targets['carbs'], targets['fat'], targets['fiber']],
+                        self.nearest_k,
+                        suitable_mask,
+                        categories=DIET_CATEGORIES.get((dietary_pref or '').lower()),
+                        suitable_key=filter_key
+                    )
+                else:
+                    # Binary search on the sorted calorie index, widening the window step by step
+                    candidate_ids = self.find_candidate_ids(
+                        meal_type,
+                        meal_target_calories=meal_target_calories,
+                        suitable_mask=suitable_mask,
+                        window=0.05,
+                        stats=stats,
+                        portion_range=self.portion_range,
+                        min_candidates=min_candidates
+                    )
+
+                if len(candidate_ids) == 0:
+                    stats.count('window_fallbacks', meal_type=meal_type)
+                    candidate_ids = np.flatnonzero(suitable_mask & self.dietary_index.meal_type_mask(meal_type))
+
+            # Calculate advanced nutritional scores
+            with stats.timer('score'):
+                meal_candidates[meal_type] = self.score_candidates(
+                    candidate_ids, meal_type, meal_target_calories, target_calories, goal, activity_level
+                )
+
+            # Closest recipes of the whole meal type, for slots left with too few alternates
+            with stats.timer('window'):
+                fill_ids = self.find_fill_ids(meal_type, meal_target_calories, suitable_mask)
+            with stats.timer('score'):
+                meal_candidates[meal_type]['fill'] = self.score_candidates(
+                    fill_ids, meal_type, meal_target_calories, target_calories, goal, activity_level
                 )
 
-                if meal_recipes.empty:
-                    print(f"No recipes found within ±2% window for {meal_type}, using full set.")
-                    meal_recipes = suitable_recipes[suitable_recipes['meal_type'].str.lower() == meal_type.lower()].copy()
-                
-                if len(meal_recipes) > 0:
-                    # Calculate advanced nutritional scores
-                    meal_recipes['score'] = meal_recipes.apply(
-                        lambda x: self.calculate_nutritional_score(
-                            x, target_calories, meal_type= meal_type, goal= goal, activity_level= activity_level
-                        ), axis=1
+            if pool_window is not None:
+                # Wider pool for the optimized planner, always holding the slot's own candidates
+                with stats.timer('window'):
+                    pool_ids = self.find_candidate_ids(
+                        meal_type, meal_target_calories, suitable_mask, window=pool_window, max_window=pool_window,
+                        min_candidates=pool_size
+                    )
+                    pool_ids = np.union1d(pool_ids, candidate_ids)
+                with stats.timer('score'):
+                    meal_candidates[meal_type]['pool'] = self.score_candidates(
+                        pool_ids, meal_type, meal_target_calories, target_calories, goal, activity_level
                     )
 
-                    # Penalizing very low-protein breakfast
-                    if meal_type =='breakfast':
-                        meal_recipes.loc[meal_recipes['protein'] < 10, 'score'] *= 0.9
-                    
-                    # Apply variety penalty
-                    meal_recipes = self.add_variety_penalty(meal_recipes, used_recipes)
-                    
-                    # Select recipe
-                    selected_recipe = self.select_diverse_recipes(meal_recipes, n_options=min(5, len(meal_recipes)), used_recipes_count=recipe_usage_count)
-
-                    
-                    if selected_recipe is not None:
-                        recipe_name:str = selected_recipe['name']
-
-                        #Checking if recipe exceeds max repeats
-                        current_usage = recipe_usage_count.get(recipe_name, 0)
-
-                        # if recipe is overused, try to fine the alternative
-                        attempts = 0
-                        while current_usage >= max_recipe_repeats and attempts <4:
-                            print(f"Recipe '{recipe_name}' used {current_usage} times, finding alternative...")
-
-                            # Removing overused recipe and try again
-                            # Safe recipe replacement logic
-                            recipe_name = str(recipe_name)
-                            meal_recipes['name'] = meal_recipes['name'].astype(str)
-                            meal_recipes_filtered = meal_recipes[meal_recipes['name'] != recipe_name].copy()
-                            if meal_recipes_filtered.empty:
-                                print(f"No alternative found for recipe '{recipe_name}', keeping it.")
-                                meal_recipes_filtered = meal_recipes.copy()
-                            if len(meal_recipes_filtered) > 0:
-                                selected_recipe = self.select_diverse_recipes(meal_recipes_filtered, n_options=min(5, len(meal_recipes_filtered)), used_recipes_count=recipe_usage_count)
-                                recipe_name = selected_recipe['name']
-                                current_usage = recipe_usage_count.get(recipe_name, 0)
-
-                            else:
-                                break
-                            attempts +=1
-                        daily_meals[meal_type] = {
-                            'name': selected_recipe['name'],
-                            'calories': float(selected_recipe['calories']),
-                            'protein': float(selected_recipe['protein']),
-                            'carbs': float(selected_recipe['carbs']),
-                            'fats': float(selected_recipe['fats']),
-                            'ingredients': selected_recipe.get('ingredients', ''),
-                            'instructions': selected_recipe.get('instructions', ''),
-                            'score': float(selected_recipe['score'])
-                        }
-                        
-                        # Track usage
-                        used_recipes.insert(0, recipe_name)  # Most recent first
-                        used_recipes = used_recipes[:15]  # Keep only recent 15
-                        recipe_usage_count[recipe_name] = recipe_usage_count.get(recipe_name, 0) + 1
-
-                        print(f"{meal_type.title()}: {recipe_name} (used {recipe_usage_count[recipe_name]} times)")
-                        
-                        # Update daily totals
-                        daily_totals['calories'] += float(selected_recipe['calories'])
-                        daily_totals['protein'] += float(selected_recipe['protein'])
-                        daily_totals['carbs'] += float(selected_recipe['carbs'])
-                        daily_totals['fat'] += float(selected_recipe['fats'])
-            
-            # Add daily summary
-            daily_meals['daily_summary'] = {
-                'total_calories': round(daily_totals['calories'], 1),
-                'total_protein': round(daily_totals['protein'], 1),
-                'total_carbs': round(daily_totals['carbs'], 1),
-                'total_fat': round(daily_totals['fat'], 1),
-                'target_calories': round(target_calories, 2),
-                'calorie_variance': round(((daily_totals['calories'] - target_calories) / target_calories) * 100, 1),
-                'protein_target': round(target_macros['protein'], 1),
-                'carbs_target': round(target_macros['carbs'], 1),
-                'fat_target': round(target_macros['fat'], 1)
-            }
-            
-            meal_plan[f'day_{day}'] = daily_meals
-        # Nutrition summary
+        return meal_candidates
+
+    def score_candidates(self, candidate_ids: np.ndarray, meal_type: str, meal_target_calories: float,
+                         target_calories: float, goal: str, activity_level: str):
+        """
+        Base scores of a meal slot's candidates
+
+        Returns:
+            Dictionary with 'ids' and 'scores', plus 'scales' (servings of each candidate) with portion_range set
+        """
+        candidate_nutrients = {column: values[candidate_ids] for column, values in self.nutrients.items()}
+        scales = None
+        if self.portion_range is not None:
+            scales = self.get_portion_scales(candidate_nutrients['calories'], meal_target_calories)
+            candidate_nutrients = {column: values * scales for column, values in candidate_nutrients.items()}
+        scores = self.calculate_nutritional_scores(
+            candidate_nutrients, target_calories, meal_type= meal_type, goal= goal, activity_level= activity_level
+        )
+
+        # Penalizing very low-protein breakfast
+        if meal_type =='breakfast':
+            scores[candidate_nutrients['protein'] < 10] *= 0.9
+        candidates = {'ids': candidate_ids, 'scores': scores}
+        if scales is not None:
+            candidates['scales'] = scales
+        return candidates
+
+    def new_usage_state(self, recent_recipes: List[str] = None, rng: np.random.Generator = None,
+                        stats: PlannerStats = NULL_STATS, ingredient_diversity: float = 0.0):
+        """
+        Per-plan selection state: recent name codes and recipe IDs, a usage count per
+        name code, the ingredient vectors of each slot's candidates, the random
+        generator used for selection and the stats collector
+
+        Args:
+            recent_recipes: Recently used recipe names, most recent first
+            rng: Random generator for the plan, None uses the global NumPy state
+            stats: Optional PlannerStats collecting timings and counters
+            ingredient_diversity: Weight (0-1) of the penalty for sharing ingredients with recent meals
+        """
+        return {
+            'recent_codes': self.get_name_codes(recent_recipes or []),
+            'recent_ids': [],
+            'ingredient_diversity': ingredient_diversity,
+            'candidate_vectors': {},
+            'usage_counts': np.zeros(len(self.name_hashes), dtype=np.int64),
+            'rng': rng,
+            'stats': stats
+        }
+
+    def get_name_codes(self, recipe_names: List[str]):
+        """
+        Name codes of recipe names, -1 for names not in the catalog
+        """
+        if len(recipe_names) == 0 or len(self.name_hashes) == 0:
+            return [-1] * len(recipe_names)
+        hashes = hash_names(recipe_names)
+        positions = np.minimum(np.searchsorted(self.name_hashes, hashes), len(self.name_hashes) - 1)
+        return np.where(self.name_hashes[positions] == hashes, positions, -1).tolist()
+
+    def get_slot_candidates(self, plan_context: Dict, meal_type: str, pool: bool = False):
+        """
+        Prepared candidates of a meal slot, its wider pool when asked for and prepared
+        """
+        candidates = plan_context['meal_candidates'][meal_type]
+        return candidates.get('pool', candidates) if pool else candidates
+
+    def get_slot_scores(self, plan_context: Dict, meal_type: str, usage_state: Dict, pool: bool = False):
+        """
+        Candidates of a meal slot with the variety and repeat penalties applied
+
+        Args:
+            pool: Score the slot's wider pool instead of its candidates, see get_slot_candidates
+
+        Returns:
+            Tuple of (recipe IDs, name codes, penalized scores)
+        """
+        candidates = self.get_slot_candidates(plan_context, meal_type, pool=pool)
+        candidate_codes = self.name_codes[candidates['ids']]
+
+        # Apply variety and repeat penalties
+        with usage_state['stats'].timer('penalty'):
+            scores = candidates['scores'] * self.get_variety_penalties(usage_state['recent_codes'], candidate_codes=candidate_codes)
+            scores *= self.get_usage_penalties(usage_state['usage_counts'][candidate_codes])
+
+            # Recipes sharing most ingredients with recent meals lose up to ingredient_diversity of their score
+            if usage_state['ingredient_diversity'] > 0 and usage_state['recent_ids']:
+                ingredient_index = self.get_ingredient_index()
+                vectors = usage_state['candidate_vectors']
+                if (meal_type, pool) not in vectors:
+                    vectors[meal_type, pool] = ingredient_index.candidate_vectors(candidates['ids'])
+                similarity = ingredient_index.max_similarity(vectors[meal_type, pool], usage_state['recent_ids'])
+                scores *= 1 - usage_state['ingredient_diversity'] * similarity
+        return candidates['ids'], candidate_codes, scores
+
+    def describe_meal(self, recipe_id: int, score: float, scale: float = None):
+        """
+        Meal dictionary of a recipe as it appears in the plan
+
+        Args:
+            scale: Servings of the recipe, its nutrients are scaled and 'servings' added when given
+        """
+        # Numbers come from the nutrient arrays, text is only fetched for the chosen recipes
+        meal = {
+            'name': self.recipe_text.get(recipe_id, 'name'),
+            'calories': float(self.nutrients['calories'][recipe_id]),
+            'protein': float(self.nutrients['protein'][recipe_id]),
+            'carbs': float(self.nutrients['carbs'][recipe_id]),
+            'fats': float(self.nutrients['fats'][recipe_id]),
+            'ingredients': self.recipe_text.get(recipe_id, 'ingredients'),
+            'instructions': self.recipe_text.get(recipe_id, 'instructions'),
+            'score': float(score)
+        }
+        if scale is not None:
+            for column in ['calories', 'protein', 'carbs', 'fats']:
+                meal[column] = round(meal[column] * float(scale), 2)
+            meal['servings'] = float(scale)
+        return meal
+
+    def select_alternates(self, candidate_ids: np.ndarray, candidate_codes: np.ndarray, scores: np.ndarray, k: int,
+                          candidate_mask: np.ndarray = None, candidate_scales: np.ndarray = None):
+        """
+        The k best candidates of a slot, one per recipe name, best first
+
+        Works on the penalized scores the slot was just selected from, so a
+        swap needs no re-planning. Only the best candidates are partitioned
+        out and sorted, not the whole slot.
+
+        Args:
+            candidate_ids, candidate_codes, scores: The slot's candidates, as from get_slot_scores
+            k: Number of alternates
+            candidate_mask: Optional boolean mask of candidates allowed as alternates
+            candidate_scales: Servings of the candidates with portion scaling, see describe_meal
+
+        Returns:
+            List of up to k meal dictionaries (see describe_meal)
+        """
+        valid = ~np.isnan(scores)
+        if candidate_mask is not None:
+            valid &= candidate_mask
+        positions = np.flatnonzero(valid)
+        # Spare candidates make up for recipes sharing a name
+        n_best = min(len(positions), 2 * k)
+        while True:
+            best = positions
+            if n_best < len(positions):
+                best = np.sort(positions[np.argpartition(-scores[positions], n_best - 1)[:n_best]])
+            # Stable, so equal scores keep catalog order
+            best = best[np.argsort(-scores[best], kind='stable')]
+            _, first = np.unique(candidate_codes[best], return_index=True)
+            best = best[np.sort(first)][:k]
+            if len(best) == k or n_best == len(positions):
+                break
+            n_best = len(positions)
+        return [
+            self.describe_meal(candidate_ids[position], scores[position],
+                               None if candidate_scales is None else candidate_scales[position])
+            for position in best
+        ]
+
+    def fill_alternates(self, plan_context: Dict, meal_type: str, meal_alternates: List[Dict], k: int,
+                        excluded_codes: np.ndarray, usage_state: Dict, max_recipe_repeats: int = 3):
+        """
+        Top up a slot's alternates from its meal type's fill candidates when its own ran short
+
+        A thin calorie window can leave a slot without any other recipe, so the
+        closest suitable recipes of the meal type, scored once with the plan
+        context (see find_fill_ids), fill the missing places with the slot's
+        penalties applied. Recipes over the repeat limit are only offered when
+        no other recipe is left.
+
+        Args:
+            meal_alternates: Alternates from select_alternates, extended in place
+            excluded_codes: Name codes never offered, e.g. the selected and rejected recipes
+            usage_state: Usage state the slot was scored with
+
+        Returns:
+            meal_alternates
+        """
+        fill = plan_context['meal_candidates'][meal_type].get('fill')
+        if len(meal_alternates) >= k or fill is None or len(fill['ids']) == 0:
+            return meal_alternates
+        fill_codes = self.name_codes[fill['ids']]
+        taken = np.concatenate([
+            np.asarray(excluded_codes, dtype=np.int64),
+            np.asarray(self.get_name_codes([alternate['name'] for alternate in meal_alternates]), dtype=np.int64)
+        ])
+        allowed = ~np.isin(fill_codes, taken)
+        usage_counts = usage_state['usage_counts'][fill_codes]
+        within_limit = allowed & (usage_counts < max_recipe_repeats)
+
+        scores = fill['scores'] * self.get_variety_penalties(usage_state['recent_codes'], candidate_codes=fill_codes)
+        scores *= self.get_usage_penalties(usage_counts)
+        meal_alternates.extend(self.select_alternates(
+            fill['ids'], fill_codes, scores, k - len(meal_alternates),
+            candidate_mask=within_limit if within_limit.any() else allowed, candidate_scales=fill.get('scales')
+        ))
+        return meal_alternates
+
+    def record_meal(self, daily_meals: Dict, daily_totals: Dict, meal_type: str, recipe_id: int, score: float,
+                    usage_state: Dict, scale: float = None):
+        """
+        Add a selected recipe to the day and update totals and usage tracking
+
+        Args:
+            scale: Servings of the recipe with portion scaling, see describe_meal
+        """
+        meal = self.describe_meal(recipe_id, score, scale)
+        daily_meals[meal_type] = meal
+        calories, protein, carbs, fats = meal['calories'], meal['protein'], meal['carbs'], meal['fats']
+        
+        # Track usage
+        selected_code = self.name_codes[recipe_id]
+        recent_codes = usage_state['recent_codes']
+        recent_codes.insert(0, selected_code)  # Most recent first
+        del recent_codes[RECENT_MEALS:]  # Keep only the recent ones
+        usage_state['recent_ids'].insert(0, int(recipe_id))
+        del usage_state['recent_ids'][RECENT_MEALS:]
+        usage_state['usage_counts'][selected_code] += 1
+        usage_state['stats'].count('meals_selected')
+        
+        # Update daily totals
+        daily_totals['calories'] += calories
+        daily_totals['protein'] += protein
+        daily_totals['carbs'] += carbs
+        daily_totals['fat'] += fats
+
+    def summarize_day(self, daily_totals: Dict, plan_context: Dict):
+        """
+        Daily summary comparing the day's totals with the targets
+        """
+        target_calories = plan_context['target_calories']
+        target_macros = plan_context['target_macros']
+        return {
+            'total_calories': round(daily_totals['calories'], 1),
+            'total_protein': round(daily_totals['protein'], 1),
+            'total_carbs': round(daily_totals['carbs'], 1),
+            'total_fat': round(daily_totals['fat'], 1),
+            'target_calories': round(target_calories, 2),
+            'calorie_variance': round(((daily_totals['calories'] - target_calories) / target_calories) * 100, 1),
+            'protein_target': round(target_macros['protein'], 1),
+            'carbs_target': round(target_macros['carbs'], 1),
+            'fat_target': round(target_macros['fat'], 1)
+        }
+
+    def select_daily_meals(self, plan_context: Dict, usage_state: Dict, max_recipe_repeats: int = 3,
+                           alternates: int = 0):
+        """
+        Planning phase 2: pick one day's meals from the prepared candidates
+
+        Only the variety penalty and the repeat limits change between days,
+        so this is all that runs per day. Both are NumPy arrays indexed by
+        name code, so each slot is a couple of vectorized multiplies.
+
+        Args:
+            plan_context: Result of prepare_meal_plan
+            usage_state: Result of new_usage_state (updated in place)
+            max_recipe_repeats: Maximum times a recipe may be used in the plan
+            alternates: Ranked alternates added to each meal (see select_alternates), taken
+                from the same candidates and within the same repeat limit, topped up from
+                the whole meal type when the candidates run short (see fill_alternates)
+
+        Returns:
+            Dictionary of the day's meals with a daily_summary
+        """
+        usage_counts = usage_state['usage_counts']
+        stats = usage_state['stats']
+
+        daily_meals = {}
+        daily_totals = {'calories': 0, 'protein': 0, 'carbs': 0, 'fat': 0}
+        for meal_type in self.MEAL_TYPES:
+            candidate_ids, candidate_codes, scores = self.get_slot_scores(plan_context, meal_type, usage_state)
+            if len(candidate_ids) == 0:
+                continue
+            scales = plan_context['meal_candidates'][meal_type].get('scales')
+
+            # Select recipe
+            with stats.timer('select'):
+                selected = self.select_diverse_index(scores, n_options=5, rng=usage_state['rng'])
+            if selected is None:
+                continue
+            selected_code = candidate_codes[selected]
+
+            # if recipe is overused, try to find an alternative
+            with stats.timer('retry'):
+                attempts = 0
+                while usage_counts[selected_code] >= max_recipe_repeats and attempts <4:
+                    stats.count('max_repeat_retries', meal_type=meal_type, recipe_id=int(candidate_ids[selected]))
+
+                    # Removing overused recipes and try again
+                    alternatives = usage_counts[candidate_codes] < max_recipe_repeats
+                    retry = None
+                    if alternatives.any():
+                        retry = self.select_diverse_index(scores, n_options=5, candidate_mask=alternatives, rng=usage_state['rng'])
+                    if retry is None:
+                        # Nothing else can be picked, the overused recipe is kept
+                        stats.count('max_repeat_no_alternative', meal_type=meal_type)
+                        break
+                    selected = retry
+                    selected_code = candidate_codes[selected]
+                    attempts +=1
+
+            if alternates:
+                with stats.timer('alternates'):
+                    meal_alternates = self.select_alternates(
+                        candidate_ids, candidate_codes, scores, alternates,
+                        candidate_mask=(candidate_codes != selected_code) & (usage_counts[candidate_codes] < max_recipe_repeats),
+                        candidate_scales=scales
+                    )
+                    self.fill_alternates(plan_context, meal_type, meal_alternates, alternates, [selected_code],
+                                         usage_state, max_recipe_repeats=max_recipe_repeats)
+            self.record_meal(daily_meals, daily_totals, meal_type, candidate_ids[selected], scores[selected], usage_state,
+                             scale=None if scales is None else scales[selected])
+            if alternates:
+                daily_meals[meal_type]['alternates'] = meal_alternates
+        
+        # Add daily summary
+        daily_meals['daily_summary'] = self.summarize_day(daily_totals, plan_context)
+        return daily_meals
+
+    def build_meal_plan(self, plan_context: Dict, days: int = 7,
+                        recent_recipes: List[str] = None, max_recipe_repeats: int = 3,
+                        rng: np.random.Generator = None, planner: str = 'greedy', time_budget: float = 0.05,
+                        stats: PlannerStats = NULL_STATS, ingredient_diversity: float = 0.0, alternates: int = 0):
+        """
+        Run the per-day selection phase over a prepared plan context
+
+        Args:
+            planner: 'greedy' picks each slot on its own, 'optimized' picks the
+                day's meals together to hit the daily calorie and macro targets
+            time_budget: Seconds per day for the optimized planner's search
+            stats: Optional PlannerStats collecting timings and counters
+            ingredient_diversity: Weight (0-1) of the penalty for recipes sharing ingredients
+                with the recent meals, 0 turns it off
+            alternates: Number of ranked alternates each meal carries under 'alternates',
+                so a meal can be swapped without planning again. 0 adds none
+
+        Returns:
+            Tuple of (meal_plan, nutrition_summary)
+        """
+        if planner not in ('greedy', 'optimized'):
+            raise ValueError(f"Unknown planner '{planner}', expected 'greedy' or 'optimized'")
+
+        meal_plan = {}
+        # Track recent recipes and how many times each recipe is used
+        usage_state = self.new_usage_state(recent_recipes, rng=rng, stats=stats, ingredient_diversity=ingredient_diversity)
+        for day in range(1, days + 1):
+            if planner == 'optimized':
+                meal_plan[f'day_{day}'] = self.optimizer.optimize_daily_meals(
+                    plan_context, usage_state, max_recipe_repeats=max_recipe_repeats, time_budget=time_budget,
+                    alternates=alternates
+                )
+            else:
+                meal_plan[f'day_{day}'] = self.select_daily_meals(
+                    plan_context, usage_state, max_recipe_repeats=max_recipe_repeats, alternates=alternates
+                )
+        return meal_plan, self.summarize_plan(plan_context, meal_plan)
+
+    def summarize_plan(self, plan_context: Dict, meal_plan: Dict):
+        """
+        Nutrition summary of a whole plan
+        """
+        days = len(meal_plan)
         nutrition_summary = {
             'user_profile': {
-                'bmr': round(bmr, 1),
-                'tdee': round(tdee, 1),
-                'target_calories': round(target_calories, 1),
-                'target_macros': target_macros,
-                'meal_distribution': self.get_meal_distribution(goal, activity_level)
+                'bmr': round(plan_context['bmr'], 1),
+                'tdee': round(plan_context['tdee'], 1),
+                'target_calories': round(plan_context['target_calories'], 1),
+                'target_macros': dict(plan_context['target_macros']),
+                'meal_distribution': self.get_meal_distribution(plan_context['goal'], plan_context['activity_level'])
             },
             'plan_duration': days,
             'avg_calorie_variance': round(np.mean([
@@ -422,5 +1618,363 @@ class ContentBasedRecommender:
                 for i in range(1, days + 1)
             ]), 1)
         }
-        
-        return meal_plan, nutrition_summary
\ No newline at end of file
+        return nutrition_summary
+
+    def generate_meal_plan(self, user_profile: Dict, days: int = 7, 
+                          recent_recipes: List[str] = None, max_recipe_repeats: int = 3,
+                          rng: np.random.Generator = None, planner: str = 'greedy', time_budget: float = 0.05,
+                          stats: PlannerStats = NULL_STATS, ingredient_diversity: float = 0.0, alternates: int = 0):
+        """
+        Generate optimized meal plan with improved algorithm
+
+        Candidates are filtered and scored once per profile (prepare_meal_plan),
+        then each day only applies the variety penalties (select_daily_meals).
+        Pass rng (e.g. from get_user_rng) to make the random draws reproducible,
+        planner='optimized' to choose each day's meals jointly, ingredient_diversity to
+        avoid meals with the same ingredients (see build_meal_plan), alternates to give
+        each meal ranked swap options and a PlannerStats to collect per-phase timings
+        and counters.
+        """
+        plan_context = self.prepare_meal_plan(
+            user_profile, stats=stats, min_candidates=self.get_min_candidates(days, max_recipe_repeats),
+            **(self.optimizer.get_pool_options() if planner == 'optimized' else {})
+        )
+        return self.build_meal_plan(
+            plan_context, days=days, recent_recipes=recent_recipes, max_recipe_repeats=max_recipe_repeats, rng=rng,
+            planner=planner, time_budget=time_budget, stats=stats, ingredient_diversity=ingredient_diversity,
+            alternates=alternates
+        )
+
+    def get_tolerance_mask(self, plan_context: Dict, meal_type: str, nutrients: Dict, tolerance: float = 0.1,
+                           check_calories: bool = True, macro_adjustments: List[str] = None):
+        """
+        Which meals of a meal type are still within tolerance of the plan's targets
+
+        Args:
+            nutrients: Dictionary of 'calories', 'protein' and 'carbs' arrays of the meals
+            tolerance: Allowed relative deviation from the meal's targets
+            check_calories: Check the calories against the meal's calorie target
+            macro_adjustments: Keys of MACRO_ADJUSTMENTS, an increased macro must not fall
+                below its adjusted target and a reduced one must not exceed it
+
+        Returns:
+            Boolean array, True for the meals within tolerance
+        """
+        targets = self.get_meal_targets(
+            plan_context['target_calories'], plan_context['activity_level'], meal_type, plan_context['goal']
+        )
+        within = np.ones(len(nutrients['calories']), dtype=bool)
+        if check_calories:
+            within &= np.abs(nutrients['calories'] - targets['calories']) <= tolerance * targets['calories']
+        for adjustment in macro_adjustments or []:
+            macro, factor = MACRO_ADJUSTMENTS[adjustment]
+            if factor > 1:
+                within &= nutrients[macro] >= targets[macro] * factor * (1 - tolerance)
+            else:
+                within &= nutrients[macro] <= targets[macro] * factor * (1 + tolerance)
+        return within
+
+    def get_recipe_id(self, name_code: int, candidate_ids: np.ndarray = None):
+        """
+        A recipe ID with the given name code, looked up among candidate_ids first
+        """
+        if candidate_ids is not None:
+            matches = candidate_ids[self.name_codes[candidate_ids] == name_code]
+            if len(matches):
+                return int(matches[0])
+        matches = np.flatnonzero(self.name_codes == name_code)
+        return int(matches[0]) if len(matches) else None
+
+    def update_meal_plan(self, meal_plan: Dict, user_profile: Dict, calorie_delta: float = 0,
+                         rejected_recipes: List[str] = None, macro_adjustments: List[str] = None,
+                         tolerance: float = 0.05, max_recipe_repeats: int = 3, rng: np.random.Generator = None,
+                         stats: PlannerStats = NULL_STATS, ingredient_diversity: float = 0.0, alternates: int = 0):
+        """
+        Re-plan only the meals of an existing plan that a feedback diff affects
+
+        A meal is re-selected when its recipe was rejected, or when it no
+        longer fits what the diff changed: the calories after a calorie delta,
+        the adjusted macro after a macro adjustment. Every other meal is kept.
+        Re-selected slots score the prepared candidates with the variety and
+        repeat penalties of the meals around them, preferring candidates
+        within tolerance. Without a calorie delta the prepared candidates come
+        straight from the plan context cache.
+
+        Args:
+            meal_plan: Previous plan from generate_meal_plan
+            user_profile: Profile the previous plan was made for
+            calorie_delta: Change of the daily target calories
+            rejected_recipes: Recipe names that must not stay in the plan
+            macro_adjustments: Keys of MACRO_ADJUSTMENTS, e.g. ['increase_protein']
+            tolerance: Allowed relative deviation of a kept meal from its targets,
+                the same ±5% as the first calorie window by default
+            alternates: Ranked alternates given to each re-selected meal, see build_meal_plan.
+                Rejected recipes are also dropped from the alternates of kept meals
+
+        Returns:
+            Tuple of (meal_plan, nutrition_summary, replanned) where replanned lists the
+            re-selected (day key, meal type) slots
+        """
+        profile = dict(user_profile)
+        if calorie_delta:
+            profile['target_calories'] = self.calculate_user_targets(user_profile)['target_calories'] + calorie_delta
+        plan_context = self.prepare_meal_plan(
+            profile, stats=stats, min_candidates=self.get_min_candidates(len(meal_plan), max_recipe_repeats)
+        )
+        macro_adjustments = [adjustment for adjustment in macro_adjustments or [] if adjustment in MACRO_ADJUSTMENTS]
+        if macro_adjustments:
+            target_macros = dict(plan_context['target_macros'])
+            for adjustment in macro_adjustments:
+                macro, factor = MACRO_ADJUSTMENTS[adjustment]
+                target_macros[macro] = round(target_macros[macro] * factor, 1)
+            plan_context['target_macros'] = target_macros
+
+        # Slots in plan order, meals are copied so the previous plan is left untouched
+        day_keys = sorted(meal_plan, key=lambda day_key: int(day_key.split('_')[1]))
+        new_plan = {day_key: {} for day_key in day_keys}
+        slots = []
+        rejected_names = set(rejected_recipes or [])
+        for day_key in day_keys:
+            for meal_type in self.MEAL_TYPES:
+                if meal_type in meal_plan[day_key]:
+                    meal = dict(meal_plan[day_key][meal_type])
+                    if rejected_names and 'alternates' in meal:
+                        meal['alternates'] = [
+                            alternate for alternate in meal['alternates'] if alternate['name'] not in rejected_names
+                        ]
+                    new_plan[day_key][meal_type] = meal
+                    slots.append((day_key, meal_type))
+        # One hashing pass for the plan's and the rejected names
+        codes = self.get_name_codes([new_plan[day_key][meal_type]['name'] for day_key, meal_type in slots] + list(rejected_recipes or []))
+        slot_codes = codes[:len(slots)]
+        rejected_codes = np.array(sorted(set(codes[len(slots):]) - {-1}), dtype=np.int64)
+
+        affected = np.isin(slot_codes, rejected_codes)
+        if calorie_delta or macro_adjustments:
+            for meal_type in self.MEAL_TYPES:
+                rows = [i for i, (_, slot_type) in enumerate(slots) if slot_type == meal_type]
+                if not rows:
+                    continue
+                nutrients = {
+                    column: np.array([new_plan[slots[i][0]][meal_type][column] for i in rows], dtype=np.float64)
+                    for column in ['calories', 'protein', 'carbs']
+                }
+                within = self.get_tolerance_mask(
+                    plan_context, meal_type, nutrients, tolerance=tolerance,
+                    check_calories=bool(calorie_delta), macro_adjustments=macro_adjustments
+                )
+                affected[np.array(rows)[~within]] = True
+
+        usage_state = self.new_usage_state(rng=rng, stats=stats, ingredient_diversity=ingredient_diversity)
+        usage_counts = usage_state['usage_counts']
+        for code in np.asarray(slot_codes)[~affected]:
+            if code >= 0:
+                usage_counts[code] += 1
+
+        replanned = []
+        for i in np.flatnonzero(affected):
+            day_key, meal_type = slots[i]
+            # The meals planned before this slot are its recent meals
+            usage_state['recent_codes'] = slot_codes[max(0, i - RECENT_MEALS):i][::-1]
+            if ingredient_diversity > 0:
+                candidates = plan_context['meal_candidates']
+                usage_state['recent_ids'] = [
+                    recipe_id for recipe_id in (
+                        self.get_recipe_id(slot_codes[j], candidates[slots[j][1]]['ids'])
+                        for j in range(i - 1, max(0, i - RECENT_MEALS) - 1, -1) if slot_codes[j] >= 0
+                    ) if recipe_id is not None
+                ]
+            candidate_ids, candidate_codes, scores = self.get_slot_scores(plan_context, meal_type, usage_state)
+            scales = plan_context['meal_candidates'][meal_type].get('scales')
+
+            with stats.timer('select'):
+                not_rejected = ~np.isin(candidate_codes, rejected_codes)
+                allowed = not_rejected & (usage_counts[candidate_codes] < max_recipe_repeats)
+                candidate_nutrients = {
+                    column: self.nutrients[column][candidate_ids] for column in ['calories', 'protein', 'carbs']
+                }
+                if scales is not None:
+                    candidate_nutrients = {column: values * scales for column, values in candidate_nutrients.items()}
+                within = allowed & self.get_tolerance_mask(
+                    plan_context, meal_type, candidate_nutrients, tolerance=tolerance,
+                    check_calories=bool(calorie_delta), macro_adjustments=macro_adjustments
+                )
+                # Loosened step by step, a rejected recipe is only kept when nothing else is left
+                selected = None
+                for candidate_mask in (within, allowed, not_rejected):
+                    if candidate_mask.any():
+                        selected = self.select_diverse_index(
+                            scores, n_options=5, candidate_mask=candidate_mask, rng=usage_state['rng']
+                        )
+                    if selected is not None:
+                        break
+            if selected is None:
+                # Nothing else fits, the previous meal stays
+                stats.count('replan_no_alternative', day=day_key, meal_type=meal_type)
+                if slot_codes[i] >= 0:
+                    usage_counts[slot_codes[i]] += 1
+                continue
+
+            if alternates:
+                with stats.timer('alternates'):
+                    meal_alternates = self.select_alternates(
+                        candidate_ids, candidate_codes, scores, alternates,
+                        candidate_mask=allowed & (candidate_codes != candidate_codes[selected]),
+                        candidate_scales=scales
+                    )
+                    self.fill_alternates(plan_context, meal_type, meal_alternates, alternates,
+                                         np.append(rejected_codes, candidate_codes[selected]), usage_state,
+                                         max_recipe_repeats=max_recipe_repeats)
+            daily_totals = {'calories': 0, 'protein': 0, 'carbs': 0, 'fat': 0}
+            self.record_meal(new_plan[day_key], daily_totals, meal_type, candidate_ids[selected], scores[selected], usage_state,
+                             scale=None if scales is None else scales[selected])
+            if alternates:
+                new_plan[day_key][meal_type]['alternates'] = meal_alternates
+            slot_codes[i] = candidate_codes[selected]
+            replanned.append((day_key, meal_type))
+            stats.count('meals_replanned', day=day_key, meal_type=meal_type)
+
+        # Targets may have changed, so every day gets a fresh summary
+        for day_key in day_keys:
+            daily_totals = {'calories': 0, 'protein': 0, 'carbs': 0, 'fat': 0}
+            for meal_type in self.MEAL_TYPES:
+                meal = new_plan[day_key].get(meal_type)
+                if meal is not None:
+                    daily_totals['calories'] += meal['calories']
+                    daily_totals['protein'] += meal['protein']
+                    daily_totals['carbs'] += meal['carbs']
+                    daily_totals['fat'] += meal['fats']
+            new_plan[day_key]['daily_summary'] = self.summarize_day(daily_totals, plan_context)
+
+        return new_plan, self.summarize_plan(plan_context, new_plan), replanned
+
+    def get_shopping_list(self, meal_plan: Dict):
+        """
+        Shopping list of a plan: the ingredients of every meal, normalized and summed
+
+        Catalog and snapshot-backed recommenders look each meal's recipe up
+        by name and read its ingredient list from the stored parsed lists
+        (see get_parsed_ingredients). Other meals, and every meal of a
+        recommender built from a DataFrame, are parsed from their own
+        ingredient text, memoized per text. Quantities of scaled meals are
+        multiplied by their servings.
+
+        Args:
+            meal_plan: Plan from generate_meal_plan
+
+        Returns:
+            List of dictionaries with ingredient, quantity, unit and meals, see aggregate_ingredients
+        """
+        meals = [
+            daily_meals[meal_type] for daily_meals in meal_plan.values()
+            for meal_type in self.MEAL_TYPES if meal_type in daily_meals
+        ]
+        if self.catalog is not None or self.snapshot_dir is not None:
+            parsed = self.get_parsed_ingredients()
+        else:
+            # Parsing a whole in-memory catalog would cost more than the meals it serves
+            parsed = self.parsed_ingredients
+        servings = [meal.get('servings', 1.0) for meal in meals]
+        if parsed is None:
+            return aggregate_ingredients([parse_ingredients(meal['ingredients']) for meal in meals], servings)
+        codes = self.get_name_codes([meal['name'] for meal in meals])
+
+        # First recipe of each name, found in one pass over the catalog
+        known_codes = np.array(sorted(set(codes) - {-1}), dtype=np.int64)
+        recipe_ids = {}
+        for recipe_id in np.flatnonzero(np.isin(self.name_codes, known_codes)).tolist():
+            recipe_ids.setdefault(int(self.name_codes[recipe_id]), recipe_id)
+
+        ingredient_lists = []
+        for meal, code in zip(meals, codes):
+            recipe_id = recipe_ids.get(code)
+            if recipe_id is not None and self.recipe_text.get(recipe_id, 'ingredients') == meal['ingredients']:
+                ingredient_lists.append(parsed.get(recipe_id))
+            else:
+                ingredient_lists.append(parse_ingredients(meal['ingredients']))
+        return aggregate_ingredients(ingredient_lists, servings)
+
+    def get_user_rng(self, seed: int, user_key):
+        """
+        Random generator derived from a base seed and a user key
+
+        The same (seed, user_key) always gives the same stream, no matter
+        which process or batch plans the user.
+        """
+        if not isinstance(user_key, int) or user_key < 0:
+            user_key = int.from_bytes(hashlib.sha256(str(user_key).encode('utf-8')).digest()[:8], 'little')
+        return np.random.default_rng(np.random.SeedSequence([seed, user_key]))
+
+    def generate_meal_plans(self, user_profiles: List[Dict], days: int = 7, max_recipe_repeats: int = 3,
+                            seed: int = None, start_index: int = 0, planner: str = 'greedy',
+                            stats: PlannerStats = NULL_STATS, ingredient_diversity: float = 0.0, alternates: int = 0):
+        """
+        Generate meal plans for many users at once
+
+        Profiles with the same diet and allergies share one suitable mask, and
+        profiles that also share goal, activity level and target calories share
+        the scored candidates. Only the per-day selection runs for every user.
+
+        Args:
+            user_profiles: List of user profiles, optionally with 'recent_recipes'
+            planner: 'greedy' or 'optimized', see build_meal_plan
+            ingredient_diversity: Ingredient-diversity weight, see build_meal_plan
+            alternates: Ranked alternates per meal, see build_meal_plan
+            seed: Base seed for per-user random generators (see get_user_rng), None uses the global NumPy state
+            start_index: Position of the first profile in the full batch. Users without a
+                'user_id' are seeded by position, so chunks of a batch plan the same as the whole
+            stats: Optional PlannerStats collecting timings and counters over the whole batch
+
+        Returns:
+            Dictionary with 'plans' (list of (meal_plan, nutrition_summary) in input order) and 'timing'
+        """
+        start = time.perf_counter()
+        min_candidates = self.get_min_candidates(days, max_recipe_repeats)
+        pool_options = self.optimizer.get_pool_options() if planner == 'optimized' else {}
+        suitable_masks = {}
+        candidate_groups = {}
+        prepare_seconds = 0.0
+        select_seconds = 0.0
+
+        plans = []
+        for index, user_profile in enumerate(user_profiles, start=start_index):
+            prepare_start = time.perf_counter()
+            plan_context = self.calculate_user_targets(user_profile)
+
+            filter_key = self.get_filter_key(user_profile)
+            if filter_key not in suitable_masks:
+                suitable_masks[filter_key] = self.get_suitable_mask(user_profile, stats=stats)
+
+            candidate_key = (filter_key, plan_context['goal'], plan_context['activity_level'], plan_context['target_calories'])
+            if candidate_key not in candidate_groups:
+                candidate_groups[candidate_key] = self.prepare_meal_candidates(
+                    suitable_masks[filter_key], plan_context['target_calories'],
+                    plan_context['goal'], plan_context['activity_level'], stats=stats,
+                    dietary_pref=user_profile.get('dietary_pref', 'non-veg'), min_candidates=min_candidates,
+                    filter_key=filter_key, **pool_options
+                )
+            plan_context['meal_candidates'] = candidate_groups[candidate_key]
+
+            select_start = time.perf_counter()
+            prepare_seconds += select_start - prepare_start
+            rng = None if seed is None else self.get_user_rng(seed, user_profile.get('user_id', index))
+            plans.append(self.build_meal_plan(
+                plan_context, days=days, recent_recipes=user_profile.get('recent_recipes'),
+                max_recipe_repeats=max_recipe_repeats, rng=rng, planner=planner, stats=stats,
+                ingredient_diversity=ingredient_diversity, alternates=alternates
+            ))
+            select_seconds += time.perf_counter() - select_start
+
+        total_seconds = time.perf_counter() - start
+        return {
+            'plans': plans,
+            'timing': {
+                'profiles': len(user_profiles),
+                'filter_groups': len(suitable_masks),
+                'candidate_groups': len(candidate_groups),
+                'prepare_seconds': round(prepare_seconds, 4),
+                'select_seconds': round(select_seconds, 4),
+                'total_seconds': round(total_seconds, 4),
+                'plans_per_second': round(len(user_profiles) / total_seconds, 1) if total_seconds > 0 else None
+            }
+        }
@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import os
+import re
+from typing import TYPE_CHECKING, List
+
+import numpy as np
+
+# pandas and scipy are imported inside the functions that build or load the
+# matrix, tokenizing and importing the module need only NumPy
+if TYPE_CHECKING:
+    from scipy import sparse
+
+# Bump whenever tokenization or weighting changes so stored indexes get rebuilt
+INGREDIENT_INDEX_VERSION = 1
+
+# Quantities, units and preparation words that say nothing about what a dish is made of
+INGREDIENT_STOPWORDS = {
+    'cup', 'cups', 'tablespoon', 'tablespoons', 'tbsp', 'teaspoon', 'teaspoons', 'tsp', 'ounce', 'ounces', 'pound',
+    'pounds', 'lb', 'lbs', 'gram', 'grams', 'kg', 'ml', 'liter', 'liters', 'pinch', 'dash', 'clove', 'cloves',
+    'can', 'cans', 'package', 'packages', 'bunch', 'slice', 'slices', 'piece', 'pieces', 'small', 'medium', 'large',
+    'fresh', 'freshly', 'chopped', 'finely', 'coarsely', 'minced', 'sliced', 'diced', 'grated', 'shredded', 'divided',
+    'plus', 'more', 'for', 'and', 'the', 'into', 'cut', 'about', 'inch', 'inches', 'optional', 'taste', 'thinly',
+    'peeled', 'trimmed', 'washed', 'removed', 'room', 'temperature', 'packed', 'whole', 'ground', 'each', 'with',
+    'from', 'such', 'other', 'like', 'serving', 'garnish', 'needed', 'very', 'well', 'drained', 'rinsed'
+}
+
+_WORD_PATTERN = re.compile(r'[a-z]+')
+
+
+def tokenize_ingredients(ingredients: str):
+    '''
+    Ingredient terms of a pipe-separated ingredient list
+
+    Each ingredient line gives its words (minus quantities, units and
+    preparation words) and the pairs of neighbouring words, so
+    'olive oil' and 'sesame oil' share 'oil' but are not the same term.
+    '''
+    if not isinstance(ingredients, str):
+        return []
+    terms = []
+    for line in ingredients.lower().split('|'):
+        words = [word for word in _WORD_PATTERN.findall(line) if len(word) > 2 and word not in INGREDIENT_STOPWORDS]
+        terms.extend(words)
+        terms.extend(f'{first} {second}' for first, second in zip(words, words[1:]))
+    return terms
+
+
+class IngredientIndex:
+    '''
+    Hashed TF-IDF vectors of every recipe's ingredients
+
+    Terms are hashed into a fixed number of features, weighted by
+    (1 + log tf) * idf and L2-normalized, so the dot product of two rows is
+    their cosine similarity. Queries are sparse matrix products: "more like
+    this" only touches the postings of the query recipe's terms, and
+    diversity scores multiply the candidate rows with the few recent ones.
+    '''
+    def __init__(self, matrix: sparse.csr_matrix, version: str = None):
+        '''
+        Args:
+            matrix: Normalized recipe x feature TF-IDF matrix
+            version: Catalog version the index was built from
+        '''
+        self.matrix = matrix.tocsr()
+        self.version = version
+        self._by_feature = None
+
+    @classmethod
+    def build(cls, recipe_text, n_recipes: int, version: str = None, n_features: int = 2 ** 18,
+              chunk_size: int = 50000):
+        '''
+        Build the index from the 'ingredients' text column
+
+        Args:
+            recipe_text: FrameText or CatalogText of the recipes
+            n_recipes: Number of recipes
+            version: Catalog version stored with the index
+            n_features: Hashed feature count
+            chunk_size: Recipes tokenized at a time
+        '''
+        import pandas as pd
+        from scipy import sparse
+
+        blocks = []
+        for start in range(0, n_recipes, chunk_size):
+            stop = min(start + chunk_size, n_recipes)
+            terms = [tokenize_ingredients(text) for text in recipe_text.slice('ingredients', start, stop)]
+            lengths = np.array([len(row) for row in terms], dtype=np.int64)
+            flat = np.array([term for row in terms for term in row], dtype=object)
+            features = (pd.util.hash_array(flat) % n_features).astype(np.int64) if len(flat) else np.empty(0, np.int64)
+            rows = np.repeat(np.arange(stop - start), lengths)
+            # Duplicate (row, feature) pairs are summed into term counts
+            blocks.append(sparse.csr_matrix(
+                (np.ones(len(features), dtype=np.float32), (rows, features)), shape=(stop - start, n_features)
+            ))
+        counts = sparse.vstack(blocks, format='csr') if blocks else sparse.csr_matrix((0, n_features), dtype=np.float32)
+        counts.sum_duplicates()
+
+        document_frequency = np.bincount(counts.indices, minlength=n_features)
+        idf = (np.log((1 + n_recipes) / (1 + document_frequency)) + 1).astype(np.float32)
+        weights = counts.copy()
+        weights.data = (1 + np.log(weights.data)) * idf[weights.indices]
+
+        norms = np.sqrt(np.asarray(weights.multiply(weights).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        weights = sparse.diags((1 / norms).astype(np.float32)) @ weights
+        return cls(weights.tocsr(), version=version)
+
+    @classmethod
+    def load(cls, path: str):
+        '''
+        Load an index saved with save, None when the file does not exist
+        '''
+        if not os.path.exists(path):
+            return None
+        from scipy import sparse
+
+        with np.load(path, allow_pickle=False) as stored:
+            if int(stored['format']) != INGREDIENT_INDEX_VERSION:
+                return None
+            matrix = sparse.csr_matrix(
+                (stored['data'], stored['indices'], stored['indptr']), shape=tuple(stored['shape'])
+            )
+            return cls(matrix, version=str(stored['version']))
+
+    @classmethod
+    def load_or_build(cls, path: str, recipe_text, n_recipes: int, version: str):
+        '''
+        Load the stored index when it matches the catalog version, otherwise build and store it
+        '''
+        index = cls.load(path) if path is not None else None
+        if index is not None and index.version == version and index.matrix.shape[0] == n_recipes:
+            return index
+        index = cls.build(recipe_text, n_recipes, version=version)
+        if path is not None:
+            index.save(path)
+        return index
+
+    def save(self, path: str):
+        '''
+        Store the index next to the catalog files (written then renamed)
+        '''
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f, data=self.matrix.data, indices=self.matrix.indices, indptr=self.matrix.indptr,
+                shape=np.array(self.matrix.shape), version=np.array(self.version or ''),
+                format=np.array(INGREDIENT_INDEX_VERSION)
+            )
+        os.replace(tmp_path, path)
+
+    def similarities(self, recipe_id: int):
+        '''
+        Cosine similarity of every recipe to one recipe
+        '''
+        if self._by_feature is None:
+            self._by_feature = self.matrix.tocsc()
+        query = self.matrix[recipe_id]
+        # Only the columns (postings) of the query's own terms take part
+        return np.asarray(self._by_feature[:, query.indices] @ query.data).ravel()
+
+    def most_similar(self, recipe_id: int, k: int = 10, candidate_mask: np.ndarray = None):
+        '''
+        Top-k recipes sharing the most ingredients with a recipe ("more like this")
+
+        Args:
+            recipe_id: Query recipe
+            k: Number of recipes to return
+            candidate_mask: Optional boolean mask of recipes allowed in the result
+
+        Returns:
+            Tuple of (recipe IDs, similarities), most similar first, without the query itself
+        '''
+        scores = self.similarities(recipe_id)
+        scores[recipe_id] = -1
+        if candidate_mask is not None:
+            scores[~candidate_mask] = -1
+        positions = np.flatnonzero(scores > 0)
+        if len(positions) > k:
+            positions = positions[np.argpartition(-scores[positions], k - 1)[:k]]
+        positions = positions[np.argsort(-scores[positions], kind='stable')]
+        return positions, scores[positions]
+
+    def candidate_vectors(self, candidate_ids: np.ndarray):
+        '''
+        Transposed vectors of a candidate set, reused by max_similarity across a plan
+        '''
+        return self.matrix[candidate_ids].T.tocsr()
+
+    def max_similarity(self, candidate_vectors: sparse.csr_matrix, recipe_ids: List[int]):
+        '''
+        Highest similarity of each candidate to any of the given recipes
+
+        Used as an ingredient-diversity score: 0 shares nothing with the
+        recent meals, 1 has the same ingredients as one of them.
+
+        Args:
+            candidate_vectors: Result of candidate_vectors for the candidates
+            recipe_ids: Recipes to compare against, e.g. the recent meals
+        '''
+        n_candidates = candidate_vectors.shape[1]
+        if len(recipe_ids) == 0 or n_candidates == 0:
+            return np.zeros(n_candidates)
+        return (self.matrix[np.asarray(recipe_ids)] @ candidate_vectors).toarray().max(axis=0)
@@ -0,0 +1,133 @@
+'''
+Load test for the local planning service (plan_service.py)
+
+Opens concurrent keep-alive connections, posts plan requests for random
+profiles and reports latency percentiles and throughput as JSON.
+
+Usage:
+    python plan_service.py --port 8080 &
+    python load_test.py --url http://127.0.0.1:8080 --requests 500 --concurrency 16
+'''
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Dict
+from urllib.parse import urlparse
+
+import numpy as np
+
+
+def make_profiles(n_profiles: int, seed: int = 0):
+    '''
+    Random but plausible user profiles
+    '''
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            'user_id': i,
+            'age': int(rng.integers(18, 75)),
+            'gender': str(rng.choice(['male', 'female'])),
+            'height': int(rng.integers(150, 200)),
+            'weight': int(rng.integers(45, 120)),
+            'activity_level': str(rng.choice(['sedentary', 'lightly_active', 'moderately_active', 'very_active'])),
+            'weight_goal': str(rng.choice(['loss', 'gain', 'maintain'])),
+            'dietary_pref': str(rng.choice(['vegan', 'vegetarian', 'non-veg'])),
+            'allergies': [str(a) for a in rng.choice(['gluten', 'dairy', 'nuts'], int(rng.integers(0, 3)), replace=False)]
+        }
+        for i in range(n_profiles)
+    ]
+
+
+async def post_json(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, host: str, path: str, payload: Dict):
+    '''
+    Send one POST over an open keep-alive connection
+
+    Returns:
+        Tuple of (HTTP status, response body)
+    '''
+    body = json.dumps(payload).encode('utf-8')
+    writer.write(
+        f'POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n'
+        f'Content-Length: {len(body)}\r\n\r\n'.encode('latin-1') + body
+    )
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def run_load_test(url: str, n_requests: int, concurrency: int, days: int = 7, seed: int = 0):
+    '''
+    Post n_requests plan requests over concurrency connections
+
+    Returns:
+        Dictionary with status counts, latency percentiles in milliseconds and requests per second
+    '''
+    target = urlparse(url)
+    profiles = make_profiles(n_requests, seed=seed)
+    queue = asyncio.Queue()
+    for profile in profiles:
+        queue.put_nowait(profile)
+
+    latencies = []
+    statuses = {}
+
+    async def client():
+        reader, writer = await asyncio.open_connection(target.hostname, target.port or 80)
+        try:
+            while not queue.empty():
+                profile = queue.get_nowait()
+                start = time.perf_counter()
+                status, _ = await post_json(reader, writer, target.hostname, '/plan', {'profile': profile, 'days': days})
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    total_seconds = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'requests': n_requests,
+        'concurrency': concurrency,
+        'days': days,
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'total_seconds': round(total_seconds, 3),
+        'requests_per_s': round(n_requests / total_seconds, 1),
+        'mean_ms': round(float(latencies_ms.mean()), 3),
+        'p50_ms': round(float(np.percentile(latencies_ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(latencies_ms, 95)), 3),
+        'p99_ms': round(float(np.percentile(latencies_ms, 99)), 3),
+        'max_ms': round(float(latencies_ms.max()), 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the local planning service')
+    parser.add_argument('--url', default='http://127.0.0.1:8080')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load_test(args.url, args.requests, args.concurrency, days=args.days, seed=args.seed))
+    print(json.dumps(report, indent=2))
+    if set(report['statuses']) != {'200'}:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
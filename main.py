@@ -1,11 +1,9 @@
 from activity_assessment import ActivityAssessment
 from content_based_recommender import ContentBasedRecommender
-import pandas as pd
+from profile_validation import AGE_RANGE, HEIGHT_RANGE, WEIGHT_RANGE
 
-df = pd.read_csv('recipe_dataset.csv')
-
-
-recommender = ContentBasedRecommender(df)
+# Loads the precompiled catalog, rebuilt automatically when the CSV changes
+recommender = ContentBasedRecommender.from_csv('recipe_dataset.csv', lazy_text=True)
 #Asking user for their info such as age, height, weight and so on...
 def get_valid_integer(prompt, min_val, max_val):
     while True:
@@ -83,6 +81,8 @@ def display_meal_plan(meal_plan):
             if meal_type in daily_meals:
                 meal = daily_meals[meal_type]
                 print(f"\n 🍽️ {meal_type.title()}: {meal['name']}")
+                if 'servings' in meal:
+                    print(f"   - Servings: {meal['servings']:g}")
                 print(f"   - Calories: {meal['calories']} kcal")
                 print(f"   - Protein: {meal['protein']} g")
                 print(f"   - Carbs:   {meal['carbs']} g")
@@ -106,10 +106,19 @@ def display_meal_plan(meal_plan):
             print(f"   - Calorie Variance: {summary['calorie_variance']} %")
 
 
+def display_shopping_list(shopping_list):
+    print("\n🛒 Shopping List")
+    for item in shopping_list:
+        if item['quantity'] is None:
+            print(f"   - {item['ingredient']}")
+        else:
+            print(f"   - {item['ingredient']}: {item['quantity']:g} {item['unit'] or ''}".rstrip())
+
+
 # Collect user input
-age = get_valid_integer("Enter your age: ", 15, 100)
-height = get_valid_integer("Enter your height in cm: ", 50, 300)
-weight = get_valid_integer("Enter your weight in kg: ", 10, 500)
+age = get_valid_integer("Enter your age: ", *AGE_RANGE)
+height = get_valid_integer("Enter your height in cm: ", *HEIGHT_RANGE)
+weight = get_valid_integer("Enter your weight in kg: ", *WEIGHT_RANGE)
 gender = get_valid_gender()
 
 
@@ -144,4 +153,4 @@ print(f"Weight goal:{user_wt_goal}")
 
 meal_plan, nutrition_summary = recommender.generate_meal_plan(user_profile)
 display_meal_plan(meal_plan)
-
+display_shopping_list(recommender.get_shopping_list(meal_plan))
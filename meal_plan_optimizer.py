@@ -0,0 +1,188 @@
+import time
+from typing import Dict
+
+import numpy as np
+
+
+class MealPlanOptimizer:
+    '''
+    Chooses a day's meals together instead of slot by slot
+
+    Runs a beam search over the meal types. Each slot contributes a
+    shortlist of the best penalized recipes of its candidate pool: every
+    suitable recipe within ±pool_window of the meal's calorie target, or
+    the shortlist_size recipes closest to it when that window is thinner.
+    So the search can trade a lighter lunch for a heavier dinner instead
+    of only reordering the greedy planner's narrow windows. Partial days are ranked by
+    how far their projected totals (chosen meals plus the targets of the
+    meals still to pick) fall from the daily calorie and macro targets,
+    using the goal-based weights of NutritionCalculator with the calorie
+    weight raised by calorie_priority, minus a small reward for the
+    candidates' own scores.
+    '''
+    def __init__(self, recommender, beam_width: int = 32, shortlist_size: int = 40, score_weight: float = 0.2,
+                 pool_window: float = 0.25, calorie_priority: float = 64.0):
+        '''
+        Args:
+            recommender: ContentBasedRecommender providing candidates and usage tracking
+            beam_width: Partial days kept after each meal type
+            shortlist_size: Best candidates of each slot considered by the search
+            score_weight: Weight of the average nutritional score against the target deviation
+            pool_window: Calorie window of each slot's candidate pool, see
+                ContentBasedRecommender.prepare_meal_candidates
+            calorie_priority: Factor on the goal-based calorie weight. Whole recipes rarely hit
+                the calories and every macro at once, so the macros mostly decide between
+                days that come equally close to the calorie target
+        '''
+        self.recommender = recommender
+        self.pool_window = pool_window
+        self.calorie_priority = calorie_priority
+        self.beam_width = beam_width
+        self.shortlist_size = shortlist_size
+        self.score_weight = score_weight
+
+    def get_pool_options(self):
+        '''
+        Keyword arguments asking ContentBasedRecommender.prepare_meal_plan for this optimizer's candidate pools
+        '''
+        return {'pool_window': self.pool_window, 'pool_size': self.shortlist_size}
+
+    def get_shortlist(self, plan_context: Dict, meal_type: str, usage_state: Dict, max_recipe_repeats: int):
+        '''
+        Best penalized candidates of a slot's pool that respect the repeat limit
+
+        Plan contexts prepared without pools fall back to the slot's own candidates.
+
+        Returns:
+            Tuple of (recipe IDs, name codes, scores, nutrient matrix of calories/protein/carbs/fats,
+            servings or None without portion scaling). Nutrients are those of the servings
+        '''
+        recommender = self.recommender
+        candidate_ids, candidate_codes, scores = recommender.get_slot_scores(plan_context, meal_type, usage_state, pool=True)
+
+        allowed = ~np.isnan(scores)
+        within_limit = allowed & (usage_state['usage_counts'][candidate_codes] < max_recipe_repeats)
+        if within_limit.any():
+            allowed = within_limit
+        positions = np.flatnonzero(allowed)
+        if len(positions) > self.shortlist_size:
+            best = np.argpartition(-scores[positions], self.shortlist_size - 1)[:self.shortlist_size]
+            positions = np.sort(positions[best])
+
+        ids = candidate_ids[positions]
+        nutrients = np.column_stack([
+            recommender.nutrients[column][ids] for column in ['calories', 'protein', 'carbs', 'fats']
+        ])
+        scales = recommender.get_slot_candidates(plan_context, meal_type, pool=True).get('scales')
+        if scales is not None:
+            scales = scales[positions]
+            nutrients = nutrients * scales[:, None]
+        return ids, candidate_codes[positions], scores[positions], nutrients, scales
+
+    def optimize_daily_meals(self, plan_context: Dict, usage_state: Dict, max_recipe_repeats: int = 3,
+                             time_budget: float = 0.05, alternates: int = 0):
+        '''
+        Pick one day's meals jointly, minimizing deviation from the daily targets
+
+        Args:
+            plan_context: Result of ContentBasedRecommender.prepare_meal_plan
+            usage_state: Result of ContentBasedRecommender.new_usage_state (updated in place)
+            max_recipe_repeats: Maximum times a recipe may be used in the plan
+            time_budget: Seconds after which the search finishes greedily (beam width 1)
+            alternates: Ranked alternates added to each meal, taken from the slot's shortlist and
+                topped up from the whole meal type when it runs short
+
+        Returns:
+            Dictionary of the day's meals with a daily_summary, like select_daily_meals
+        '''
+        recommender = self.recommender
+        stats = usage_state['stats']
+        start = time.perf_counter()
+        goal = plan_context['goal']
+        target_calories = plan_context['target_calories']
+        target_macros = plan_context['target_macros']
+
+        weights = recommender.nutrition_calc.get_goal_based_weights(goal)
+        weight_vector = np.array([self.calorie_priority * weights['calories'], weights['protein'], weights['carbs'], weights['fat']])
+        daily_targets = np.array([target_calories, target_macros['protein'], target_macros['carbs'], target_macros['fat']])
+        # calculate_macros can leave no calories for fat, a nutrient without a positive target is not optimized
+        weight_vector = np.where(daily_targets > 0, weight_vector, 0.0)
+        daily_targets = np.where(daily_targets > 0, daily_targets, 1.0)
+
+        slots = []
+        for meal_type in recommender.MEAL_TYPES:
+            if len(plan_context['meal_candidates'][meal_type]['ids']) == 0:
+                continue
+            ids, codes, scores, nutrients, scales = self.get_shortlist(plan_context, meal_type, usage_state, max_recipe_repeats)
+            if len(ids) == 0:
+                continue
+            meal_targets = recommender.get_meal_targets(target_calories, plan_context['activity_level'], meal_type, goal)
+            slots.append({
+                'meal_type': meal_type,
+                'ids': ids,
+                'codes': codes,
+                'scores': scores,
+                'nutrients': nutrients,
+                'scales': scales,
+                'targets': np.array([meal_targets['calories'], meal_targets['protein'], meal_targets['carbs'], meal_targets['fat']])
+            })
+
+        # Beam state: running totals, summed scores and chosen shortlist positions per partial day
+        totals = np.zeros((1, 4))
+        score_sums = np.zeros(1)
+        chosen = np.zeros((1, 0), dtype=np.int64)
+        chosen_codes = np.zeros((1, 0), dtype=np.int64)
+        beam_width = self.beam_width
+
+        with stats.timer('optimize'):
+            for slot_index, slot in enumerate(slots):
+                if beam_width > 1 and time.perf_counter() - start > time_budget:
+                    stats.count('optimize_budget_exceeded', meal_type=slot['meal_type'])
+                    beam_width = 1
+
+                # Meals not chosen yet are assumed to hit their own targets
+                remaining = sum((later['targets'] for later in slots[slot_index + 1:]), np.zeros(4))
+                projected = totals[:, None, :] + slot['nutrients'][None, :, :] + remaining
+                deviation = ((projected - daily_targets) / daily_targets) ** 2 @ weight_vector
+                combined_scores = score_sums[:, None] + slot['scores'][None, :]
+                cost = deviation - self.score_weight * combined_scores / len(slots)
+
+                # No recipe twice in the same day
+                if chosen_codes.shape[1] > 0:
+                    repeated = (chosen_codes[:, :, None] == slot['codes'][None, None, :]).any(axis=1)
+                    if not repeated.all():
+                        cost = np.where(repeated, np.inf, cost)
+
+                flat_cost = cost.ravel()
+                keep = min(beam_width, len(flat_cost))
+                best = np.argpartition(flat_cost, keep - 1)[:keep]
+                best = best[np.argsort(flat_cost[best], kind='stable')]
+                states, picks = np.divmod(best, len(slot['ids']))
+
+                totals = totals[states] + slot['nutrients'][picks]
+                score_sums = combined_scores[states, picks]
+                chosen = np.column_stack([chosen[states], picks])
+                chosen_codes = np.column_stack([chosen_codes[states], slot['codes'][picks]])
+
+        daily_meals = {}
+        daily_totals = {'calories': 0, 'protein': 0, 'carbs': 0, 'fat': 0}
+        for slot_index, slot in enumerate(slots):
+            pick = chosen[0, slot_index]
+            if alternates:
+                with stats.timer('alternates'):
+                    meal_alternates = recommender.select_alternates(
+                        slot['ids'], slot['codes'], slot['scores'], alternates,
+                        candidate_mask=(slot['codes'] != slot['codes'][pick])
+                        & (usage_state['usage_counts'][slot['codes']] < max_recipe_repeats),
+                        candidate_scales=slot['scales']
+                    )
+                    recommender.fill_alternates(plan_context, slot['meal_type'], meal_alternates, alternates,
+                                                [slot['codes'][pick]], usage_state, max_recipe_repeats=max_recipe_repeats)
+            recommender.record_meal(
+                daily_meals, daily_totals, slot['meal_type'], slot['ids'][pick], slot['scores'][pick], usage_state,
+                scale=None if slot['scales'] is None else slot['scales'][pick]
+            )
+            if alternates:
+                daily_meals[slot['meal_type']]['alternates'] = meal_alternates
+        daily_meals['daily_summary'] = recommender.summarize_day(daily_totals, plan_context)
+        return daily_meals
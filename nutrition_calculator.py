@@ -1,8 +1,72 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# TDEE multiplier of each activity level, anything else counts as sedentary
+ACTIVITY_MULTIPLIERS = {
+    'sedentary': 1.2,           # Little to no exercise
+    'lightly_active': 1.375,    # Light exercise 1-3 days/week
+    'moderately_active': 1.55,  # Moderate exercise 3-5 days/week
+    'very_active': 1.725        # Heavy exercise 6-7 days/week
+}
+
+# Per weight goal: protein g/kg, carb g/kg, carb multiplier per activity level and its default
+MACRO_RULES = {
+    'loss': (2.0, 3.0, {'sedentary': 0.8, 'lightly_active': 0.9,
+                        'moderately_active': 1.0, 'very_active': 1.2}, 1.0),
+    'gain': (1.6, 5.0, {'sedentary': 1.0, 'lightly_active': 1.2,
+                        'moderately_active': 1.4, 'very_active': 1.6}, 1.4),
+    'maintain': (1.4, 4.0, {'sedentary': 0.9, 'lightly_active': 1.1,
+                            'moderately_active': 1.3, 'very_active': 1.5}, 1.3)
+}
+
+
+def _lookup(lookup, *columns):
+    '''
+    Apply a scalar lookup to arrays of labels, calling it once per distinct combination of labels
+    '''
+    import pandas as pd
+
+    codes = np.zeros(len(columns[0]), dtype=np.int64)
+    labels = [()]
+    for column in columns:
+        column_codes, column_labels = pd.factorize(np.asarray(column, dtype=object), use_na_sentinel=False)
+        codes = codes * len(column_labels) + column_codes
+        labels = [combination + (label,) for combination in labels for label in column_labels]
+    return np.array([lookup(*combination) for combination in labels])[codes]
+
+
+def _round(values: np.ndarray, decimals: int):
+    '''
+    Array version of the built-in round
+
+    np.round scales, rounds and scales back, which can land on the other
+    side of a tie than round does. Values that close to a tie are rounded
+    one by one, so the results match the scalar methods exactly.
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    rounded = np.round(values, decimals)
+    scaled = values * 10 ** decimals
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_tie):
+        rounded.flat[i] = round(float(values.flat[i]), decimals)
+    return rounded
+
+
 class NutritionCalculator:
     
     '''
     Calculates daily caloric and macronutrient needs based on user profile
     Uses scientifically validated formulas
+
+    The *_batch methods are array versions of the scalar ones for many
+    users at once (NumPy arrays, lists or DataFrame columns in, arrays out)
+    and give the same numbers.
     '''
     def calculate_bmr (self, weight:float, height:float, age:int, gender:str):
         '''
@@ -34,14 +98,7 @@ class NutritionCalculator:
         Returns:
             TDEE in calories per day
         '''
-        activity_multipliers = {
-            'sedentary': 1.2,           # Little to no exercise
-            'lightly_active': 1.375,    # Light exercise 1-3 days/week
-            'moderately_active': 1.55,  # Moderate exercise 3-5 days/week
-            'very_active': 1.725        # Heavy exercise 6-7 days/week
-        }
-
-        return round(bmr * activity_multipliers.get(activity_level, 1.2), 2)
+        return round(bmr * ACTIVITY_MULTIPLIERS.get(activity_level, 1.2), 2)
 
     def calculate_target_calories(self, tdee:float, wt_goal:str):
         '''
@@ -85,23 +142,14 @@ class NutritionCalculator:
         #     # Balanced approach
         #     protein_ratio, carb_ratio, fat_ratio = 0.25, 0.45, 0.30
         # Body weight-based calculations (more accurate)
-        if weight_goal == 'loss':
-            protein_g_per_kg = 2.0  # High protein for muscle preservation
-            activity_multiplier = {'sedentary': 0.8, 'lightly_active': 0.9, 
-                                     'moderately_active': 1.0, 'very_active': 1.2}.get(activity_level, 1.0)
-            carb_g_per_kg = 3.0 * activity_multiplier  # Lower carbs for fat loss
-                
-        elif weight_goal == 'gain':
-            protein_g_per_kg = 1.6  # Adequate for muscle building
-            activity_multiplier = {'sedentary': 1.0, 'lightly_active': 1.2, 
-                                     'moderately_active': 1.4, 'very_active': 1.6}.get(activity_level, 1.4)
-            carb_g_per_kg = 5.0 * activity_multiplier  # Higher carbs for energy
-                
-        else:  # maintain
-            protein_g_per_kg = 1.4  # Balanced maintenance
-            activity_multiplier = {'sedentary': 0.9, 'lightly_active': 1.1, 
-                                     'moderately_active': 1.3, 'very_active': 1.5}.get(activity_level, 1.3)
-            carb_g_per_kg = 4.0 * activity_multiplier
+        # Loss: high protein for muscle preservation, lower carbs for fat loss
+        # Gain: adequate protein for muscle building, higher carbs for energy
+        # Maintain: balanced
+        protein_g_per_kg, carb_g_per_kg, activity_multipliers, default_multiplier = MACRO_RULES.get(
+            weight_goal, MACRO_RULES['maintain']
+        )
+        activity_multiplier = activity_multipliers.get(activity_level, default_multiplier)
+        carb_g_per_kg = carb_g_per_kg * activity_multiplier
 
         # Calculate grams
         max_protein_per_kg = 2.2
@@ -135,6 +183,102 @@ class NutritionCalculator:
                 'fat': round(fat_grams, 1)
         }
     
+    def calculate_bmr_batch(self, weight, height, age, gender):
+        '''
+        Array version of calculate_bmr
+
+        Returns:
+            Array of BMRs in calories per day
+        '''
+        weight, height, age = (np.asarray(values, dtype=np.float64) for values in (weight, height, age))
+        is_male = _lookup(lambda label: str(label).lower() == 'male', gender).astype(bool)
+        bmr = 10 * weight + 6.25 * height - 5 * age + np.where(is_male, 5, -161)
+        return _round(bmr, 2)
+
+    def calculate_tdee_batch(self, bmr, activity_level):
+        '''
+        Array version of calculate_tdee
+        '''
+        multipliers = _lookup(lambda label: ACTIVITY_MULTIPLIERS.get(label, 1.2), activity_level).astype(np.float64)
+        return _round(np.asarray(bmr, dtype=np.float64) * multipliers, 2)
+
+    def calculate_target_calories_batch(self, tdee, wt_goal):
+        '''
+        Array version of calculate_target_calories
+        '''
+        tdee = np.asarray(tdee, dtype=np.float64)
+        offsets = _lookup(lambda label: {'loss': -500, 'gain': 500}.get(label, 0), wt_goal).astype(np.float64)
+        # Maintenance keeps the TDEE as it is, without rounding again
+        return np.where(offsets != 0, _round(tdee + offsets, 2), tdee)
+
+    def calculate_macros_batch(self, target_calories, weight_goal, body_weight, activity_level):
+        '''
+        Array version of calculate_macros, with the same 20% fat floor and 20% carb reduction cap
+
+        Returns:
+            Dictionary of protein, carbs and fat arrays in grams
+        '''
+        target_calories = np.asarray(target_calories, dtype=np.float64)
+        body_weight = np.asarray(body_weight, dtype=np.float64)
+
+        # The rules only depend on the (goal, activity level) pair, so they are looked up per distinct pair
+        def rules(goal, activity):
+            protein_g_per_kg, carb_g_per_kg, activity_multipliers, default_multiplier = MACRO_RULES.get(
+                goal, MACRO_RULES['maintain']
+            )
+            return protein_g_per_kg, carb_g_per_kg * activity_multipliers.get(activity, default_multiplier)
+
+        per_kg = _lookup(rules, weight_goal, activity_level).astype(np.float64).reshape(-1, 2)
+        protein_g_per_kg, carb_g_per_kg = per_kg[:, 0], per_kg[:, 1]
+
+        # Calculate grams
+        max_protein_per_kg = 2.2
+        protein_grams = np.minimum(body_weight * protein_g_per_kg, max_protein_per_kg * body_weight)
+        carb_grams = body_weight * carb_g_per_kg
+
+        # Calculate calories from protein and carbs
+        protein_calories = protein_grams * 4
+        carb_calories = carb_grams * 4
+
+        # Remaining calories from fat, minimum 20% fat
+        remaining_calories = target_calories - protein_calories - carb_calories
+        fat_grams = np.maximum(remaining_calories / 9, target_calories * 0.20 / 9)
+
+        # Where the total exceeds the target, reduce carbs by at most 20% and give fat the rest
+        total_calories = protein_calories + carb_calories + (fat_grams * 9)
+        over = total_calories > target_calories
+        carb_reduction = np.minimum((total_calories - target_calories) / 4, carb_grams * 0.2)
+        carb_grams = np.where(over, carb_grams - carb_reduction, carb_grams)
+        fat_grams = np.where(over, (target_calories - protein_calories - carb_grams * 4) / 9, fat_grams)
+
+        return {
+            'protein': _round(protein_grams, 1),
+            'carbs': _round(carb_grams, 1),
+            'fat': _round(fat_grams, 1)
+        }
+
+    def calculate_targets_batch(self, profiles: pd.DataFrame):
+        '''
+        Daily targets of many users in one pass
+
+        Args:
+            profiles: DataFrame with weight, height, age, gender, activity_level and weight_goal columns
+
+        Returns:
+            DataFrame with bmr, tdee, target_calories, protein, carbs and fat, indexed like profiles
+        '''
+        import pandas as pd
+
+        bmr = self.calculate_bmr_batch(profiles['weight'], profiles['height'], profiles['age'], profiles['gender'])
+        tdee = self.calculate_tdee_batch(bmr, profiles['activity_level'])
+        target_calories = self.calculate_target_calories_batch(tdee, profiles['weight_goal'])
+        macros = self.calculate_macros_batch(
+            target_calories, profiles['weight_goal'], profiles['weight'], profiles['activity_level']
+        )
+        return pd.DataFrame(
+            {'bmr': bmr, 'tdee': tdee, 'target_calories': target_calories, **macros}, index=profiles.index
+        )
+
     def get_goal_based_weights(self, goal: str):
         """
         Returns weightings for calorie, protein, carbs, fat deviation
@@ -0,0 +1,161 @@
+import multiprocessing
+import os
+import time
+from typing import Dict, List
+
+from content_based_recommender import ContentBasedRecommender, check_portion_range
+from planner_stats import NULL_STATS, PlannerStats
+from recipe_catalog import RecipeCatalog
+
+# Recommender of the current worker process, set by init_worker
+_worker_recommender = None
+
+
+def init_worker(csv_path: str, catalog_dir: str, snapshot_dir: str = None, portion_range=None):
+    '''
+    Pool initializer: map the shared catalog (or recommender snapshot) read-only into this worker
+
+    Shared by every process pool that plans (see PlanService), so the workers are set up the same way.
+    '''
+    global _worker_recommender
+    if snapshot_dir is not None:
+        _worker_recommender = ContentBasedRecommender.from_snapshot(snapshot_dir, mmap_mode='r', portion_range=portion_range)
+        return
+    _worker_recommender = ContentBasedRecommender.from_catalog(
+        RecipeCatalog(csv_path, catalog_dir), mmap_mode='r', lazy_text=True
+    )
+    _worker_recommender.portion_range = portion_range
+
+
+def get_worker_recommender():
+    '''
+    Recommender of the current worker process, set up by init_worker
+    '''
+    return _worker_recommender
+
+
+def _plan_chunk(chunk: Dict):
+    '''
+    Plan one chunk of profiles inside a worker process
+    '''
+    stats = PlannerStats() if chunk['collect_stats'] else NULL_STATS
+    result = _worker_recommender.generate_meal_plans(
+        chunk['profiles'], days=chunk['days'], max_recipe_repeats=chunk['max_recipe_repeats'],
+        seed=chunk['seed'], start_index=chunk['start_index'], stats=stats, alternates=chunk['alternates']
+    )
+    if stats.enabled:
+        result['stats'] = stats.as_dict()
+    return result
+
+
+class ParallelMealPlanner:
+    '''
+    Spreads bulk meal plan generation across a process pool
+
+    The catalog is built once by the parent and memory-mapped read-only by
+    every worker, so the nutrient arrays are shared through the page cache
+    instead of pickling a DataFrame into each process. Every user gets a
+    random generator derived from (seed, user_id or position), so plans are
+    reproducible no matter which worker handles them.
+
+    With a snapshot_dir, workers load a recommender snapshot instead (see
+    ContentBasedRecommender.save_snapshot), which skips rebuilding the
+    indexes in every worker.
+    '''
+    def __init__(self, csv_path: str, processes: int = None, catalog_dir: str = None, snapshot_dir: str = None,
+                 portion_range=None):
+        '''
+        Args:
+            portion_range: (min, max) servings meals are scaled within, see ContentBasedRecommender
+
+        Raises:
+            ValueError: When portion_range is not a (min, max) pair with 0 < min <= max
+        '''
+        self.catalog = RecipeCatalog(csv_path, catalog_dir)
+        self.processes = processes or os.cpu_count() or 1
+        self.snapshot_dir = snapshot_dir
+        # Checked here, so a bad range fails before any worker starts
+        self.portion_range = check_portion_range(portion_range)
+        self._pool = None
+
+    def start(self):
+        '''
+        Build the catalog (and snapshot) if needed and start the worker pool
+        '''
+        if self._pool is None:
+            if self.snapshot_dir is not None:
+                ContentBasedRecommender.from_snapshot(self.snapshot_dir, catalog=self.catalog)
+            elif self.catalog.is_stale():
+                self.catalog.build()
+            self._pool = multiprocessing.Pool(
+                self.processes, initializer=init_worker,
+                initargs=(self.catalog.csv_path, self.catalog.catalog_dir, self.snapshot_dir, self.portion_range)
+            )
+        return self
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def generate_meal_plans(self, user_profiles: List[Dict], days: int = 7, max_recipe_repeats: int = 3,
+                            seed: int = 0, chunk_size: int = None, stats: PlannerStats = None, alternates: int = 0):
+        '''
+        Generate meal plans for many users across the worker pool
+
+        Args:
+            user_profiles: List of user profiles
+            seed: Base seed of the per-user random generators
+            chunk_size: Profiles sent to a worker at once, defaults to an even split
+            alternates: Ranked alternates per meal, see ContentBasedRecommender.build_meal_plan
+            stats: Optional PlannerStats, the workers' timings and counters are merged into it.
+                The stats hook is not called for events raised inside the workers
+
+        Returns:
+            Dictionary with 'plans' in input order and aggregate 'timing'
+        '''
+        self.start()
+        start = time.perf_counter()
+        if chunk_size is None:
+            chunk_size = max(1, -(-len(user_profiles) // (self.processes * 4)))
+
+        chunks = [
+            {
+                'profiles': user_profiles[i:i + chunk_size],
+                'days': days,
+                'max_recipe_repeats': max_recipe_repeats,
+                'seed': seed,
+                'start_index': i,
+                'alternates': alternates,
+                'collect_stats': stats is not None
+            }
+            for i in range(0, len(user_profiles), chunk_size)
+        ]
+
+        plans = []
+        worker_seconds = 0.0
+        for result in self._pool.imap(_plan_chunk, chunks):
+            plans.extend(result['plans'])
+            worker_seconds += result['timing']['total_seconds']
+            if stats is not None:
+                stats.merge(result['stats'])
+
+        total_seconds = time.perf_counter() - start
+        return {
+            'plans': plans,
+            'timing': {
+                'profiles': len(user_profiles),
+                'processes': self.processes,
+                'chunks': len(chunks),
+                'worker_seconds': round(worker_seconds, 4),
+                'total_seconds': round(total_seconds, 4),
+                'plans_per_second': round(len(user_profiles) / total_seconds, 1) if total_seconds > 0 else None
+            }
+        }
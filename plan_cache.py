@@ -0,0 +1,86 @@
+from collections import OrderedDict
+from typing import Dict, Hashable
+
+import numpy as np
+
+
+class CandidateCache:
+    '''
+    LRU cache for prepared plan contexts (targets and scored candidate arrays)
+
+    Entries are evicted least recently used first once either the entry
+    count or the memory cap is exceeded. Cached arrays are made read-only
+    so a plan can never change another plan's candidates.
+    '''
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        '''
+        Args:
+            max_entries: Maximum number of cached plan contexts
+            max_bytes: Memory cap for the cached candidate arrays
+        '''
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable):
+        '''
+        Returns the cached value or None, counting the hit or miss
+        '''
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: Hashable, value: Dict):
+        '''
+        Cache a plan context, evicting old entries to stay within the caps
+        '''
+        nbytes = self._freeze(value)
+        if nbytes > self.max_bytes:
+            return
+        if key in self._entries:
+            self.current_bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (value, nbytes)
+        self.current_bytes += nbytes
+
+        while len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes:
+            _, (_, evicted_bytes) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted_bytes
+            self.evictions += 1
+
+    def clear(self):
+        '''
+        Drop every entry, e.g. when the recipe catalog changes
+        '''
+        self._entries.clear()
+        self.current_bytes = 0
+
+    def stats(self):
+        '''
+        Hit/miss counters and current size
+        '''
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'bytes': self.current_bytes
+        }
+
+    def _freeze(self, value):
+        # Mark arrays read-only and add up their size
+        if isinstance(value, np.ndarray):
+            value.setflags(write=False)
+            return value.nbytes
+        if isinstance(value, dict):
+            return sum(self._freeze(item) for item in value.values())
+        return 0
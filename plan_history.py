@@ -0,0 +1,191 @@
+import datetime
+import json
+import sqlite3
+from typing import Dict
+
+# Slot order within a day (ContentBasedRecommender.MEAL_TYPES), used to sort meals from most to least recent
+MEAL_SLOTS = ['breakfast', 'lunch', 'dinner', 'snack']
+
+
+class PlanHistoryStore:
+    '''
+    SQLite store of every generated plan and every piece of feedback per user
+
+    Meals are kept in a WITHOUT ROWID table clustered on (user_id,
+    meal_date, ...), so a user's last N days are one contiguous range read
+    however many rows the table holds. Meal and feedback writes are buffered
+    and committed in batches, so bulk regeneration costs one transaction per
+    plan and batch instead of one per meal. Reads flush the buffer first, so they always see
+    everything recorded before them.
+    '''
+    def __init__(self, db_path: str = 'plan_history.db', batch_size: int = 5000):
+        '''
+        Args:
+            db_path: SQLite database file, ':memory:' for a throwaway store
+            batch_size: Buffered rows that trigger a commit
+        '''
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self._create_tables()
+        self._pending_meals = []
+        self._pending_feedback = []
+
+    def _create_tables(self):
+        with self.connection:
+            self.connection.execute('''
+                CREATE TABLE IF NOT EXISTS plans (
+                    plan_id INTEGER PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    start_date TEXT NOT NULL,
+                    days INTEGER NOT NULL,
+                    summary TEXT
+                )''')
+            self.connection.execute('''
+                CREATE TABLE IF NOT EXISTS plan_meals (
+                    user_id TEXT NOT NULL,
+                    meal_date TEXT NOT NULL,
+                    slot INTEGER NOT NULL,
+                    plan_id INTEGER NOT NULL,
+                    meal_type TEXT NOT NULL,
+                    recipe_name TEXT NOT NULL,
+                    calories REAL,
+                    PRIMARY KEY (user_id, meal_date, slot, plan_id)
+                ) WITHOUT ROWID''')
+            self.connection.execute('''
+                CREATE TABLE IF NOT EXISTS feedback (
+                    user_id TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    feedback TEXT NOT NULL
+                )''')
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS feedback_user_date ON feedback (user_id, created_at)'
+            )
+            self.connection.execute('CREATE INDEX IF NOT EXISTS plans_user_date ON plans (user_id, start_date)')
+
+    def record_plan(self, user_id, meal_plan: Dict, start_date: datetime.date = None,
+                    nutrition_summary: Dict = None):
+        '''
+        Record a generated plan, day_1 falling on start_date (today by default)
+
+        Returns:
+            ID of the stored plan
+        '''
+        start_date = start_date or datetime.date.today()
+        # Plan rows are committed right away so the returned plan ID is durable and no write
+        # lock is held until the next flush, only the meals are buffered
+        with self.connection:
+            cursor = self.connection.execute(
+                'INSERT INTO plans (user_id, created_at, start_date, days, summary) VALUES (?, ?, ?, ?, ?)',
+                (str(user_id), datetime.datetime.now().isoformat(timespec='seconds'), start_date.isoformat(),
+                 len(meal_plan), json.dumps(nutrition_summary) if nutrition_summary is not None else None)
+            )
+        plan_id = cursor.lastrowid
+
+        for day_key, daily_meals in meal_plan.items():
+            meal_date = (start_date + datetime.timedelta(days=int(day_key.split('_')[1]) - 1)).isoformat()
+            for slot, meal_type in enumerate(MEAL_SLOTS):
+                meal = daily_meals.get(meal_type)
+                if meal is None:
+                    continue
+                self._pending_meals.append(
+                    (str(user_id), meal_date, slot, plan_id, meal_type, meal['name'], meal.get('calories'))
+                )
+        self._flush_if_full()
+        return plan_id
+
+    def record_feedback(self, user_id, feedback: Dict, created_at: datetime.datetime = None):
+        '''
+        Record a piece of user feedback
+        '''
+        created_at = created_at or datetime.datetime.now()
+        self._pending_feedback.append(
+            (str(user_id), created_at.isoformat(timespec='seconds'), json.dumps(feedback, default=str))
+        )
+        self._flush_if_full()
+
+    def _flush_if_full(self):
+        if len(self._pending_meals) + len(self._pending_feedback) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        '''
+        Commit every buffered row in one transaction
+        '''
+        with self.connection:
+            if self._pending_meals:
+                self.connection.executemany(
+                    'INSERT OR REPLACE INTO plan_meals '
+                    '(user_id, meal_date, slot, plan_id, meal_type, recipe_name, calories) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    self._pending_meals
+                )
+            if self._pending_feedback:
+                self.connection.executemany(
+                    'INSERT INTO feedback (user_id, created_at, feedback) VALUES (?, ?, ?)', self._pending_feedback
+                )
+        self._pending_meals = []
+        self._pending_feedback = []
+
+    def get_meals(self, user_id, start_date: datetime.date, end_date: datetime.date):
+        '''
+        Meals of a user between two dates (inclusive), latest plan only for each slot
+
+        Returns:
+            List of dictionaries with meal_date, meal_type, recipe_name, calories and plan_id, oldest first
+        '''
+        self.flush()
+        rows = self.connection.execute(
+            'SELECT meal_date, slot, plan_id, meal_type, recipe_name, calories FROM plan_meals '
+            'WHERE user_id = ? AND meal_date BETWEEN ? AND ? ORDER BY meal_date, slot, plan_id',
+            (str(user_id), start_date.isoformat(), end_date.isoformat())
+        ).fetchall()
+
+        # A newer plan covering the same day replaces the older one's meals
+        latest = {}
+        for meal_date, slot, plan_id, meal_type, recipe_name, calories in rows:
+            latest[(meal_date, slot)] = {
+                'meal_date': meal_date,
+                'meal_type': meal_type,
+                'recipe_name': recipe_name,
+                'calories': calories,
+                'plan_id': plan_id
+            }
+        return list(latest.values())
+
+    def get_recent_recipes(self, user_id, days: int = 14, until: datetime.date = None):
+        '''
+        Recipe names the user was planned in the last days up to until (today by default)
+
+        Returns:
+            List of recipe names, most recent first, as expected by generate_meal_plan's recent_recipes
+        '''
+        until = until or datetime.date.today()
+        meals = self.get_meals(user_id, until - datetime.timedelta(days=days - 1), until)
+        return [meal['recipe_name'] for meal in reversed(meals)]
+
+    def get_feedback(self, user_id, start: datetime.datetime = None, end: datetime.datetime = None):
+        '''
+        Feedback of a user between two times (inclusive), oldest first
+        '''
+        self.flush()
+        start = (start or datetime.datetime.min).isoformat(timespec='seconds')
+        end = (end or datetime.datetime.max).isoformat(timespec='seconds')
+        rows = self.connection.execute(
+            'SELECT created_at, feedback FROM feedback WHERE user_id = ? AND created_at BETWEEN ? AND ? '
+            'ORDER BY created_at',
+            (str(user_id), start, end)
+        ).fetchall()
+        return [{'created_at': created_at, 'feedback': json.loads(feedback)} for created_at, feedback in rows]
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
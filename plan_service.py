@@ -0,0 +1,384 @@
+'''
+Local HTTP planning service
+
+Keeps the recipe catalog warm in a pool of worker processes and serves
+meal plans as JSON, so a plan costs the planning and not the cold start.
+
+Usage:
+    python plan_service.py --csv new_recipe_set.csv --port 8080 --workers 4
+
+    curl -X POST localhost:8080/plan -d '{"profile": {"age": 30, "gender": "male", "height": 175,
+        "weight": 75, "activity_level": "moderately_active", "weight_goal": "loss"}, "days": 7}'
+'''
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict
+
+from content_based_recommender import ContentBasedRecommender, check_portion_range
+from parallel_planner import get_worker_recommender, init_worker
+from profile_validation import DAYS_RANGE, MIN_RECIPE_REPEATS, validate_profile
+from recipe_catalog import RecipeCatalog
+
+# Largest request body accepted, a profile is a few hundred bytes
+MAX_BODY_BYTES = 1 << 20
+
+# Most swap alternates a request may ask for per meal
+MAX_ALTERNATES = 10
+
+# Longest wait for a client to stop sending after an error response that left its request unread
+LINGER_SECONDS = 2.0
+
+HTTP_REASONS = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    413: 'Payload Too Large', 431: 'Request Header Fields Too Large', 500: 'Internal Server Error'
+}
+
+# Used to warm each worker's caches and lazily built indexes up before the first request
+WARMUP_PROFILE = {
+    'age': 30, 'gender': 'male', 'height': 175, 'weight': 75,
+    'activity_level': 'moderately_active', 'weight_goal': 'maintain'
+}
+
+
+def _warm_up():
+    get_worker_recommender().generate_meal_plan(WARMUP_PROFILE, days=1)
+    return os.getpid()
+
+
+def _plan_request(request: Dict):
+    '''
+    Plan one request inside a worker process
+
+    Returns:
+        The response body, encoded here so the event loop does not spend time on it
+    '''
+    recommender = get_worker_recommender()
+    profile = request['profile']
+    rng = None
+    if request.get('seed') is not None:
+        rng = recommender.get_user_rng(request['seed'], profile.get('user_id', 0))
+    meal_plan, nutrition_summary = recommender.generate_meal_plan(
+        profile, days=request['days'], max_recipe_repeats=request['max_recipe_repeats'], rng=rng,
+        planner=request['planner'], ingredient_diversity=request['ingredient_diversity'],
+        alternates=request['alternates']
+    )
+    response = {'meal_plan': meal_plan, 'nutrition_summary': nutrition_summary}
+    if request['shopping_list']:
+        response['shopping_list'] = recommender.get_shopping_list(meal_plan)
+    return json.dumps(response).encode('utf-8')
+
+
+def _is_integer(value):
+    # JSON true/false arrive as bool, which is a subclass of int
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_content_length(value: str):
+    '''
+    Body length from a Content-Length header value, 0 when the header is missing
+
+    Raises:
+        ValueError: When the value is not a non-negative decimal integer
+    '''
+    value = value.strip()
+    if not value:
+        return 0
+    # int() would also take signs, underscores and non-ASCII digits
+    if not (value.isascii() and value.isdigit()):
+        raise ValueError(f'Invalid Content-Length {value!r}')
+    return int(value)
+
+
+def parse_plan_request(body: bytes):
+    '''
+    Parse and check the JSON body of a plan request
+
+    The body is either {"profile": {...}, "days": ..., ...} or a bare profile,
+    checked with validate_profile.
+
+    Returns:
+        Dictionary with profile, days, max_recipe_repeats, planner, seed, ingredient_diversity,
+        alternates and shopping_list
+
+    Raises:
+        ValueError: When the body is not a valid plan request
+    '''
+    try:
+        payload = json.loads(body or b'{}')
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f'Invalid JSON: {e}')
+    if not isinstance(payload, dict):
+        raise ValueError('Expected a JSON object')
+
+    profile = payload.get('profile', payload)
+    if not isinstance(profile, dict):
+        raise ValueError("'profile' must be an object")
+    profile, errors = validate_profile(profile)
+    if errors:
+        raise ValueError('; '.join(errors))
+
+    request = {
+        'profile': profile,
+        'days': payload.get('days', 7),
+        'max_recipe_repeats': payload.get('max_recipe_repeats', 3),
+        'planner': payload.get('planner', 'greedy'),
+        'seed': payload.get('seed'),
+        'ingredient_diversity': payload.get('ingredient_diversity', 0.0),
+        'alternates': payload.get('alternates', 0),
+        'shopping_list': payload.get('shopping_list', False)
+    }
+    if not _is_integer(request['days']) or not DAYS_RANGE[0] <= request['days'] <= DAYS_RANGE[1]:
+        raise ValueError(f"'days' must be an integer between {DAYS_RANGE[0]} and {DAYS_RANGE[1]}")
+    if not _is_integer(request['max_recipe_repeats']) or request['max_recipe_repeats'] < MIN_RECIPE_REPEATS:
+        raise ValueError("'max_recipe_repeats' must be a positive integer")
+    if request['planner'] not in ('greedy', 'optimized'):
+        raise ValueError("'planner' must be 'greedy' or 'optimized'")
+    if request['seed'] is not None and not _is_integer(request['seed']):
+        raise ValueError("'seed' must be an integer")
+    if (isinstance(request['ingredient_diversity'], bool) or not isinstance(request['ingredient_diversity'], (int, float))
+            or not 0 <= request['ingredient_diversity'] <= 1):
+        raise ValueError("'ingredient_diversity' must be between 0 and 1")
+    if not _is_integer(request['alternates']) or not 0 <= request['alternates'] <= MAX_ALTERNATES:
+        raise ValueError(f"'alternates' must be an integer between 0 and {MAX_ALTERNATES}")
+    if not isinstance(request['shopping_list'], bool):
+        raise ValueError("'shopping_list' must be true or false")
+    return request
+
+
+class PlanService:
+    '''
+    Asyncio HTTP server handing meal planning to a process pool
+
+    The catalog is built once by the parent and memory-mapped read-only by
+    every worker, which keeps its recommender (candidate cache and lazily
+    built indexes included) for its whole life. The event loop only parses
+    requests and waits on the pool, so it keeps accepting connections while
+    every worker is busy. Connections are kept alive between requests.
+
+    Endpoints:
+        GET /health: service and catalog status
+        POST /plan: plan request (see parse_plan_request), returns meal_plan and nutrition_summary
+            (and shopping_list when asked for)
+    '''
+    def __init__(self, csv_path: str, host: str = '127.0.0.1', port: int = 8080, workers: int = None,
+                 catalog_dir: str = None, snapshot_dir: str = None, portion_range=None):
+        '''
+        Args:
+            csv_path: Recipe CSV, its catalog is built next to it when missing or stale
+            workers: Worker processes, one per CPU by default
+            snapshot_dir: Recommender snapshot the workers load instead of the catalog,
+                saved from the catalog when missing or stale
+            portion_range: (min, max) servings meals are scaled within to hit their calorie targets
+
+        Raises:
+            ValueError: When portion_range is not a (min, max) pair with 0 < min <= max
+        '''
+        self.catalog = RecipeCatalog(csv_path, catalog_dir)
+        self.snapshot_dir = snapshot_dir
+        # Checked here, so a bad range fails before any worker starts
+        self.portion_range = check_portion_range(portion_range)
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = None
+        self.server = None
+        self.catalog_meta = None
+        self.started_at = None
+        self.requests_served = 0
+
+    async def start(self):
+        '''
+        Build the catalog if needed, start and warm the workers, then listen
+        '''
+        self.catalog_meta = self.catalog.build() if self.catalog.is_stale() else self.catalog.read_meta()
+        if self.snapshot_dir is not None:
+            ContentBasedRecommender.from_snapshot(self.snapshot_dir, catalog=self.catalog)
+        self.executor = ProcessPoolExecutor(
+            self.workers, initializer=init_worker,
+            initargs=(self.catalog.csv_path, self.catalog.catalog_dir, self.snapshot_dir, self.portion_range)
+        )
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.executor, _warm_up) for _ in range(self.workers)))
+
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.started_at = time.time()
+        return self
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    async def serve_forever(self):
+        '''
+        Serve until SIGINT or SIGTERM, then stop listening and shut the workers down
+        '''
+        await self.start()
+        print(f'Serving meal plans on http://{self.host}:{self.port} with {self.workers} workers', file=sys.stderr)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signal_number, stop.set)
+        try:
+            await stop.wait()
+        finally:
+            await self.close()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        '''
+        Serve the requests of one connection until the client closes it or asks to
+        '''
+        try:
+            while True:
+                # readline raises ValueError past the reader's line limit (64 KiB by default)
+                try:
+                    request_line = await reader.readline()
+                except ValueError:
+                    await self.send(writer, 400, {'error': 'Request line too long'}, keep_alive=False)
+                    await self.discard_input(reader, writer)
+                    break
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self.send(writer, 400, {'error': 'Malformed request line'}, keep_alive=False)
+                    break
+
+                headers = {}
+                try:
+                    while True:
+                        line = await reader.readline()
+                        if line in (b'\r\n', b'\n', b''):
+                            break
+                        name, _, value = line.decode('latin-1').partition(':')
+                        headers[name.strip().lower()] = value.strip()
+                except ValueError:
+                    await self.send(writer, 431, {'error': 'Header line too long'}, keep_alive=False)
+                    await self.discard_input(reader, writer)
+                    break
+
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+
+                try:
+                    length = parse_content_length(headers.get('content-length', ''))
+                except ValueError:
+                    await self.send(writer, 400, {'error': 'Invalid Content-Length'}, keep_alive=False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self.send(writer, 413, {'error': f'Body larger than {MAX_BODY_BYTES} bytes'}, keep_alive=False)
+                    await self.discard_input(reader, writer)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                status, payload = await self.route(method, path.split('?', 1)[0], body)
+                await self.send(writer, status, payload, keep_alive=keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def discard_input(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        '''
+        Read and drop the rest of a request an error response was sent for
+
+        Closing a socket with unread input resets the connection, which can
+        discard the response before the client reads it. The write side is
+        shut first, so the client sees the end of the response and closes.
+        '''
+        if writer.can_write_eof():
+            writer.write_eof()
+
+        async def drain():
+            while await reader.read(1 << 16):
+                pass
+
+        try:
+            await asyncio.wait_for(drain(), LINGER_SECONDS)
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+
+    async def route(self, method: str, path: str, body: bytes):
+        '''
+        Returns:
+            Tuple of (HTTP status, JSON-serializable payload or already encoded bytes)
+        '''
+        if path == '/health':
+            if method != 'GET':
+                return 405, {'error': 'Use GET'}
+            return 200, self.health()
+        if path == '/plan':
+            if method != 'POST':
+                return 405, {'error': 'Use POST'}
+            try:
+                request = parse_plan_request(body)
+            except ValueError as e:
+                return 400, {'error': str(e)}
+            try:
+                response = await asyncio.get_running_loop().run_in_executor(self.executor, _plan_request, request)
+            except (KeyError, ValueError, TypeError) as e:
+                return 400, {'error': f'Could not plan for this profile: {e}'}
+            except Exception as e:
+                return 500, {'error': f'{type(e).__name__}: {e}'}
+            self.requests_served += 1
+            return 200, response
+        return 404, {'error': f'No route for {path}'}
+
+    def health(self):
+        return {
+            'status': 'ok',
+            'recipes': self.catalog_meta['rows'],
+            'catalog_version': self.catalog.get_version(self.catalog_meta),
+            'workers': self.workers,
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'plans_served': self.requests_served
+        }
+
+    async def send(self, writer: asyncio.StreamWriter, status: int, payload, keep_alive: bool = True):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+        head = (
+            f'HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n'
+            'Content-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve meal plans over HTTP on localhost')
+    parser.add_argument('--csv', default='new_recipe_set.csv', help='Recipe CSV, its catalog is built next to it')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes, one per CPU by default')
+    parser.add_argument('--snapshot', default=None, help='Recommender snapshot directory the workers start from')
+    parser.add_argument('--portion-range', type=float, nargs=2, default=None, metavar=('MIN', 'MAX'),
+                        help='Scale meals between MIN and MAX servings to hit their calorie targets, e.g. 0.5 2')
+    args = parser.parse_args()
+    try:
+        check_portion_range(args.portion_range)
+    except ValueError as error:
+        parser.error(str(error))
+
+    service = PlanService(args.csv, host=args.host, port=args.port, workers=args.workers, snapshot_dir=args.snapshot,
+                          portion_range=args.portion_range)
+    asyncio.run(service.serve_forever())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict
+
+
+class PlannerStats:
+    '''
+    Opt-in instrumentation for the meal planner
+
+    Accumulates per-phase timings (filter, window, score, penalty, select,
+    retry, optimize) and counters such as window fallbacks, relaxed allergy
+    filtering and max-repeat retries. An optional hook is called with
+    (event, details) whenever a counter changes, e.g. to forward events to
+    a metrics system.
+    '''
+    enabled = True
+
+    def __init__(self, hook: Callable[[str, Dict], None] = None):
+        self.hook = hook
+        self.timings = defaultdict(float)
+        self.counters = defaultdict(int)
+
+    @contextmanager
+    def timer(self, phase: str):
+        '''
+        Context manager adding the elapsed time of the block to a phase
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[phase] += time.perf_counter() - start
+
+    def count(self, event: str, amount: int = 1, **details):
+        '''
+        Increase a counter and notify the hook
+        '''
+        self.counters[event] += amount
+        if self.hook is not None:
+            self.hook(event, details)
+
+    def merge(self, other: Dict):
+        '''
+        Add the timings and counters of another stats dictionary (see as_dict)
+        '''
+        for phase, seconds in other.get('timings', {}).items():
+            self.timings[phase] += seconds
+        for event, amount in other.get('counters', {}).items():
+            self.counters[event] += amount
+
+    def as_dict(self):
+        '''
+        Plain dictionary of the collected timings (seconds) and counters
+        '''
+        return {
+            'timings': {phase: round(seconds, 6) for phase, seconds in self.timings.items()},
+            'counters': dict(self.counters)
+        }
+
+
+class NullStats(PlannerStats):
+    '''
+    Stats that record nothing, used when instrumentation is off
+    '''
+    enabled = False
+
+    def __init__(self):
+        super().__init__()
+
+    def timer(self, phase: str):
+        return nullcontext()
+
+    def count(self, event: str, amount: int = 1, **details):
+        pass
+
+
+NULL_STATS = NullStats()
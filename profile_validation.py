@@ -0,0 +1,98 @@
+import math
+from typing import Dict
+
+from recipe_catalog import ALLERGENS
+
+# Same limits main.py prompts with
+AGE_RANGE = (15, 100)
+HEIGHT_RANGE = (50, 300)
+WEIGHT_RANGE = (10, 500)
+GENDERS = ['male', 'female']
+ACTIVITY_LEVELS = ['sedentary', 'lightly_active', 'moderately_active', 'very_active']
+WEIGHT_GOALS = ['loss', 'gain', 'maintain']
+DIETARY_PREFS = ['vegan', 'vegetarian', 'non-veg']
+
+# Plan length and repeat limit accepted by the service and the bulk planner
+DAYS_RANGE = (1, 31)
+MIN_RECIPE_REPEATS = 1
+
+
+def parse_allergies(value):
+    '''
+    Allergy list from a list or a string such as 'gluten, nuts', 'gluten;dairy' or "['nuts']"
+    '''
+    if value is None:
+        return []
+    if isinstance(value, str):
+        for separator in '[]\'";|':
+            value = value.replace(separator, ',')
+        value = value.split(',')
+    allergies = [str(allergy).strip().lower() for allergy in value]
+    return [allergy for allergy in allergies if allergy and allergy != 'none']
+
+
+def validate_profile(raw_profile: Dict):
+    '''
+    Check a user profile against the rules of the interactive prompts
+
+    Numbers may be given as strings (e.g. read from a CSV). dietary_pref
+    defaults to 'non-veg' and allergies to none. target_calories is optional
+    and must be positive when given. Other fields (user_id,
+    recent_recipes, ...) are passed through.
+
+    Returns:
+        Tuple of (normalized profile, list of error messages), the profile is only usable when there are no errors
+    '''
+    profile = dict(raw_profile)
+    errors = []
+
+    for field, (low, high), whole in [('age', AGE_RANGE, True), ('height', HEIGHT_RANGE, False),
+                                      ('weight', WEIGHT_RANGE, False)]:
+        value = raw_profile.get(field)
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            errors.append(f'{field} must be a number, got {value!r}')
+            continue
+        if whole and not number.is_integer():
+            errors.append(f'{field} must be a whole number, got {value!r}')
+        elif not low <= number <= high:
+            errors.append(f'{field} must be between {low} and {high}, got {value!r}')
+        else:
+            profile[field] = int(number) if number.is_integer() else number
+
+    for field, choices, default in [('gender', GENDERS, None), ('activity_level', ACTIVITY_LEVELS, None),
+                                    ('weight_goal', WEIGHT_GOALS, None), ('dietary_pref', DIETARY_PREFS, 'non-veg')]:
+        value = raw_profile.get(field)
+        if value is None or value == '':
+            if default is None:
+                errors.append(f'{field} is required')
+                continue
+            value = default
+        value = str(value).strip().lower()
+        if value not in choices:
+            errors.append(f"{field} must be one of {', '.join(choices)}, got {raw_profile.get(field)!r}")
+        else:
+            profile[field] = value
+
+    # Optional override of the computed daily target, the plan's calorie variance is relative to it
+    value = raw_profile.get('target_calories')
+    if isinstance(value, str) and not value.strip():
+        # Empty CSV cell
+        profile['target_calories'] = None
+    elif value is not None:
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            number = None
+        if isinstance(value, bool) or number is None or not 0 < number < math.inf:
+            errors.append(f'target_calories must be a positive number, got {value!r}')
+        else:
+            profile['target_calories'] = number
+
+    allergies = parse_allergies(raw_profile.get('allergies'))
+    unknown = [allergy for allergy in allergies if allergy not in ALLERGENS]
+    if unknown:
+        errors.append(f"allergies must be among {', '.join(ALLERGENS)}, got {', '.join(unknown)}")
+    profile['allergies'] = allergies
+    return profile, errors
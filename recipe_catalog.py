@@ -0,0 +1,421 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+from typing import TYPE_CHECKING, Dict, List
+
+import numpy as np
+
+# pandas is imported inside the functions that parse or assemble frames,
+# loading catalog arrays and reading text needs only NumPy
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Bump whenever the on-disk layout changes so old catalogs get rebuilt
+CATALOG_VERSION = 3
+
+# 64-bit FNV-1a parameters of hash_names
+FNV_OFFSET_BASIS = np.uint64(0xcbf29ce484222325)
+FNV_PRIME = np.uint64(0x100000001b3)
+
+# Rows parsed per CSV chunk while building, bounds the build's peak memory
+DEFAULT_CHUNK_SIZE = 50000
+
+# Allergens that get their own boolean '<allergen>_free' column
+ALLERGENS = ['gluten', 'dairy', 'nuts']
+
+NUTRIENT_COLUMNS = ['calories', 'carbs', 'fats', 'fiber', 'protein', 'sugar', 'cholesterol']
+CATEGORICAL_COLUMNS = ['category', 'meal_type']
+TEXT_COLUMNS = ['name', 'ingredients', 'instructions', 'allergies_free']
+# Text kept out of the recommender's working frame, read per recipe through FrameText/CatalogText
+LONG_TEXT_COLUMNS = ['ingredients', 'instructions', 'allergies_free']
+FLAG_COLUMNS = [f'{allergen}_free' for allergen in ALLERGENS]
+
+# Column order of the source CSV, flags are appended at the end
+SOURCE_COLUMNS = ['name', 'ingredients', 'instructions', 'category', 'calories', 'carbs', 'fats',
+                  'fiber', 'protein', 'sugar', 'cholesterol', 'meal_type', 'allergies_free']
+
+
+def normalize_recipes(recipes_df: pd.DataFrame):
+    '''
+    Normalize a raw recipe DataFrame into typed columns
+
+    - category and meal_type become lowercase categoricals
+    - nutrients become float64
+    - allergies_free (a stringified list) is parsed once into boolean
+      '<allergen>_free' flags
+
+    Frames that already carry the flag columns are returned unchanged.
+    '''
+    import pandas as pd
+
+    if all(column in recipes_df.columns for column in FLAG_COLUMNS):
+        return recipes_df
+
+    normalized = recipes_df.copy()
+    for column in CATEGORICAL_COLUMNS:
+        if column in normalized.columns:
+            normalized[column] = normalized[column].fillna('').astype(str).str.strip().str.lower().astype('category')
+    for column in NUTRIENT_COLUMNS:
+        if column in normalized.columns:
+            normalized[column] = pd.to_numeric(normalized[column], errors='coerce').astype(np.float64)
+
+    # Same substring semantics the filters used on the raw string
+    allergies_free = normalized.get('allergies_free', pd.Series('', index=normalized.index)).fillna('').astype(str)
+    for allergen in ALLERGENS:
+        normalized[f'{allergen}_free'] = allergies_free.str.contains(f'{allergen}-free', regex=False).to_numpy(dtype=bool)
+    return normalized
+
+
+def hash_names(names):
+    '''
+    Stable 64-bit hash of each recipe name
+
+    Recipes are grouped by name for variety tracking. Hashes let the catalog
+    store that grouping as a fixed-width column instead of keeping every name
+    in memory, and are the same in every process and on every run.
+    Missing names (None or NaN) hash like ''. Only NumPy is used, so looking
+    recent recipes up by name does not import pandas.
+    '''
+    values = [
+        name if isinstance(name, str) else ('' if name is None or name != name else str(name)) for name in names
+    ]
+    return _hash_text(*_encode_text(values))
+
+
+def _hash_text(data: np.ndarray, offsets: np.ndarray):
+    # FNV-1a over the UTF-8 bytes of every string at once, one pass per byte position
+    starts = offsets[:-1]
+    lengths = np.diff(offsets)
+    hashes = np.full(len(lengths), FNV_OFFSET_BASIS, dtype=np.uint64)
+    for position in range(int(lengths.max(initial=0))):
+        active = np.flatnonzero(lengths > position)
+        hashes[active] = (hashes[active] ^ data[starts[active] + position]) * FNV_PRIME
+    return hashes
+
+
+class CatalogText:
+    '''
+    Lazy access to the text columns of a loaded catalog
+
+    The UTF-8 blobs stay memory-mapped, a field is only decoded when it is
+    asked for, so the text never has to fit in memory.
+    '''
+    def __init__(self, arrays: Dict):
+        self.arrays = arrays
+
+    def get(self, recipe_id: int, column: str):
+        '''
+        Text of one column for one recipe
+        '''
+        offsets = self.arrays[f'{column}.offsets']
+        start, end = int(offsets[recipe_id]), int(offsets[recipe_id + 1])
+        return self.arrays[f'{column}.data'][start:end].tobytes().decode('utf-8')
+
+    def column(self, column: str):
+        '''
+        Decode a whole text column as a list of strings
+        '''
+        return _decode_text(self.arrays[f'{column}.data'], self.arrays[f'{column}.offsets'])
+
+    def slice(self, column: str, start: int, stop: int):
+        '''
+        Decode the texts of recipes start to stop-1, e.g. to process a column in chunks
+        '''
+        offsets = self.arrays[f'{column}.offsets'][start:stop + 1]
+        data = self.arrays[f'{column}.data'][int(offsets[0]):int(offsets[-1])] if len(offsets) else np.empty(0, dtype=np.uint8)
+        return _decode_text(data, offsets - offsets[0]) if len(offsets) else []
+
+
+class FrameText:
+    '''
+    Text columns split off a recipe DataFrame, with the same interface as CatalogText
+    '''
+    def __init__(self, recipes_df: pd.DataFrame, columns: List[str] = TEXT_COLUMNS):
+        self.n_recipes = len(recipes_df)
+        self.values = {
+            column: recipes_df[column].to_numpy(dtype=object) for column in columns if column in recipes_df.columns
+        }
+
+    def get(self, recipe_id: int, column: str):
+        '''
+        Text of one column for one recipe, '' when the frame had no such column
+        '''
+        values = self.values.get(column)
+        return '' if values is None else values[recipe_id]
+
+    def column(self, column: str):
+        '''
+        A whole text column as a list
+        '''
+        values = self.values.get(column)
+        return [''] * self.n_recipes if values is None else values.tolist()
+
+    def slice(self, column: str, start: int, stop: int):
+        '''
+        Texts of recipes start to stop-1
+        '''
+        values = self.values.get(column)
+        return [''] * len(range(self.n_recipes)[start:stop]) if values is None else values[start:stop].tolist()
+
+
+def _encode_text(values: List[str]):
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return data, offsets
+
+
+def _decode_text(data: np.ndarray, offsets: np.ndarray):
+    blob = data.tobytes()
+    return [blob[start:end].decode('utf-8') for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+def arrays_to_frame(arrays: Dict, categories: Dict, text_columns: List[str] = TEXT_COLUMNS):
+    '''
+    Assemble a normalized recipe DataFrame from columns in the catalog layout
+
+    Args:
+        arrays: Arrays keyed by catalog file name (nutrients, '<column>.codes', flags, text blobs)
+        categories: Category labels of each categorical column, indexed by code
+        text_columns: Text columns to decode into the frame, the others are
+            left out (read them through CatalogText instead)
+    '''
+    import pandas as pd
+
+    columns = {}
+    for column in SOURCE_COLUMNS:
+        if column in TEXT_COLUMNS:
+            if column in text_columns:
+                columns[column] = _decode_text(arrays[f'{column}.data'], arrays[f'{column}.offsets'])
+        elif column in CATEGORICAL_COLUMNS:
+            columns[column] = pd.Categorical.from_codes(arrays[f'{column}.codes'], categories=categories[column])
+        else:
+            columns[column] = arrays[column]
+    for column in FLAG_COLUMNS:
+        columns[column] = arrays[column]
+    return pd.DataFrame(columns)
+
+
+class _ColumnSpool:
+    '''
+    Appends a 1-D column chunk by chunk to disk and finishes it as a .npy file
+    '''
+    def __init__(self, path: str, dtype):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.rows = 0
+        self._part = open(path + '.part', 'wb')
+
+    def append(self, values: np.ndarray):
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        self._part.write(values.tobytes())
+        self.rows += len(values)
+
+    def discard(self):
+        # Drop whatever was spooled, e.g. when the build fails
+        self._part.close()
+        for path in (self.path + '.part', self.path + '.tmp'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def finish(self):
+        # The row count is only known now, so the header is written in front of the spooled data
+        self._part.close()
+        header = {'descr': np.lib.format.dtype_to_descr(self.dtype), 'fortran_order': False, 'shape': (self.rows,)}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f, open(self.path + '.part', 'rb') as part:
+            np.lib.format.write_array_header_2_0(f, header)
+            shutil.copyfileobj(part, f)
+        os.remove(self.path + '.part')
+        os.replace(tmp_path, self.path)
+
+
+class RecipeCatalog:
+    '''
+    Precompiled, columnar copy of a recipe CSV
+
+    The CSV stays the source of truth. The catalog is a directory of .npy
+    files next to it (numeric columns, categorical codes, allergen flags and
+    UTF-8 text blobs with offsets) plus a meta.json recording which version
+    of the CSV it was built from. Every file can be memory-mapped, so loading
+    it skips CSV parsing entirely.
+
+    The CSV is read in chunks while building, so catalogs much larger than
+    memory can be built. The text files are always memory-mapped when
+    loading, see CatalogText.
+    '''
+    def __init__(self, csv_path: str, catalog_dir: str = None):
+        self.csv_path = csv_path
+        if catalog_dir is None:
+            catalog_dir = os.path.splitext(csv_path)[0] + '.catalog'
+        self.catalog_dir = catalog_dir
+
+    def source_signature(self):
+        '''
+        Size and modification time of the CSV, used to detect changes
+        '''
+        stat = os.stat(self.csv_path)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def read_meta(self):
+        '''
+        Returns the catalog metadata or None when no catalog was built yet
+        '''
+        meta_path = os.path.join(self.catalog_dir, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def get_version(self, meta: Dict):
+        '''
+        String identifying the CSV version a catalog was built from
+        '''
+        source = meta['source']
+        return f"{meta['version']}-{source['size']}-{source['mtime_ns']}"
+
+    def is_stale(self):
+        '''
+        True when the catalog is missing, outdated or built from another CSV version
+        '''
+        meta = self.read_meta()
+        if meta is None or meta.get('version') != CATALOG_VERSION:
+            return True
+        return meta.get('source') != self.source_signature()
+
+    def build(self, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        '''
+        Parse the CSV once, chunk by chunk, and write the columnar catalog
+
+        Args:
+            chunk_size: Rows parsed at a time, peak memory grows with this and not with the CSV size
+
+        Returns:
+            Catalog metadata
+
+        Raises:
+            OSError: When the CSV cannot be opened, nothing is written then
+        '''
+        # Fail before anything is created when the CSV is missing or unreadable
+        with open(self.csv_path, 'rb'):
+            pass
+
+        created_dir = not os.path.isdir(self.catalog_dir)
+        os.makedirs(self.catalog_dir, exist_ok=True)
+
+        # Remove the marker first so a half-written catalog is never loaded
+        meta_path = os.path.join(self.catalog_dir, 'meta.json')
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+
+        spools = {}
+        try:
+            return self._build(spools, meta_path, chunk_size)
+        except BaseException:
+            # No spool files are left behind, nor the directory when this build created it
+            for spool in spools.values():
+                spool.discard()
+            if created_dir:
+                shutil.rmtree(self.catalog_dir, ignore_errors=True)
+            raise
+
+    def _build(self, spools: Dict, meta_path: str, chunk_size: int):
+        import pandas as pd
+
+        spools.update({column: self._spool(column, np.float64) for column in NUTRIENT_COLUMNS})
+        spools.update({f'{column}.codes': self._spool(f'{column}.codes', np.int16) for column in CATEGORICAL_COLUMNS})
+        spools.update({column: self._spool(column, bool) for column in FLAG_COLUMNS})
+        spools['name.hash'] = self._spool('name.hash', np.uint64)
+        for column in TEXT_COLUMNS:
+            spools[f'{column}.data'] = self._spool(f'{column}.data', np.uint8)
+            spools[f'{column}.offsets'] = self._spool(f'{column}.offsets', np.int64)
+            spools[f'{column}.offsets'].append(np.zeros(1))
+
+        # Categories get global codes in the order they are first seen
+        categories = {column: {} for column in CATEGORICAL_COLUMNS}
+        text_bytes = {column: 0 for column in TEXT_COLUMNS}
+        rows = 0
+        for chunk in pd.read_csv(self.csv_path, chunksize=chunk_size):
+            chunk = normalize_recipes(chunk)
+
+            for column in NUTRIENT_COLUMNS:
+                values = chunk[column] if column in chunk.columns else pd.Series(np.nan, index=chunk.index)
+                spools[column].append(values.to_numpy(dtype=np.float64))
+
+            for column in CATEGORICAL_COLUMNS:
+                seen = categories[column]
+                mapping = np.array([seen.setdefault(str(c), len(seen)) for c in chunk[column].cat.categories], dtype=np.int16)
+                local_codes = chunk[column].cat.codes.to_numpy()
+                codes = np.full(len(chunk), -1, dtype=np.int16)
+                codes[local_codes >= 0] = mapping[local_codes[local_codes >= 0]]
+                spools[f'{column}.codes'].append(codes)
+
+            for column in FLAG_COLUMNS:
+                spools[column].append(chunk[column].to_numpy(dtype=bool))
+
+            spools['name.hash'].append(hash_names(chunk['name']))
+
+            for column in TEXT_COLUMNS:
+                values = chunk[column] if column in chunk.columns else pd.Series('', index=chunk.index)
+                data, offsets = _encode_text(values.fillna('').astype(str).tolist())
+                spools[f'{column}.data'].append(data)
+                spools[f'{column}.offsets'].append(offsets[1:] + text_bytes[column])
+                text_bytes[column] += len(data)
+            rows += len(chunk)
+
+        for spool in spools.values():
+            spool.finish()
+
+        meta = {
+            'version': CATALOG_VERSION,
+            'source': self.source_signature(),
+            'rows': rows,
+            'categories': {column: list(seen) for column, seen in categories.items()}
+        }
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        return meta
+
+    def load_arrays(self, mmap_mode: str = None):
+        '''
+        Load the raw catalog arrays, rebuilding the catalog first if the CSV changed
+
+        Args:
+            mmap_mode: Passed to np.load for the numeric and flag columns, e.g. 'r'
+                to memory-map them read-only. Text columns are always memory-mapped
+
+        Returns:
+            Tuple of (arrays dict keyed by file name, metadata)
+        '''
+        meta = self.build() if self.is_stale() else self.read_meta()
+        arrays = {}
+        for file_name in os.listdir(self.catalog_dir):
+            if file_name.endswith('.npy'):
+                name = file_name[:-4]
+                is_text = name.endswith('.data') or name.endswith('.offsets')
+                arrays[name] = np.load(os.path.join(self.catalog_dir, file_name), mmap_mode='r' if is_text else mmap_mode)
+        return arrays, meta
+
+    def load(self):
+        '''
+        Load the catalog as a normalized recipe DataFrame
+        '''
+        arrays, meta = self.load_arrays()
+        return self.to_frame(arrays, meta)
+
+    def to_frame(self, arrays: Dict, meta: Dict, text_columns: List[str] = TEXT_COLUMNS):
+        '''
+        Assemble a normalized recipe DataFrame from loaded catalog arrays
+
+        Args:
+            text_columns: Text columns to decode into the frame, the others are
+                left out (read them through CatalogText instead)
+        '''
+        return arrays_to_frame(arrays, meta['categories'], text_columns)
+
+    def _spool(self, name: str, dtype):
+        # Finished with a rename, so processes that memory-mapped the old file keep a valid copy
+        return _ColumnSpool(os.path.join(self.catalog_dir, f'{name}.npy'), dtype)
@@ -0,0 +1,358 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Dict, List
+
+import numpy as np
+
+from recipe_catalog import ALLERGENS
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Recipe categories allowed for each dietary preference, anything else allows every category
+DIET_CATEGORIES = {
+    'vegan': ['vegan'],
+    'vegetarian': ['vegan', 'vegetarian']
+}
+
+
+class DietaryIndex:
+    '''
+    Precomputed bitsets over a normalized recipe frame
+
+    Keeps one packed bitmask per allergen-free flag, per diet category and
+    per meal type, so a user's suitable set is a handful of bitwise ANDs
+    instead of a per-row scan of the raw strings.
+    '''
+    def __init__(self, recipes_df: pd.DataFrame, min_strict_matches: int = 20, allergies_free=None):
+        '''
+        Args:
+            recipes_df: Normalized recipe frame
+            min_strict_matches: Fewest recipes free from every allergen before the filter is relaxed
+            allergies_free: Raw allergies_free strings when recipes_df has no such column,
+                as a Series or list, or a function returning one (only called for unflagged allergens)
+        '''
+        self.n_recipes = len(recipes_df)
+        self.min_strict_matches = min_strict_matches
+        self._allergies_free = allergies_free if allergies_free is not None else recipes_df['allergies_free']
+
+        self.all_bits = self._pack(np.ones(self.n_recipes, dtype=bool))
+        self.allergy_bits = {
+            allergen: self._pack(recipes_df[f'{allergen}_free'].to_numpy(dtype=bool)) for allergen in ALLERGENS
+        }
+        self.category_bits = self._pack_values(recipes_df['category'])
+        self.meal_type_bits = self._pack_values(recipes_df['meal_type'])
+
+    def to_arrays(self):
+        '''
+        Bitsets of the index as flat arrays, e.g. to save them in a snapshot
+
+        Returns:
+            Tuple of (arrays keyed by name, JSON-serializable metadata)
+        '''
+        arrays = {'all': self.all_bits}
+        meta = {'n_recipes': self.n_recipes, 'min_strict_matches': self.min_strict_matches}
+        for group, bits in [('allergy', self.allergy_bits), ('category', self.category_bits),
+                            ('meal_type', self.meal_type_bits)]:
+            meta[group] = list(bits)
+            arrays.update({f'{group}.{i}': bits[label] for i, label in enumerate(bits)})
+        return arrays, meta
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict, meta: Dict, allergies_free=None):
+        '''
+        Rebuild an index from the output of to_arrays without any recipe frame
+
+        Args:
+            allergies_free: As in __init__, needed for allergens not stored in the arrays
+        '''
+        index = cls.__new__(cls)
+        index.n_recipes = meta['n_recipes']
+        index.min_strict_matches = meta['min_strict_matches']
+        index._allergies_free = allergies_free
+        index.all_bits = arrays['all']
+        index.allergy_bits, index.category_bits, index.meal_type_bits = [
+            {label: arrays[f'{group}.{i}'] for i, label in enumerate(meta[group])}
+            for group in ['allergy', 'category', 'meal_type']
+        ]
+        return index
+
+    def _pack(self, mask: np.ndarray):
+        return np.packbits(mask)
+
+    def _pack_values(self, column: pd.Series):
+        values = column.astype(str).to_numpy()
+        return {value: self._pack(values == value) for value in np.unique(values)}
+
+    def unpack(self, bits: np.ndarray):
+        '''
+        Convert a packed bitset back into a boolean row mask
+        '''
+        return np.unpackbits(bits, count=self.n_recipes).view(bool)
+
+    def count(self, bits: np.ndarray):
+        '''
+        Number of recipes set in a packed bitset
+        '''
+        return int(np.unpackbits(bits, count=self.n_recipes).sum())
+
+    def allergy_free_bits(self, allergy: str):
+        '''
+        Bitset of recipes free from the given allergen.
+        Allergens without a flag column are matched against the raw string once and cached.
+        '''
+        if allergy not in self.allergy_bits:
+            import pandas as pd
+
+            if callable(self._allergies_free):
+                self._allergies_free = self._allergies_free()
+            mask = pd.Series(self._allergies_free).fillna('').astype(str).str.contains(f'{allergy}-free', regex=False)
+            self.allergy_bits[allergy] = self._pack(mask.to_numpy(dtype=bool))
+        return self.allergy_bits[allergy]
+
+    def diet_bits(self, dietary_pref: str):
+        '''
+        Bitset of recipes whose category fits the dietary preference
+        '''
+        categories = DIET_CATEGORIES.get(dietary_pref)
+        if categories is None:
+            return self.all_bits
+        bits = np.zeros_like(self.all_bits)
+        for category in categories:
+            if category in self.category_bits:
+                bits |= self.category_bits[category]
+        return bits
+
+    def meal_type_mask(self, meal_type: str):
+        '''
+        Boolean mask of recipes of the given meal type
+        '''
+        bits = self.meal_type_bits.get(meal_type)
+        if bits is None:
+            return np.zeros(self.n_recipes, dtype=bool)
+        return self.unpack(bits)
+
+    def meal_type_of(self, recipe_id: int):
+        '''
+        Meal type of one recipe, read from the packed bitsets without unpacking them
+        '''
+        byte, bit = divmod(int(recipe_id), 8)
+        for meal_type, bits in self.meal_type_bits.items():
+            if bits[byte] & (0x80 >> bit):
+                return meal_type
+        return None
+
+    def suitable_bits(self, dietary_pref: str, allergies: List[str]):
+        '''
+        Bitset of recipes suitable for a dietary preference and allergy list
+
+        Recipes free from every allergen are used when at least
+        min_strict_matches exist, otherwise recipes free from any of them.
+        Falls back to the diet filter alone when nothing matches.
+
+        Returns:
+            Tuple of (bitset, relaxed) where relaxed tells if the relaxed allergy filter was applied
+        '''
+        bits = self.diet_bits(dietary_pref)
+        if not allergies:
+            return bits, False
+
+        allergy_bits = [self.allergy_free_bits(a) for a in allergies]
+        strict_bits = np.bitwise_and.reduce([bits] + allergy_bits)
+        if self.count(strict_bits) >= self.min_strict_matches:
+            return strict_bits, False
+
+        relaxed_bits = bits & np.bitwise_or.reduce(allergy_bits)
+        if self.count(relaxed_bits) > 0:
+            return relaxed_bits, True
+        return bits, False
+
+
+class CalorieIndex:
+    '''
+    Recipe positions of each meal type kept sorted by calories
+
+    A ±window lookup around a meal target is two binary searches that
+    return a contiguous slice of positions, with no scan and no copy.
+    '''
+    def __init__(self, recipes_df: pd.DataFrame):
+        calories = recipes_df['calories'].to_numpy(dtype=np.float64)
+        meal_types = recipes_df['meal_type'].astype(str).to_numpy()
+
+        self.positions = {}
+        self.calories = {}
+        for meal_type in np.unique(meal_types):
+            # Recipes without calories can never fall inside a window
+            positions = np.flatnonzero((meal_types == meal_type) & ~np.isnan(calories))
+            order = np.argsort(calories[positions], kind='stable')
+            self.positions[meal_type] = positions[order]
+            self.calories[meal_type] = calories[positions[order]]
+
+    def to_arrays(self):
+        '''
+        Returns:
+            Tuple of (arrays keyed by name, JSON-serializable metadata), see DietaryIndex.to_arrays
+        '''
+        arrays = {}
+        for i, meal_type in enumerate(self.positions):
+            arrays[f'positions.{i}'] = self.positions[meal_type]
+            arrays[f'calories.{i}'] = self.calories[meal_type]
+        return arrays, {'meal_types': list(self.positions)}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict, meta: Dict):
+        index = cls.__new__(cls)
+        index.positions = {meal_type: arrays[f'positions.{i}'] for i, meal_type in enumerate(meta['meal_types'])}
+        index.calories = {meal_type: arrays[f'calories.{i}'] for i, meal_type in enumerate(meta['meal_types'])}
+        return index
+
+    def window(self, meal_type: str, lower_bound: float, upper_bound: float):
+        '''
+        Positions of recipes of the meal type with lower_bound <= calories <= upper_bound
+
+        Returns:
+            Slice of the sorted position array (ordered by calories)
+        '''
+        if meal_type not in self.positions:
+            return np.empty(0, dtype=np.int64)
+        sorted_calories = self.calories[meal_type]
+        start = np.searchsorted(sorted_calories, lower_bound, side='left')
+        end = np.searchsorted(sorted_calories, upper_bound, side='right')
+        return self.positions[meal_type][start:end]
+
+    def nearest(self, meal_type: str, target: float):
+        '''
+        Positions of every recipe of the meal type, closest calories to target first
+
+        Walking this order is the same as widening a window around target
+        without a bound, for when no bounded window holds enough recipes.
+        '''
+        if meal_type not in self.positions:
+            return np.empty(0, dtype=np.int64)
+        order = np.argsort(np.abs(self.calories[meal_type] - target), kind='stable')
+        return self.positions[meal_type][order]
+
+
+class NutrientIndex:
+    '''
+    KD-trees over the nutrient vectors of each diet partition
+
+    A partition holds the recipes of one meal type, category and
+    combination of allergen-free flags, so every recipe in it passes or
+    fails the diet and (flagged) allergy filters together.
+
+    Vectors are log(1 + x) of (calories, protein, carbs, fats, fiber), so a
+    Euclidean distance approximates the relative deviations the scoring
+    penalizes. Each axis is scaled by the square root of its default score
+    weight, so the squared distance weighs nutrients like the score does.
+    A lookup returns the k recipes closest to a meal's targets in
+    O(k log n) instead of scoring the whole calorie window.
+    '''
+    COLUMNS = ['calories', 'protein', 'carbs', 'fats', 'fiber']
+    # Default score weights of get_score_weights, with calories boosted 16x:
+    # the calorie bonus tiers make a close calorie match worth more than any macro
+    WEIGHTS = np.sqrt([0.40 * 16, 0.25, 0.25, 0.10, 0.10])
+
+    def __init__(self, recipes_df: pd.DataFrame):
+        # Only built when nearest-neighbour candidates are used, so SciPy is not loaded otherwise
+        import pandas as pd
+        from scipy.spatial import cKDTree
+
+        vectors = self._to_space(recipes_df[self.COLUMNS].to_numpy(dtype=np.float64))
+        # Recipes with a missing nutrient cannot be placed in the space
+        complete = ~np.isnan(vectors).any(axis=1)
+        partition_keys = pd.DataFrame({
+            'meal_type': recipes_df['meal_type'].astype(str).to_numpy(),
+            'category': recipes_df['category'].astype(str).to_numpy(),
+            **{allergen: recipes_df[f'{allergen}_free'].to_numpy(dtype=bool) for allergen in ALLERGENS}
+        })[complete]
+
+        self.partitions = []
+        for key, rows in partition_keys.groupby(list(partition_keys.columns), sort=True).indices.items():
+            positions = np.flatnonzero(complete)[rows]
+            self.partitions.append({
+                'meal_type': key[0],
+                'category': key[1],
+                'positions': positions,
+                'tree': cKDTree(vectors[positions])
+            })
+        # Partitions holding any suitable recipe, per suitable-set key (see nearest)
+        self._suitable_partitions = {}
+
+    def __getstate__(self):
+        # Suitable partitions are found again after unpickling, e.g. from a snapshot
+        state = dict(self.__dict__)
+        state.pop('_suitable_partitions', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._suitable_partitions = {}
+
+    def get_suitable_partitions(self, suitable_mask: np.ndarray, suitable_key=None):
+        '''
+        Indexes of the partitions holding any suitable recipe
+
+        Finding them scans every partition, so with a suitable_key (any
+        hashable naming the suitable set, e.g. the profile's diet and
+        allergies) they are found once per key.
+        '''
+        if suitable_key is not None and suitable_key in self._suitable_partitions:
+            return self._suitable_partitions[suitable_key]
+        suitable = [i for i, partition in enumerate(self.partitions) if suitable_mask[partition['positions']].any()]
+        if suitable_key is not None:
+            self._suitable_partitions[suitable_key] = suitable
+        return suitable
+
+    def _to_space(self, values: np.ndarray):
+        return np.log1p(np.clip(values, 0, None)) * self.WEIGHTS
+
+    def nearest(self, meal_type: str, targets: np.ndarray, k: int, suitable_mask: np.ndarray,
+                categories: List[str] = None, suitable_key=None):
+        '''
+        The k suitable recipes of a meal type closest to the nutrient targets
+
+        Partitions without any suitable recipe are skipped. The diet and the
+        flagged allergens pass or fail a whole partition, allergens matched
+        on the raw allergies_free string are filtered inside the partitions.
+
+        Args:
+            meal_type: Meal type to search
+            targets: Target (calories, protein, carbs, fats, fiber) of the meal
+            k: Number of recipes to return
+            suitable_mask: Boolean mask of recipes the user may eat
+            categories: Diet categories to search, all when not given
+            suitable_key: Hashable naming suitable_mask, so its suitable partitions are only
+                found once (see get_suitable_partitions)
+
+        Returns:
+            Sorted recipe positions, fewer than k if not enough suitable recipes exist
+        '''
+        query = self._to_space(np.asarray(targets, dtype=np.float64))
+        found_positions = []
+        found_distances = []
+        for partition_index in self.get_suitable_partitions(suitable_mask, suitable_key):
+            partition = self.partitions[partition_index]
+            positions = partition['positions']
+            if partition['meal_type'] != meal_type:
+                continue
+            if categories is not None and partition['category'] not in categories:
+                continue
+            # Ask for more neighbours until k of them pass the filter
+            n_query = min(k, len(positions))
+            while True:
+                distances, indices = partition['tree'].query(query, k=n_query)
+                distances, indices = np.atleast_1d(distances), np.atleast_1d(indices)
+                suitable = suitable_mask[positions[indices]]
+                if suitable.sum() >= k or n_query == len(positions):
+                    break
+                n_query = min(4 * n_query, len(positions))
+            found_positions.append(positions[indices[suitable]])
+            found_distances.append(distances[suitable])
+
+        if not found_positions:
+            return np.empty(0, dtype=np.int64)
+        found_positions = np.concatenate(found_positions)
+        found_distances = np.concatenate(found_distances)
+        closest = np.argsort(found_distances, kind='stable')[:k]
+        return np.sort(found_positions[closest])
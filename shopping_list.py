@@ -0,0 +1,368 @@
+import os
+import re
+import unicodedata
+from functools import lru_cache
+from typing import List
+
+import numpy as np
+
+from recipe_catalog import _decode_text, _encode_text
+
+# Bump whenever parsing changes so stored parses get rebuilt
+PARSED_INGREDIENTS_VERSION = 1
+
+# Unit spellings mapped to (unit summed in, factor to it). Mass is summed in
+# grams and volume in millilitres, anything else is counted in its own unit
+UNITS = {
+    'g': ('g', 1.0), 'gr': ('g', 1.0), 'gram': ('g', 1.0), 'grams': ('g', 1.0),
+    'kg': ('g', 1000.0), 'kilogram': ('g', 1000.0), 'kilograms': ('g', 1000.0),
+    'mg': ('g', 0.001), 'oz': ('g', 28.3495), 'ounce': ('g', 28.3495), 'ounces': ('g', 28.3495),
+    'lb': ('g', 453.592), 'lbs': ('g', 453.592), 'pound': ('g', 453.592), 'pounds': ('g', 453.592),
+    'ml': ('ml', 1.0), 'milliliter': ('ml', 1.0), 'milliliters': ('ml', 1.0), 'millilitre': ('ml', 1.0),
+    'millilitres': ('ml', 1.0), 'l': ('ml', 1000.0), 'liter': ('ml', 1000.0), 'liters': ('ml', 1000.0),
+    'litre': ('ml', 1000.0), 'litres': ('ml', 1000.0),
+    'tsp': ('ml', 4.92892), 'tsps': ('ml', 4.92892), 'teaspoon': ('ml', 4.92892), 'teaspoons': ('ml', 4.92892),
+    'tbsp': ('ml', 14.7868), 'tbsps': ('ml', 14.7868), 'tbs': ('ml', 14.7868), 'tablespoon': ('ml', 14.7868),
+    'tablespoons': ('ml', 14.7868), 'cup': ('ml', 236.588), 'cups': ('ml', 236.588),
+    'fl oz': ('ml', 29.5735), 'fluid ounce': ('ml', 29.5735), 'fluid ounces': ('ml', 29.5735),
+    'pint': ('ml', 473.176), 'pints': ('ml', 473.176), 'quart': ('ml', 946.353), 'quarts': ('ml', 946.353),
+    'gallon': ('ml', 3785.41), 'gallons': ('ml', 3785.41),
+    'clove': ('clove', 1.0), 'cloves': ('clove', 1.0), 'slice': ('slice', 1.0), 'slices': ('slice', 1.0),
+    'sprig': ('sprig', 1.0), 'sprigs': ('sprig', 1.0), 'bunch': ('bunch', 1.0), 'bunches': ('bunch', 1.0),
+    'stalk': ('stalk', 1.0), 'stalks': ('stalk', 1.0), 'head': ('head', 1.0), 'heads': ('head', 1.0),
+    'sheet': ('sheet', 1.0), 'sheets': ('sheet', 1.0), 'pinch': ('pinch', 1.0), 'pinches': ('pinch', 1.0),
+    'dash': ('dash', 1.0), 'dashes': ('dash', 1.0), 'handful': ('handful', 1.0), 'handfuls': ('handful', 1.0),
+    'can': ('can', 1.0), 'cans': ('can', 1.0), 'package': ('package', 1.0), 'packages': ('package', 1.0),
+    'jar': ('jar', 1.0), 'jars': ('jar', 1.0), 'stick': ('stick', 1.0), 'sticks': ('stick', 1.0)
+}
+# Units kept in the parsed arrays, by code
+UNIT_NAMES = sorted({unit for unit, _ in UNITS.values()})
+
+# Packaging words after a quantity, as in '1 (15 ounce) can' or '400g can'
+CONTAINERS = {'can', 'cans', 'package', 'packages', 'jar', 'jars', 'bag', 'bags', 'box', 'boxes',
+              'carton', 'cartons', 'bottle', 'bottles', 'container', 'containers', 'tin', 'tins', 'pack', 'packs'}
+
+# Words describing size, cut, preparation or a vague amount rather than what to buy
+PREPARATION_WORDS = {
+    'a', 'an', 'few', 'some', 'boneless', 'skinless', 'bone-in', 'skin-on',
+    'small', 'medium', 'large', 'extra-large', 'fresh', 'freshly', 'chopped', 'finely', 'coarsely', 'roughly',
+    'minced', 'sliced', 'diced', 'grated', 'shredded', 'divided', 'peeled', 'trimmed', 'thinly', 'thickly',
+    'crushed', 'melted', 'softened', 'packed', 'lightly', 'beaten', 'halved', 'quartered', 'cubed', 'rinsed',
+    'drained', 'seeded', 'pitted', 'cooked', 'uncooked', 'toasted', 'optional', 'about', 'heaping', 'level',
+    'ripe', 'cold', 'warm', 'hot', 'room-temperature', 'of'
+}
+
+# Lines of newline-separated lists starting with these continue the previous ingredient
+CONTINUATION_WORDS = {'or', 'plus', 'to', 'and', 'for', 'see', 'at', 'such', 'about'}
+
+# Separators where the ingredient name ends and notes or alternatives begin
+_NAME_END = re.compile(r',|;| - | plus | or |\bfor\b|\bto (?:taste|serve)\b|\bas needed\b')
+_PARENTHESES = re.compile(r'\([^)]*\)?')
+_WORD = re.compile(r"[a-z][a-z'&-]*")
+_NUMBER = r'(?:\d+\s+\d+/\d+|\d+/\d+|\d+(?:\.\d+)?)'
+_QUANTITY = re.compile(
+    rf'^(?P<first>{_NUMBER})(?:\s*(?:-|–|to)\s*(?P<second>{_NUMBER}))?(?:\s*(?:x|×)\s*(?P<times>{_NUMBER}))?'
+)
+_UNIT = re.compile(r'^\s*-?\s*(fl\.?\s*oz|fluid ounces?|[a-z]+)\.?(?![a-z])')
+_PACKAGE_SIZE = re.compile(rf'^\s*\((?P<size>{_NUMBER})\s*-?\s*(?P<unit>fl\.?\s*oz|fluid ounces?|[a-z]+)\.?[^)]*\)')
+
+
+def _normalize_numbers(text: str):
+    '''
+    Spell unicode fractions as ASCII ones, e.g. '1 ½' -> '1 1/2' and '1⁄2' -> '1/2'
+    '''
+    characters = []
+    for character in text:
+        if character in '\u2009\u00a0\u202f':
+            characters.append(' ')
+        elif character == '⁄':
+            characters.append('/')
+        elif unicodedata.category(character) == 'No':
+            try:
+                value = unicodedata.numeric(character)
+            except ValueError:
+                characters.append(character)
+                continue
+            numerator, denominator = value.as_integer_ratio()
+            # Keeps '1½' one number
+            characters.append(f' {numerator}/{denominator}' if denominator > 1 else str(numerator))
+        else:
+            characters.append(character)
+    return ''.join(characters)
+
+
+def _unit_key(unit: str):
+    # 'fl. oz' -> 'fl oz'
+    return ' '.join(unit.replace('.', ' ').split())
+
+
+def _parse_number(text: str):
+    '''
+    Value of '2', '1.5', '3/4' or '1 1/2', None when a fraction has a zero denominator
+    '''
+    total = 0.0
+    for part in text.split():
+        if '/' in part:
+            numerator, denominator = part.split('/')
+            if float(denominator) == 0:
+                return None
+            total += float(numerator) / float(denominator)
+        else:
+            total += float(part)
+    return total
+
+
+def _singular(word: str):
+    if word.endswith('ves'):
+        # 'leaves' and 'olives' have no simple rule
+        return word
+    if word.endswith('oes') or word.endswith('ches') or word.endswith('shes'):
+        return word[:-2]
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith('s') and not word.endswith(('ss', 'us', 'is')) and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+@lru_cache(maxsize=65536)
+def parse_ingredient_line(line: str):
+    '''
+    Parse one ingredient line into a normalized ingredient, memoized as lines like
+    '1 teaspoon salt' recur across recipes
+
+    '1 ½ tablespoons red-wine vinegar' gives ('red-wine vinegar', 22.18, 'ml'):
+    quantities (whole numbers, decimals, fractions, unicode fractions, the
+    upper end of ranges) are converted to grams or millilitres when their
+    unit is a weight or volume, otherwise counted in their own unit ('clove',
+    'can') or without one ('2 lemons' gives ('lemon', 2.0, None)).
+
+    Returns:
+        Tuple of (ingredient name, quantity or None, unit or None), None when the line names no ingredient
+    '''
+    text = _normalize_numbers(line).strip().lower()
+    quantity = None
+    unit = None
+
+    match = _QUANTITY.match(text)
+    if match:
+        quantity = _parse_number(match.group('second') or match.group('first'))
+        if quantity is not None and match.group('times'):
+            # '2 x 400g cans'
+            times = _parse_number(match.group('times'))
+            quantity = None if times is None else quantity * times
+        text = text[match.end():]
+
+        size = _PACKAGE_SIZE.match(text)
+        unit_match = _UNIT.match(text)
+        if size and _unit_key(size.group('unit')) in UNITS:
+            # '1 (15 ounce) can tomatoes' is 15 ounces of tomatoes
+            unit, factor = UNITS[_unit_key(size.group('unit'))]
+            size_quantity = _parse_number(size.group('size'))
+            quantity = None if quantity is None or size_quantity is None else quantity * size_quantity * factor
+            text = text[size.end():]
+        elif unit_match and _unit_key(unit_match.group(1)) in UNITS:
+            unit, factor = UNITS[_unit_key(unit_match.group(1))]
+            quantity = None if quantity is None else quantity * factor
+            text = text[unit_match.end():]
+        # '400g can chickpeas', '2 (15 ounce) cans beans'
+        words = text.split(None, 1)
+        if unit is not None and words and words[0] in CONTAINERS and UNITS.get(words[0], (None,))[0] != unit:
+            text = words[1] if len(words) > 1 else ''
+        if quantity is None:
+            # A zero denominator ('1/0 cup flour') leaves the ingredient without an amount
+            unit = None
+
+    # The name is the first part before notes and alternatives that is more than a description,
+    # e.g. 'chicken thighs' in 'bone-in, skin-on chicken thighs'
+    words = []
+    for part in _NAME_END.split(_PARENTHESES.sub(' ', text)):
+        words = [word for word in _WORD.findall(part) if word not in PREPARATION_WORDS]
+        # 'drained and rinsed beans' leaves 'and beans'
+        while words and words[0] in ('and', 'or', 'with'):
+            words.pop(0)
+        if words:
+            break
+    if not words:
+        return None
+    if quantity is not None and unit is None:
+        if len(words) > 1 and UNITS.get(words[-1], ('g',))[0] not in ('g', 'ml'):
+            # '3 garlic cloves' is counted like '3 cloves garlic'
+            unit = UNITS[words.pop()][0]
+        else:
+            # Counted items: '2 lemons' and '1 lemon' are both lemons
+            words[-1] = _singular(words[-1])
+    return ' '.join(words), quantity, unit
+
+
+def _is_continuation(line: str):
+    '''
+    Whether a line of a newline-separated list only notes the previous ingredient, e.g. 'finely chopped'
+    '''
+    text = line.strip().lower()
+    if not text or text.startswith('(') or text.endswith(':'):
+        return True
+    if _QUANTITY.match(_normalize_numbers(text)):
+        return False
+    words = _WORD.findall(text)
+    return (not words or words[0] in CONTINUATION_WORDS
+            or all(word in PREPARATION_WORDS or word in CONTINUATION_WORDS or word.endswith(('ed', 'ly'))
+                   for word in words))
+
+
+@lru_cache(maxsize=4096)
+def parse_ingredients(ingredients: str):
+    '''
+    Parse a recipe's ingredient list, memoized per ingredient text
+
+    Lists are pipe-separated, some sources use one line per ingredient with
+    preparation notes on lines of their own ('1 onion', 'finely chopped').
+
+    Returns:
+        Tuple of (ingredient name, quantity or None, unit or None) tuples, see parse_ingredient_line
+    '''
+    if not isinstance(ingredients, str):
+        return ()
+    if '|' in ingredients:
+        lines = ingredients.split('|')
+    else:
+        lines = [line for line in ingredients.split('\n') if not _is_continuation(line)]
+    return tuple(item for item in map(parse_ingredient_line, lines) if item is not None)
+
+
+class ParsedIngredients:
+    '''
+    Parsed ingredient lists of every recipe of a catalog, stored next to it
+
+    Parsing free text is the slow part of a shopping list, so it is done
+    once per catalog version: items are kept as flat arrays (a name code
+    into a shared vocabulary, a quantity and a unit code per item) with
+    per-recipe offsets, and a recipe's list is a slice of them.
+    '''
+    def __init__(self, offsets: np.ndarray, name_codes: np.ndarray, quantities: np.ndarray,
+                 unit_codes: np.ndarray, names: List[str], version: str = None):
+        '''
+        Args:
+            offsets: Item range of each recipe, recipe i owns items offsets[i]:offsets[i + 1]
+            name_codes: Position of each item's name in names
+            quantities: Quantity of each item, NaN when the line gives none
+            unit_codes: Position of each item's unit in UNIT_NAMES, -1 for none
+            names: Ingredient name vocabulary
+            version: Catalog version the lists were parsed from
+        '''
+        self.offsets = offsets
+        self.name_codes = name_codes
+        self.quantities = quantities
+        self.unit_codes = unit_codes
+        self.names = names
+        self.version = version
+
+    @classmethod
+    def build(cls, recipe_text, n_recipes: int, version: str = None, chunk_size: int = 50000):
+        '''
+        Parse the 'ingredients' text column of every recipe
+
+        Args:
+            recipe_text: FrameText or CatalogText of the recipes
+            chunk_size: Recipes decoded at a time
+        '''
+        vocabulary = {}
+        unit_positions = {unit: i for i, unit in enumerate(UNIT_NAMES)}
+        lengths, name_codes, quantities, unit_codes = [], [], [], []
+        for start in range(0, n_recipes, chunk_size):
+            for text in recipe_text.slice('ingredients', start, min(start + chunk_size, n_recipes)):
+                items = parse_ingredients(text)
+                lengths.append(len(items))
+                for name, quantity, unit in items:
+                    name_codes.append(vocabulary.setdefault(name, len(vocabulary)))
+                    quantities.append(np.nan if quantity is None else quantity)
+                    unit_codes.append(-1 if unit is None else unit_positions[unit])
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return cls(offsets, np.array(name_codes, dtype=np.int32), np.array(quantities, dtype=np.float64),
+                   np.array(unit_codes, dtype=np.int16), list(vocabulary), version=version)
+
+    @classmethod
+    def load(cls, path: str):
+        '''
+        Load lists saved with save, None when the file does not exist or is outdated
+        '''
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as stored:
+            if int(stored['format']) != PARSED_INGREDIENTS_VERSION:
+                return None
+            return cls(stored['offsets'], stored['name_codes'], stored['quantities'], stored['unit_codes'],
+                       _decode_text(stored['names_data'], stored['names_offsets']), version=str(stored['version']))
+
+    @classmethod
+    def load_or_build(cls, path: str, recipe_text, n_recipes: int, version: str):
+        '''
+        Load the stored lists when they match the catalog version, otherwise parse and store them
+        '''
+        parsed = cls.load(path) if path is not None else None
+        if parsed is not None and parsed.version == version and len(parsed.offsets) == n_recipes + 1:
+            return parsed
+        parsed = cls.build(recipe_text, n_recipes, version=version)
+        if path is not None:
+            parsed.save(path)
+        return parsed
+
+    def save(self, path: str):
+        '''
+        Store the lists next to the catalog files (written then renamed)
+        '''
+        names_data, names_offsets = _encode_text(self.names)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f, offsets=self.offsets, name_codes=self.name_codes, quantities=self.quantities,
+                unit_codes=self.unit_codes, names_data=names_data, names_offsets=names_offsets,
+                version=np.array(self.version or ''), format=np.array(PARSED_INGREDIENTS_VERSION)
+            )
+        os.replace(tmp_path, path)
+
+    def get(self, recipe_id: int):
+        '''
+        Parsed ingredient list of one recipe, like parse_ingredients
+        '''
+        start, stop = int(self.offsets[recipe_id]), int(self.offsets[recipe_id + 1])
+        return tuple(
+            (self.names[name_code], None if np.isnan(quantity) else float(quantity),
+             None if unit_code < 0 else UNIT_NAMES[unit_code])
+            for name_code, quantity, unit_code in zip(
+                self.name_codes[start:stop].tolist(), self.quantities[start:stop].tolist(),
+                self.unit_codes[start:stop].tolist()
+            )
+        )
+
+
+def aggregate_ingredients(ingredient_lists: List[tuple], servings: List[float] = None):
+    '''
+    Sum parsed ingredient lists into a shopping list
+
+    Items with the same name and unit are summed. Items without a quantity
+    ('salt, to taste') only count towards the number of meals needing them.
+
+    Args:
+        ingredient_lists: One parsed list per meal, as from parse_ingredients
+        servings: Servings of each meal the quantities are multiplied by, one each when not given
+
+    Returns:
+        List of dictionaries with ingredient, quantity (None when no meal gives one),
+        unit (None for counted items) and meals, sorted by ingredient
+    '''
+    if servings is None:
+        servings = [1.0] * len(ingredient_lists)
+    totals = {}
+    for items, scale in zip(ingredient_lists, servings):
+        for name, quantity, unit in items:
+            entry = totals.setdefault((name, unit), {'ingredient': name, 'quantity': None, 'unit': unit, 'meals': 0})
+            if quantity is not None:
+                entry['quantity'] = (entry['quantity'] or 0.0) + quantity * scale
+            entry['meals'] += 1
+    shopping_list = sorted(totals.values(), key=lambda entry: (entry['ingredient'], entry['unit'] or ''))
+    for entry in shopping_list:
+        if entry['quantity'] is not None:
+            entry['quantity'] = round(entry['quantity'], 2)
+    return shopping_list
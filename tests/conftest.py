@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+RECIPE_CSV = os.path.join(REPO_DIR, 'new_recipe_set.csv')
+
+
+def make_profile(**overrides):
+    profile = {
+        'age': 30,
+        'gender': 'male',
+        'height': 175,
+        'weight': 75,
+        'activity_level': 'moderately_active',
+        'weight_goal': 'maintain',
+        'dietary_pref': 'non-veg',
+        'allergies': []
+    }
+    profile.update(overrides)
+    return profile
+
+
+@pytest.fixture(scope='session')
+def recipes_df():
+    return pd.read_csv(RECIPE_CSV)
+
+
+@pytest.fixture
+def recommender(recipes_df):
+    from content_based_recommender import ContentBasedRecommender
+
+    return ContentBasedRecommender(recipes_df)
@@ -0,0 +1,82 @@
+import io
+import json
+import sys
+
+import pytest
+
+import bulk_plan
+from bulk_plan import read_profiles, run
+from conftest import make_profile
+
+
+class FailingPlanner:
+    '''
+    Plans like BulkPlanner but raises for any batch holding the profile of user 'bad'
+    '''
+    def __init__(self, recommender):
+        self.recommender = recommender
+        self.batches = []
+
+    def plan_batch(self, profiles, start_index):
+        self.batches.append([profile['user_id'] for profile in profiles])
+        if any(profile['user_id'] == 'bad' for profile in profiles):
+            raise RuntimeError('planning failed')
+        return self.recommender.generate_meal_plans(profiles, days=1, start_index=start_index)['plans']
+
+
+def test_read_profiles_from_csv(tmp_path):
+    path = tmp_path / 'profiles.csv'
+    path.write_text(
+        'user_id,age,height,weight,gender,activity_level,weight_goal,allergies\n'
+        'a,30,175,75,male,sedentary,loss,gluten;nuts\n'
+        'b,41,160.5,60,female,very_active,gain,\n',
+        encoding='utf-8'
+    )
+
+    profiles = list(read_profiles(str(path)))
+
+    assert [line_number for line_number, _ in profiles] == [2, 3]
+    assert profiles[0][1]['allergies'] == 'gluten;nuts'
+    # Empty cells are left out so the defaults apply
+    assert 'allergies' not in profiles[1][1]
+    assert profiles[1][1]['height'] == '160.5'
+
+
+def test_read_profiles_from_jsonl(tmp_path):
+    path = tmp_path / 'profiles.jsonl'
+    path.write_text(json.dumps(make_profile(user_id='a')) + '\n\n{not json\n[1, 2]\n', encoding='utf-8')
+
+    profiles = list(read_profiles(str(path)))
+
+    assert [line_number for line_number, _ in profiles] == [1, 3, 4]
+    assert profiles[0][1] == make_profile(user_id='a')
+    assert profiles[1][1]['_error'].startswith('Invalid JSON')
+    assert profiles[2][1] == {'_error': 'Expected a JSON object'}
+
+
+def test_failed_batch_is_planned_profile_by_profile(recommender):
+    planner = FailingPlanner(recommender)
+    profiles = [(1, make_profile(user_id='a')), (2, make_profile(user_id='bad')),
+                (3, make_profile(age=5, user_id='young')), (4, make_profile(user_id='c'))]
+    output = io.StringIO()
+
+    summary = run(planner, profiles, output, progress_every=0)
+
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [record['line'] for record in records] == [1, 2, 3, 4]
+    assert 'meal_plan' in records[0] and 'meal_plan' in records[3]
+    assert records[1]['errors'] == ['RuntimeError: planning failed']
+    assert records[2]['errors'] == ['age must be between 15 and 100, got 5']
+    assert planner.batches == [['a', 'bad', 'c'], ['a'], ['bad'], ['c']]
+    assert (summary['read'], summary['planned'], summary['invalid'], summary['failed']) == (4, 2, 1, 1)
+
+
+@pytest.mark.parametrize('arguments', [['--days', '0'], ['--days', '32'], ['--max-recipe-repeats', '0']])
+def test_plan_length_and_repeat_limit_are_checked(monkeypatch, capsys, arguments):
+    monkeypatch.setattr(sys, 'argv', ['bulk_plan.py', 'profiles.csv', *arguments])
+
+    with pytest.raises(SystemExit) as exit_info:
+        bulk_plan.main()
+
+    assert exit_info.value.code == 2
+    assert arguments[0] in capsys.readouterr().err
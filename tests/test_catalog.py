@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import RECIPE_CSV, make_profile
+from content_based_recommender import ContentBasedRecommender
+from recipe_catalog import RecipeCatalog
+
+PROFILES = [
+    make_profile(),
+    make_profile(weight_goal='loss', dietary_pref='vegetarian', allergies=['nuts']),
+    make_profile(age=52, gender='female', height=162, weight=68, weight_goal='gain', dietary_pref='vegan',
+                 allergies=['gluten', 'dairy'], activity_level='sedentary')
+]
+
+
+def plan_all(recommender, seed=7):
+    return [
+        recommender.generate_meal_plan(profile, rng=np.random.default_rng(seed), alternates=2)
+        for profile in PROFILES
+    ]
+
+
+def test_catalog_round_trips_the_csv(tmp_path, recipes_df):
+    catalog = RecipeCatalog(RECIPE_CSV, catalog_dir=str(tmp_path / 'recipes.catalog'))
+
+    frame = catalog.load()
+
+    assert len(frame) == len(recipes_df)
+    assert frame['name'].tolist() == recipes_df['name'].fillna('').astype(str).tolist()
+    np.testing.assert_array_equal(frame['calories'].to_numpy(), recipes_df['calories'].to_numpy(dtype=np.float64))
+    assert not catalog.is_stale()
+
+
+def test_catalog_plans_match_dataframe_plans(tmp_path, recommender):
+    catalog = RecipeCatalog(RECIPE_CSV, catalog_dir=str(tmp_path / 'recipes.catalog'))
+
+    for lazy_text in (False, True):
+        catalog_recommender = ContentBasedRecommender.from_catalog(catalog, mmap_mode='r', lazy_text=lazy_text)
+        assert plan_all(catalog_recommender) == plan_all(recommender)
+    assert os.path.exists(os.path.join(catalog.catalog_dir, 'meta.json'))
+
+
+def test_build_of_missing_csv_creates_nothing(tmp_path):
+    catalog = RecipeCatalog(str(tmp_path / 'missing.csv'))
+
+    with pytest.raises(FileNotFoundError):
+        catalog.build()
+    assert not os.path.exists(catalog.catalog_dir)
+
+
+def test_failed_build_removes_its_spool_files(tmp_path):
+    csv_path = tmp_path / 'broken.csv'
+    with open(RECIPE_CSV, encoding='utf-8') as f:
+        header = f.readline()
+    csv_path.write_text(header + 'Toast,bread,Toast it.,vegan,200,30,5,2,6,3,0,breakfast,[]\n' + 'a,b,c,d,e,f,g,h,i,j,k,l,m,n,o,p\n',
+                        encoding='utf-8')
+    catalog = RecipeCatalog(str(csv_path))
+
+    with pytest.raises(pd.errors.ParserError):
+        catalog.build()
+    assert not os.path.exists(catalog.catalog_dir)
+
+    os.makedirs(catalog.catalog_dir)
+    with pytest.raises(pd.errors.ParserError):
+        catalog.build()
+    assert os.listdir(catalog.catalog_dir) == []
+
+
+def test_lazy_text_recommender_plans_without_a_frame(tmp_path, recipes_df):
+    catalog = RecipeCatalog(RECIPE_CSV, catalog_dir=str(tmp_path / 'recipes.catalog'))
+    recommender = ContentBasedRecommender.from_catalog(catalog, mmap_mode='r', lazy_text=True)
+
+    plan_all(recommender)
+
+    assert recommender._recipes_df is None
+    assert len(recommender.recipes_df) == len(recipes_df)
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_profile
+from ingredient_index import IngredientIndex, tokenize_ingredients
+from recipe_catalog import FrameText
+
+INGREDIENTS = [
+    '2 cups chickpeas|1 tbsp olive oil|1 lemon, juiced',
+    '1 can chickpeas, drained|2 tablespoons olive oil|1 clove garlic',
+    '1 cup rice|2 cups water|1 tsp sesame oil',
+    '3 eggs|1/2 cup milk|salt',
+]
+
+
+@pytest.fixture
+def index():
+    return IngredientIndex.build(FrameText(pd.DataFrame({'ingredients': INGREDIENTS})), len(INGREDIENTS))
+
+
+def test_tokens_skip_quantities_units_and_preparation():
+    assert tokenize_ingredients('1 can chickpeas, drained|2 tablespoons olive oil') == [
+        'chickpeas', 'olive', 'oil', 'olive oil'
+    ]
+
+
+def test_recipe_is_its_own_nearest_neighbour(index):
+    for recipe_id in range(len(INGREDIENTS)):
+        similarities = index.similarities(recipe_id)
+
+        assert similarities[recipe_id] == pytest.approx(1.0, abs=1e-6)
+        assert np.argmax(similarities) == recipe_id
+
+
+def test_most_similar_ranks_shared_ingredients_first(index):
+    recipe_ids, similarities = index.most_similar(0, k=3)
+
+    # Recipe 2 only shares 'oil', recipe 3 shares nothing
+    assert list(recipe_ids) == [1, 2]
+    assert similarities[0] > similarities[1] > 0
+    assert list(index.most_similar(0, k=3, candidate_mask=np.array([True, False, True, True]))[0]) == [2]
+
+
+def test_max_similarity_is_highest_against_any_recent_recipe(index):
+    vectors = index.candidate_vectors(np.arange(len(INGREDIENTS)))
+
+    similarity = index.max_similarity(vectors, [0, 3])
+
+    np.testing.assert_allclose(similarity[[0, 3]], 1.0, atol=1e-6)
+    assert similarity[1] == pytest.approx(index.similarities(0)[1])
+    np.testing.assert_array_equal(index.max_similarity(vectors, []), 0.0)
+
+
+def test_find_similar_recipes_by_id_and_name(recommender):
+    name = recommender.recipe_text.get(0, 'name')
+
+    by_id = recommender.find_similar_recipes(0, k=5)
+    by_name = recommender.find_similar_recipes(name, k=5)
+
+    assert by_id == by_name
+    assert len(by_id) == 5 and 0 not in [recipe['recipe_id'] for recipe in by_id]
+    similarities = [recipe['similarity'] for recipe in by_id]
+    assert similarities == sorted(similarities, reverse=True)
+    assert by_id[0]['meal_type'] == recommender.recipes_df['meal_type'].iat[by_id[0]['recipe_id']]
+    with pytest.raises(ValueError):
+        recommender.find_similar_recipes('No Such Recipe')
+
+
+def test_similar_recipes_fit_the_profile(recommender):
+    profile = make_profile(dietary_pref='vegan', allergies=['nuts'])
+    suitable_mask = recommender.get_suitable_mask(profile)
+
+    similar = recommender.find_similar_recipes(0, k=10, user_profile=profile)
+
+    assert similar and all(suitable_mask[recipe['recipe_id']] for recipe in similar)
+
+
+def test_ingredient_diversity_lowers_scores_of_overlapping_candidates(recommender):
+    plan_context = recommender.prepare_meal_plan(make_profile())
+    ids = plan_context['meal_candidates']['dinner']['ids']
+    plain_state = recommender.new_usage_state()
+    diverse_state = recommender.new_usage_state(ingredient_diversity=0.5)
+    plain_state['recent_ids'] = diverse_state['recent_ids'] = [int(ids[0])]
+
+    _, _, plain_scores = recommender.get_slot_scores(plan_context, 'dinner', plain_state)
+    _, _, diverse_scores = recommender.get_slot_scores(plan_context, 'dinner', diverse_state)
+
+    index = recommender.get_ingredient_index()
+    similarity = index.max_similarity(index.candidate_vectors(ids), [int(ids[0])])
+    np.testing.assert_allclose(diverse_scores, plain_scores * (1 - 0.5 * similarity))
+    # The recent recipe itself loses the full weight, the others by how much they overlap with it
+    assert diverse_scores[0] == pytest.approx(plain_scores[0] * 0.5)
+    overlapping = similarity > 0
+    assert (diverse_scores[overlapping] < plain_scores[overlapping]).all()
+    assert (diverse_scores >= plain_scores * 0.5 - 1e-9).all()
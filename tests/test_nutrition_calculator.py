@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from nutrition_calculator import NutritionCalculator
+
+# Unknown labels take the scalar methods' fallbacks
+GENDERS = ['male', 'female', 'Male', 'FEMALE', 'other']
+ACTIVITY_LEVELS = ['sedentary', 'lightly_active', 'moderately_active', 'very_active', 'extreme', None]
+WEIGHT_GOALS = ['loss', 'gain', 'maintain', 'bulk', None]
+
+
+@pytest.fixture(scope='module')
+def profiles():
+    rng = np.random.default_rng(19)
+    n = 2000
+    return pd.DataFrame({
+        # Fine steps put many BMRs, TDEEs and macros on or next to rounding ties
+        'weight': np.round(rng.uniform(10, 500, n), 3),
+        'height': np.round(rng.uniform(50, 300, n), 2),
+        'age': rng.integers(15, 101, n),
+        'gender': rng.choice(GENDERS, n),
+        'activity_level': rng.choice(np.array(ACTIVITY_LEVELS, dtype=object), n),
+        'weight_goal': rng.choice(np.array(WEIGHT_GOALS, dtype=object), n),
+    })
+
+
+def scalar_targets(calculator, profile):
+    bmr = calculator.calculate_bmr(profile.weight, profile.height, profile.age, profile.gender)
+    tdee = calculator.calculate_tdee(bmr, profile.activity_level)
+    target_calories = calculator.calculate_target_calories(tdee, profile.weight_goal)
+    macros = calculator.calculate_macros(target_calories, profile.weight_goal, profile.weight, profile.activity_level)
+    return {'bmr': bmr, 'tdee': tdee, 'target_calories': target_calories, **macros}
+
+
+def test_batch_methods_match_scalar_methods(profiles):
+    calculator = NutritionCalculator()
+    expected = pd.DataFrame(
+        [scalar_targets(calculator, profile) for profile in profiles.itertuples()], index=profiles.index
+    )
+
+    bmr = calculator.calculate_bmr_batch(profiles['weight'], profiles['height'], profiles['age'], profiles['gender'])
+    tdee = calculator.calculate_tdee_batch(expected['bmr'], profiles['activity_level'])
+    target_calories = calculator.calculate_target_calories_batch(expected['tdee'], profiles['weight_goal'])
+    macros = calculator.calculate_macros_batch(
+        expected['target_calories'], profiles['weight_goal'], profiles['weight'], profiles['activity_level']
+    )
+
+    np.testing.assert_array_equal(bmr, expected['bmr'])
+    np.testing.assert_array_equal(tdee, expected['tdee'])
+    np.testing.assert_array_equal(target_calories, expected['target_calories'])
+    for macro in ['protein', 'carbs', 'fat']:
+        np.testing.assert_array_equal(macros[macro], expected[macro])
+
+
+def test_targets_batch_matches_scalar_methods(profiles):
+    calculator = NutritionCalculator()
+    expected = pd.DataFrame(
+        [scalar_targets(calculator, profile) for profile in profiles.itertuples()], index=profiles.index
+    )
+
+    targets = calculator.calculate_targets_batch(profiles)
+
+    pd.testing.assert_frame_equal(targets, expected, check_exact=True)
+
+
+def test_batch_rounding_keeps_the_scalar_side_of_ties():
+    calculator = NutritionCalculator()
+    # 2.675 is stored just below the tie, round() goes down where np.round goes up
+    bmr = [2.675 / 1.2, 2.675 / 1.2]
+    assert np.round(bmr[0] * 1.2, 2) != round(bmr[0] * 1.2, 2)
+
+    tdee = calculator.calculate_tdee_batch(bmr, ['extreme', 'sedentary'])
+
+    assert list(tdee) == [calculator.calculate_tdee(value, 'sedentary') for value in bmr]
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from conftest import make_profile
+
+PROFILES = [
+    make_profile(),
+    make_profile(weight_goal='loss', dietary_pref='vegetarian', allergies=['nuts']),
+    make_profile(age=45, gender='female', height=160, weight=82, weight_goal='loss', activity_level='sedentary'),
+    make_profile(age=24, weight=68, weight_goal='gain', dietary_pref='vegan', activity_level='very_active')
+]
+
+
+def mean_calorie_deviation(meal_plan):
+    return np.mean([abs(daily_meals['daily_summary']['calorie_variance']) for daily_meals in meal_plan.values()])
+
+
+@pytest.mark.parametrize('profile', PROFILES)
+def test_optimized_plan_deviates_no_more_than_greedy(recommender, profile):
+    greedy_plan, _ = recommender.generate_meal_plan(profile, rng=np.random.default_rng(3))
+    optimized_plan, _ = recommender.generate_meal_plan(profile, rng=np.random.default_rng(3), planner='optimized',
+                                                       time_budget=10)
+
+    assert mean_calorie_deviation(optimized_plan) <= mean_calorie_deviation(greedy_plan)
+
+
+def test_optimizer_searches_a_wider_pool_than_the_greedy_window(recommender):
+    plan_context = recommender.prepare_meal_plan(make_profile(), **recommender.optimizer.get_pool_options())
+
+    for meal_type in recommender.MEAL_TYPES:
+        candidates = plan_context['meal_candidates'][meal_type]
+        assert set(candidates['ids']) <= set(candidates['pool']['ids'])
+        assert recommender.count_names(candidates['pool']['ids']) >= recommender.optimizer.shortlist_size
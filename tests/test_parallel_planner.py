@@ -0,0 +1,22 @@
+from conftest import RECIPE_CSV, make_profile
+from content_based_recommender import ContentBasedRecommender
+from parallel_planner import ParallelMealPlanner
+from recipe_catalog import RecipeCatalog
+
+PROFILES = [
+    make_profile(user_id=f'user-{i}', age=20 + 3 * i, weight=55 + 4 * i,
+                 weight_goal=['loss', 'gain', 'maintain'][i % 3], dietary_pref=['non-veg', 'vegetarian', 'vegan'][i % 3])
+    for i in range(8)
+]
+
+
+def test_pool_plans_match_in_process_plans_for_the_same_seed(tmp_path):
+    catalog_dir = str(tmp_path / 'recipes.catalog')
+    recommender = ContentBasedRecommender.from_catalog(RecipeCatalog(RECIPE_CSV, catalog_dir))
+    expected = recommender.generate_meal_plans(PROFILES, days=3, seed=11, alternates=2)['plans']
+
+    with ParallelMealPlanner(RECIPE_CSV, processes=2, catalog_dir=catalog_dir) as planner:
+        result = planner.generate_meal_plans(PROFILES, days=3, seed=11, chunk_size=3, alternates=2)
+
+    assert result['timing']['chunks'] == 3
+    assert result['plans'] == expected
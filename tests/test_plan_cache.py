@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from conftest import make_profile
+from plan_cache import CandidateCache
+
+
+def context(n_values=10):
+    return {'target_calories': 2000.0, 'meal_candidates': {'lunch': {'ids': np.arange(n_values), 'scores': np.ones(n_values)}}}
+
+
+def test_evicts_least_recently_used_entry_over_entry_cap():
+    cache = CandidateCache(max_entries=2)
+    cache.put('a', context())
+    cache.put('b', context())
+    assert cache.get('a') is not None
+
+    cache.put('c', context())
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['entries'] == 2
+
+
+def test_evicts_over_memory_cap_and_skips_oversized_entries():
+    entry_bytes = 2 * 8 * 10
+    cache = CandidateCache(max_entries=100, max_bytes=2 * entry_bytes)
+    for key in 'abc':
+        cache.put(key, context())
+
+    assert cache.get('a') is None
+    assert cache.stats()['bytes'] == 2 * entry_bytes
+
+    cache.put('huge', context(n_values=1000))
+    assert cache.get('huge') is None
+    assert cache.stats()['entries'] == 2
+
+
+def test_replacing_a_key_keeps_byte_count_and_freezes_arrays():
+    cache = CandidateCache()
+    cache.put('a', context())
+    cache.put('a', context())
+
+    assert cache.stats()['bytes'] == 2 * 8 * 10
+    with pytest.raises(ValueError):
+        cache.get('a')['meal_candidates']['lunch']['scores'][0] = 0.0
+
+
+def test_recommender_reuses_and_clears_cached_contexts(recommender, recipes_df):
+    profile = make_profile()
+
+    recommender.generate_meal_plan(profile, rng=np.random.default_rng(0))
+    recommender.generate_meal_plan(dict(profile, age=30.0), rng=np.random.default_rng(0))
+    assert recommender.candidate_cache.stats()['hits'] == 1
+
+    recommender.set_recipes(recipes_df)
+    assert recommender.candidate_cache.stats()['entries'] == 0
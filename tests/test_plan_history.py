@@ -0,0 +1,76 @@
+import datetime
+import sqlite3
+
+from plan_history import PlanHistoryStore
+
+START = datetime.date(2024, 3, 1)
+
+
+def make_plan(prefix: str, days: int = 3):
+    return {
+        f'day_{day}': {
+            meal_type: {'name': f'{prefix} {meal_type} {day}', 'calories': 400.0}
+            for meal_type in ['breakfast', 'lunch', 'dinner', 'snack']
+        }
+        for day in range(1, days + 1)
+    }
+
+
+def count_meals(db_path):
+    connection = sqlite3.connect(db_path)
+    try:
+        return connection.execute('SELECT COUNT(*) FROM plan_meals').fetchone()[0]
+    finally:
+        connection.close()
+
+
+def test_meals_are_buffered_until_the_batch_fills(tmp_path):
+    db_path = str(tmp_path / 'history.db')
+    with PlanHistoryStore(db_path, batch_size=20) as store:
+        store.record_plan('u1', make_plan('a', days=3), start_date=START)
+        assert count_meals(db_path) == 0
+
+        store.record_plan('u1', make_plan('b', days=3), start_date=START)
+        assert count_meals(db_path) == 24
+
+
+def test_record_plan_leaves_no_write_lock_behind(tmp_path):
+    db_path = str(tmp_path / 'history.db')
+    first = PlanHistoryStore(db_path)
+    second = PlanHistoryStore(db_path)
+    second.connection.execute('PRAGMA busy_timeout = 100')
+    try:
+        first_id = first.record_plan('u1', make_plan('a'), start_date=START)
+        assert not first.connection.in_transaction
+
+        second_id = second.record_plan('u2', make_plan('b'), start_date=START)
+        assert second_id != first_id
+    finally:
+        first.close()
+        second.close()
+
+
+def test_newer_plan_replaces_older_meals_of_the_same_days(tmp_path):
+    with PlanHistoryStore(str(tmp_path / 'history.db')) as store:
+        old_id = store.record_plan('u1', make_plan('old', days=3), start_date=START)
+        new_id = store.record_plan('u1', make_plan('new', days=3), start_date=START + datetime.timedelta(days=1))
+
+        meals = store.get_meals('u1', START, START + datetime.timedelta(days=3))
+
+    assert len(meals) == 16
+    assert [meal['plan_id'] for meal in meals[:4]] == [old_id] * 4
+    assert all(meal['plan_id'] == new_id for meal in meals[4:])
+    assert meals[4]['recipe_name'] == 'new breakfast 1'
+
+
+def test_recent_recipes_cover_the_last_days_most_recent_first(tmp_path):
+    with PlanHistoryStore(str(tmp_path / 'history.db')) as store:
+        store.record_plan('u1', make_plan('a', days=5), start_date=START)
+        store.record_plan('u2', make_plan('other', days=5), start_date=START)
+
+        recent = store.get_recent_recipes('u1', days=2, until=START + datetime.timedelta(days=2))
+
+    assert recent == [
+        'a snack 3', 'a dinner 3', 'a lunch 3', 'a breakfast 3',
+        'a snack 2', 'a dinner 2', 'a lunch 2', 'a breakfast 2'
+    ]
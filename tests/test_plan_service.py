@@ -0,0 +1,121 @@
+import asyncio
+import json
+
+import pytest
+
+from conftest import RECIPE_CSV, make_profile
+from plan_service import PlanService, parse_content_length, parse_plan_request
+
+
+async def exchange(port: int, raw_request: bytes):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(raw_request)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return response
+
+
+def send_raw(service: PlanService, raw_request: bytes):
+    '''
+    Send one raw request to the service's connection handler, without starting its workers
+
+    Returns:
+        Tuple of (HTTP status, decoded JSON body)
+    '''
+    async def run():
+        server = await asyncio.start_server(service.handle_connection, '127.0.0.1', 0)
+        try:
+            return await exchange(server.sockets[0].getsockname()[1], raw_request)
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    response = asyncio.run(run())
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body)
+
+
+def post(body: bytes, content_length: str = None):
+    content_length = str(len(body)) if content_length is None else content_length
+    return (b'POST /plan HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n'
+            + f'Content-Length: {content_length}\r\n\r\n'.encode('latin-1') + body)
+
+
+@pytest.mark.parametrize('content_length', ['-5', 'abc', '+5', '1_0', '5.0'])
+def test_invalid_content_length_is_a_bad_request(tmp_path, content_length):
+    service = PlanService(RECIPE_CSV, catalog_dir=str(tmp_path / 'recipes.catalog'))
+
+    status, payload = send_raw(service, post(b'{"days": 7}', content_length=content_length))
+
+    assert status == 400
+    assert 'Content-Length' in payload['error']
+
+
+def test_oversized_body_is_rejected(tmp_path):
+    service = PlanService(RECIPE_CSV, catalog_dir=str(tmp_path / 'recipes.catalog'))
+
+    status, _ = send_raw(service, post(b'', content_length=str(1 << 30)))
+
+    assert status == 413
+
+
+@pytest.mark.parametrize('field', ['days', 'alternates', 'max_recipe_repeats', 'seed', 'ingredient_diversity'])
+def test_bool_is_not_accepted_for_numeric_fields(field):
+    with pytest.raises(ValueError, match=field):
+        parse_plan_request(json.dumps({'profile': make_profile(), field: True}).encode('utf-8'))
+
+
+def test_bad_plan_requests_get_400(tmp_path):
+    service = PlanService(RECIPE_CSV, catalog_dir=str(tmp_path / 'recipes.catalog'))
+
+    for body in [b'not json', b'[1, 2]', json.dumps({'profile': make_profile(), 'days': True}).encode('utf-8'),
+                 json.dumps({'profile': dict(make_profile(), age=-3)}).encode('utf-8')]:
+        status, payload = send_raw(service, post(body))
+        assert status == 400, body
+        assert payload['error']
+
+
+def test_parse_content_length():
+    assert parse_content_length('') == 0
+    assert parse_content_length(' 42 ') == 42
+
+
+def test_service_plans_with_warm_workers(tmp_path):
+    async def run():
+        service = PlanService(RECIPE_CSV, port=0, workers=1, catalog_dir=str(tmp_path / 'recipes.catalog'))
+        await service.start()
+        try:
+            body = json.dumps({'profile': make_profile(), 'days': 2, 'seed': 1}).encode('utf-8')
+            return await exchange(service.port, post(body))
+        finally:
+            await service.close()
+
+    head, _, body = asyncio.run(run()).partition(b'\r\n\r\n')
+    payload = json.loads(body)
+
+    assert int(head.split()[1]) == 200
+    assert sorted(payload['meal_plan']) == ['day_1', 'day_2']
+
+
+def test_inverted_portion_range_fails_before_workers_start():
+    with pytest.raises(ValueError):
+        PlanService(RECIPE_CSV, workers=1, portion_range=(2, 1))
+
+
+@pytest.mark.parametrize('raw_request, expected_status', [
+    (b'GET /' + b'a' * (1 << 17) + b' HTTP/1.1\r\n\r\n', 400),
+    (b'GET /health HTTP/1.1\r\nX-Long: ' + b'a' * (1 << 17) + b'\r\n\r\n', 431),
+], ids=['request-line', 'header'])
+def test_overlong_lines_get_a_response(tmp_path, raw_request, expected_status):
+    service = PlanService(RECIPE_CSV, catalog_dir=str(tmp_path / 'recipes.catalog'))
+
+    status, _ = send_raw(service, raw_request)
+
+    assert status == expected_status
+
+
+@pytest.mark.parametrize('target_calories', [0, -100, 'abc', True, float('inf')])
+def test_non_positive_target_calories_is_a_bad_request(target_calories):
+    with pytest.raises(ValueError, match='target_calories'):
+        parse_plan_request(json.dumps({'profile': make_profile(target_calories=target_calories)}).encode('utf-8'))
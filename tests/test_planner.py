@@ -0,0 +1,154 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from conftest import make_profile
+from planner_stats import PlannerStats
+
+# Few recipes of this diet sit near its breakfast target, the ±25% window holds a single one
+NARROW_DIET_PROFILE = make_profile(weight_goal='loss', dietary_pref='vegetarian', allergies=['nuts'])
+
+
+def recipe_counts(recommender, meal_plan):
+    return Counter(
+        daily_meals[meal_type]['name'] for daily_meals in meal_plan.values()
+        for meal_type in recommender.MEAL_TYPES if meal_type in daily_meals
+    )
+
+
+@pytest.mark.parametrize('planner', ['greedy', 'optimized'])
+def test_repeat_limit_holds_for_narrow_diet(recommender, planner):
+    stats = PlannerStats()
+
+    meal_plan, _ = recommender.generate_meal_plan(
+        NARROW_DIET_PROFILE, days=7, max_recipe_repeats=3, rng=np.random.default_rng(0), planner=planner, stats=stats
+    )
+
+    assert max(recipe_counts(recommender, meal_plan).values()) <= 3
+    assert stats.counters['max_repeat_no_alternative'] == 0
+
+
+def test_thin_window_keeps_widening_until_enough_recipes(recommender):
+    plan_context = recommender.calculate_user_targets(NARROW_DIET_PROFILE)
+    suitable_mask = recommender.get_suitable_mask(NARROW_DIET_PROFILE)
+    meal_target = plan_context['target_calories'] * plan_context['meal_distribution']['breakfast']
+
+    narrow = recommender.find_candidate_ids('breakfast', meal_target, suitable_mask)
+    widened = recommender.find_candidate_ids('breakfast', meal_target, suitable_mask, min_candidates=5)
+
+    assert recommender.count_names(narrow) < 5
+    assert recommender.count_names(widened) >= 5
+    assert set(narrow) <= set(widened)
+    assert suitable_mask[widened].all()
+
+
+def test_variety_penalties_match_per_recipe_loop(recommender):
+    recent_codes = [3, -1, 7, 3, 11, 0]
+    candidate_codes = np.array([0, 3, 5, 7, 11, 3, 12])
+    expected = np.ones(len(candidate_codes))
+    for i, code in enumerate(recent_codes):
+        if code >= 0:
+            expected[candidate_codes == code] *= 0.6 * (0.8 ** i)
+
+    penalties = recommender.get_variety_penalties(recent_codes, candidate_codes=candidate_codes)
+
+    np.testing.assert_array_equal(penalties, expected)
+    np.testing.assert_array_equal(recommender.get_variety_penalties([], candidate_codes=candidate_codes), 1.0)
+
+
+def test_selection_follows_the_plan_rng(recommender):
+    profile = make_profile()
+
+    plan, _ = recommender.generate_meal_plan(profile, rng=np.random.default_rng(1))
+    same_seed_plan, _ = recommender.generate_meal_plan(profile, rng=np.random.default_rng(1))
+    other_seed_plans = [recommender.generate_meal_plan(profile, rng=np.random.default_rng(seed))[0] for seed in range(2, 6)]
+
+    assert plan == same_seed_plan
+    assert any(other_plan != plan for other_plan in other_seed_plans)
+
+
+def test_retry_keeps_overused_recipe_when_nothing_else_can_be_picked(recommender):
+    plan_context = recommender.prepare_meal_plan(make_profile())
+    snack_ids = plan_context['meal_candidates']['snack']['ids']
+    # Two candidates with different names, the only alternative has no score
+    second = snack_ids[recommender.name_codes[snack_ids] != recommender.name_codes[snack_ids[0]]][0]
+    ids = np.array([snack_ids[0], second])
+    plan_context['meal_candidates'] = {meal_type: {'ids': ids[:0], 'scores': np.empty(0)} for meal_type in recommender.MEAL_TYPES}
+    plan_context['meal_candidates']['snack'] = {'ids': ids, 'scores': np.array([0.9, np.nan])}
+    stats = PlannerStats()
+    usage_state = recommender.new_usage_state(stats=stats)
+    usage_state['usage_counts'][recommender.name_codes[ids[0]]] = 3
+
+    daily_meals = recommender.select_daily_meals(plan_context, usage_state, max_recipe_repeats=3)
+
+    assert daily_meals['snack']['name'] == recommender.recipe_text.get(ids[0], 'name')
+    assert stats.counters['max_repeat_no_alternative'] == 1
+
+
+@pytest.mark.parametrize('planner', ['greedy', 'optimized'])
+def test_alternates_fill_from_meal_type_when_slot_has_one_recipe(recommender, planner):
+    profile = make_profile()
+    plan_context = recommender.prepare_meal_plan(profile, **recommender.optimizer.get_pool_options())
+    snack = plan_context['meal_candidates']['snack']
+    plan_context['meal_candidates'] = dict(plan_context['meal_candidates'])
+    plan_context['meal_candidates']['snack'] = {
+        'ids': snack['ids'][:1], 'scores': snack['scores'][:1], 'fill': snack['fill']
+    }
+    usage_state = recommender.new_usage_state(rng=np.random.default_rng(0))
+
+    if planner == 'greedy':
+        daily_meals = recommender.select_daily_meals(plan_context, usage_state, alternates=3)
+    else:
+        daily_meals = recommender.optimizer.optimize_daily_meals(plan_context, usage_state, alternates=3)
+
+    alternates = daily_meals['snack']['alternates']
+    names = [alternate['name'] for alternate in alternates]
+    suitable_mask = recommender.get_suitable_mask(profile) & recommender.dietary_index.meal_type_mask('snack')
+    assert len(alternates) == 3
+    assert len(set(names)) == 3 and daily_meals['snack']['name'] not in names
+    assert all(suitable_mask[recommender.name_codes == code].any() for code in recommender.get_name_codes(names))
+
+
+@pytest.mark.parametrize('portion_range', [(2, 1), (-0.5, 2), (0, 1), (1,), (1, float('inf')), (float('nan'), 1)])
+def test_portion_range_rejects_invalid_ranges(recommender, portion_range):
+    with pytest.raises(ValueError):
+        recommender.portion_range = portion_range
+
+    assert recommender.portion_range is None
+
+
+def test_portion_range_is_normalized_and_can_be_cleared(recommender):
+    recommender.portion_range = [1, 2]
+    assert recommender.portion_range == (1.0, 2.0)
+
+    recommender.portion_range = None
+    assert recommender.portion_range is None
+
+
+@pytest.mark.parametrize('planner', ['greedy', 'optimized'])
+def test_thin_window_takes_scalable_recipes_before_widening(recommender, planner):
+    recommender.portion_range = (0.5, 2.0)
+    stats = PlannerStats()
+
+    meal_plan, _ = recommender.generate_meal_plan(
+        NARROW_DIET_PROFILE, days=7, max_recipe_repeats=3, rng=np.random.default_rng(0), planner=planner, stats=stats
+    )
+
+    assert max(recipe_counts(recommender, meal_plan).values()) <= 3
+    assert stats.counters['max_repeat_no_alternative'] == 0
+    assert stats.counters['window_scaled'] > 0
+    assert stats.counters['window_widened'] == 0
+
+
+def test_fill_ids_are_the_closest_suitable_recipe_of_each_name(recommender):
+    suitable_mask = recommender.get_suitable_mask(NARROW_DIET_PROFILE)
+    fill_ids = recommender.find_fill_ids('breakfast', 400.0, suitable_mask, n_names=8)
+
+    nearest = recommender.calorie_index.nearest('breakfast', 400.0)
+    nearest = nearest[suitable_mask[nearest]]
+    _, first = np.unique(recommender.name_codes[nearest], return_index=True)
+    expected = nearest[np.sort(first)[:8]]
+    calories = recommender.nutrients['calories']
+    np.testing.assert_array_equal(np.abs(calories[fill_ids] - 400.0), np.abs(calories[expected] - 400.0))
+    assert recommender.count_names(fill_ids) == len(fill_ids) == 8
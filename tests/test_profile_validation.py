@@ -0,0 +1,62 @@
+import pytest
+
+from conftest import make_profile
+from profile_validation import parse_allergies, validate_profile
+
+
+def test_csv_strings_are_normalized():
+    profile, errors = validate_profile({
+        'age': '30', 'height': '175.5', 'weight': '75', 'gender': 'Male', 'activity_level': ' sedentary ',
+        'weight_goal': 'LOSS', 'allergies': 'Gluten;nuts', 'target_calories': '', 'user_id': 'u1'
+    })
+
+    assert errors == []
+    assert profile == {
+        'age': 30, 'height': 175.5, 'weight': 75, 'gender': 'male', 'activity_level': 'sedentary',
+        'weight_goal': 'loss', 'dietary_pref': 'non-veg', 'allergies': ['gluten', 'nuts'],
+        'target_calories': None, 'user_id': 'u1'
+    }
+
+
+@pytest.mark.parametrize('field, value', [
+    ('age', 15), ('age', 100), ('height', 50), ('height', 300), ('weight', 10), ('weight', 500),
+])
+def test_range_bounds_are_accepted(field, value):
+    _, errors = validate_profile(make_profile(**{field: value}))
+
+    assert errors == []
+
+
+@pytest.mark.parametrize('field, value, message', [
+    ('age', 14, 'age must be between 15 and 100'),
+    ('age', 101, 'age must be between 15 and 100'),
+    ('age', 30.5, 'age must be a whole number'),
+    ('age', 'thirty', 'age must be a number'),
+    ('height', 49.9, 'height must be between 50 and 300'),
+    ('height', 300.1, 'height must be between 50 and 300'),
+    ('weight', 9, 'weight must be between 10 and 500'),
+    ('weight', None, 'weight must be a number'),
+    ('gender', 'other', 'gender must be one of male, female'),
+    ('activity_level', None, 'activity_level is required'),
+    ('weight_goal', 'bulk', 'weight_goal must be one of loss, gain, maintain'),
+    ('dietary_pref', 'keto', 'dietary_pref must be one of vegan, vegetarian, non-veg'),
+    ('allergies', ['nuts', 'pollen'], 'allergies must be among'),
+    ('target_calories', 0, 'target_calories must be a positive number'),
+])
+def test_out_of_range_fields_are_reported(field, value, message):
+    _, errors = validate_profile(make_profile(**{field: value}))
+
+    assert len(errors) == 1 and errors[0].startswith(message)
+
+
+def test_all_errors_are_reported_together():
+    _, errors = validate_profile({'age': 200, 'gender': 'male'})
+
+    assert [error.split()[0] for error in errors] == ['age', 'height', 'weight', 'activity_level', 'weight_goal']
+
+
+@pytest.mark.parametrize('value, expected', [
+    (None, []), ('none', []), ("['nuts', 'Dairy']", ['nuts', 'dairy']), ('gluten|eggs', ['gluten', 'eggs']),
+])
+def test_parse_allergies(value, expected):
+    assert parse_allergies(value) == expected
@@ -0,0 +1,63 @@
+import pickle
+
+import numpy as np
+
+from recipe_index import CalorieIndex, NutrientIndex
+
+
+def test_nearest_searches_partitions_whose_first_recipe_is_unsuitable(recommender):
+    index = NutrientIndex(recommender.recipes_df)
+    partition = max((p for p in index.partitions if p['meal_type'] == 'lunch'), key=lambda p: len(p['positions']))
+    # Only some recipes of the partition pass, e.g. an allergen matched on the raw allergies_free string
+    suitable_mask = np.zeros(len(recommender.recipes_df), dtype=bool)
+    suitable_mask[partition['positions'][1::2]] = True
+
+    nearest = index.nearest('lunch', [700, 30, 80, 25, 6], 5, suitable_mask)
+
+    assert len(nearest) == 5
+    assert suitable_mask[nearest].all()
+
+
+def test_nearest_matches_brute_force(recommender):
+    index = NutrientIndex(recommender.recipes_df)
+    suitable_mask = recommender.get_suitable_mask({'dietary_pref': 'vegetarian', 'allergies': ['nuts']})
+    targets = [500, 25, 60, 18, 6]
+
+    nearest = index.nearest('breakfast', targets, 8, suitable_mask)
+
+    vectors = index._to_space(recommender.recipes_df[NutrientIndex.COLUMNS].to_numpy(dtype=np.float64))
+    distances = np.linalg.norm(vectors - index._to_space(np.asarray(targets, dtype=np.float64)), axis=1)
+    candidates = np.flatnonzero(
+        suitable_mask & (recommender.recipes_df['meal_type'].astype(str).to_numpy() == 'breakfast')
+        & ~np.isnan(distances)
+    )
+    expected = np.sort(candidates[np.argsort(distances[candidates], kind='stable')[:8]])
+    np.testing.assert_array_equal(nearest, expected)
+
+
+def test_calorie_index_window_and_nearest(recommender):
+    index = CalorieIndex(recommender.recipes_df)
+    calories = recommender.nutrients['calories']
+
+    window = index.window('dinner', 450, 550)
+    nearest = index.nearest('dinner', 500)
+
+    assert ((calories[window] >= 450) & (calories[window] <= 550)).all()
+    assert set(window) == set(nearest[:len(window)])
+    assert (np.diff(np.abs(calories[nearest] - 500)) >= 0).all()
+
+
+def test_suitable_partitions_are_found_once_per_key(recommender):
+    index = NutrientIndex(recommender.recipes_df)
+    suitable_mask = recommender.get_suitable_mask({'dietary_pref': 'vegan', 'allergies': ['gluten']})
+    targets = [600, 25, 70, 20, 8]
+
+    keyed = index.nearest('dinner', targets, 6, suitable_mask, suitable_key=('vegan', ('gluten',)))
+    # Served from the cache, the scan over the partitions would find none for an empty mask
+    cached = index.get_suitable_partitions(np.zeros_like(suitable_mask), suitable_key=('vegan', ('gluten',)))
+
+    np.testing.assert_array_equal(keyed, index.nearest('dinner', targets, 6, suitable_mask))
+    assert cached == index.get_suitable_partitions(suitable_mask)
+    assert all(suitable_mask[index.partitions[i]['positions']].any() for i in cached)
+    assert len(cached) < len(index.partitions)
+    assert pickle.loads(pickle.dumps(index))._suitable_partitions == {}
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from content_based_recommender import ContentBasedRecommender
+
+
+@pytest.mark.parametrize('goal', ['loss', 'gain', 'maintain'])
+@pytest.mark.parametrize('meal_type', ContentBasedRecommender.MEAL_TYPES)
+def test_vectorized_scores_match_per_row_scores(recommender, goal, meal_type):
+    recipes = recommender.recipes_df.iloc[::10]
+    expected = np.array([
+        recommender.calculate_nutritional_score(row, 2400, 'moderately_active', meal_type, goal)
+        for _, row in recipes.iterrows()
+    ])
+
+    scores = recommender.calculate_nutritional_scores(recipes, 2400, 'moderately_active', meal_type, goal)
+
+    np.testing.assert_allclose(scores, expected, rtol=0, atol=1e-12)
+
+
+def test_vectorized_scores_accept_arrays_without_fiber(recommender):
+    nutrients = {
+        'calories': np.array([500.0, 650.0]),
+        'protein': np.array([30.0, 10.0]),
+        'carbs': np.array([60.0, 90.0]),
+        'fats': np.array([15.0, 25.0])
+    }
+
+    scores = recommender.calculate_nutritional_scores(nutrients, 2000, 'sedentary', 'lunch', 'loss')
+
+    assert scores.shape == (2,)
+    assert ((scores >= 0) & (scores <= 1)).all()
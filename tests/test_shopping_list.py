@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+
+from recipe_catalog import FrameText
+from shopping_list import ParsedIngredients, aggregate_ingredients, parse_ingredient_line, parse_ingredients
+
+
+@pytest.mark.parametrize('line, expected', [
+    ('1 ½ tablespoons red-wine vinegar', ('red-wine vinegar', 22.1802, 'ml')),
+    ('1½ cups milk', ('milk', 354.882, 'ml')),
+    ('¾ cup sugar', ('sugar', 177.441, 'ml')),
+    ('1⁄2 tsp salt', ('salt', 2.46446, 'ml')),
+    ('2 1/2 cups flour', ('flour', 591.47, 'ml')),
+    ('2-3 carrots', ('carrot', 3.0, None)),
+])
+def test_fractions_and_mixed_numbers(line, expected):
+    name, quantity, unit = parse_ingredient_line(line)
+
+    assert (name, unit) == (expected[0], expected[2])
+    assert quantity == pytest.approx(expected[1])
+
+
+@pytest.mark.parametrize('line, expected', [
+    ('1 lb chicken breast', ('chicken breast', 453.592, 'g')),
+    ('2 kg potatoes', ('potatoes', 2000.0, 'g')),
+    ('1 (15 ounce) can black beans, drained', ('black beans', 425.2425, 'g')),
+    ('2 x 400g cans chickpeas', ('chickpeas', 800.0, 'g')),
+    ('3 garlic cloves', ('garlic', 3.0, 'clove')),
+    ('2 lemons', ('lemon', 2.0, None)),
+    ('salt, to taste', ('salt', None, None)),
+])
+def test_units_are_normalized(line, expected):
+    name, quantity, unit = parse_ingredient_line(line)
+
+    assert (name, unit) == (expected[0], expected[2])
+    assert quantity == (None if expected[1] is None else pytest.approx(expected[1]))
+
+
+@pytest.mark.parametrize('line, name', [
+    ('1/0 cup flour', 'flour'),
+    ('2 x 1/0 eggs', 'eggs'),
+    ('1 (1/0 ounce) can tomatoes', 'tomatoes'),
+])
+def test_zero_denominator_leaves_the_ingredient_without_amount(line, name):
+    assert parse_ingredient_line(line) == (name, None, None)
+
+
+def test_one_bad_quantity_does_not_stop_the_catalog_parse():
+    recipe_text = FrameText(pd.DataFrame({'ingredients': ['1/0 cup flour|2 eggs', '1 cup milk']}))
+
+    parsed = ParsedIngredients.build(recipe_text, 2)
+
+    assert parsed.get(0) == (('flour', None, None), ('egg', 2.0, None))
+    assert parsed.get(1) == parse_ingredients('1 cup milk')
+
+
+def test_aggregation_sums_same_ingredient_and_unit_with_servings():
+    shopping_list = aggregate_ingredients(
+        [parse_ingredients('1 cup milk|2 eggs|salt'), parse_ingredients('250 ml milk|1 egg|salt, to taste')],
+        servings=[2.0, 1.0]
+    )
+
+    assert shopping_list == [
+        {'ingredient': 'egg', 'quantity': 5.0, 'unit': None, 'meals': 2},
+        {'ingredient': 'milk', 'quantity': round(2 * 236.588 + 250, 2), 'unit': 'ml', 'meals': 2},
+        {'ingredient': 'salt', 'quantity': None, 'unit': None, 'meals': 2},
+    ]
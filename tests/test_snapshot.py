@@ -0,0 +1,70 @@
+import json
+import subprocess
+import sys
+
+import numpy as np
+
+from conftest import REPO_DIR, RECIPE_CSV, make_profile
+from content_based_recommender import ContentBasedRecommender
+from recipe_catalog import RecipeCatalog, hash_names
+from test_catalog import PROFILES, plan_all
+
+
+def test_snapshot_plans_match_dataframe_plans(tmp_path, recommender):
+    catalog = RecipeCatalog(RECIPE_CSV, catalog_dir=str(tmp_path / 'recipes.catalog'))
+    snapshot_dir = str(tmp_path / 'recipes.snapshot')
+
+    snapshot_recommender = ContentBasedRecommender.from_snapshot(snapshot_dir, catalog=catalog)
+
+    assert plan_all(snapshot_recommender) == plan_all(recommender)
+    recent_recipes = [recommender.recipe_text.get(recipe_id, 'name') for recipe_id in range(0, 300, 20)]
+    for profile in PROFILES:
+        assert (snapshot_recommender.generate_meal_plan(profile, recent_recipes=recent_recipes, rng=np.random.default_rng(5))
+                == recommender.generate_meal_plan(profile, recent_recipes=recent_recipes, rng=np.random.default_rng(5)))
+
+
+def test_snapshot_plans_without_importing_pandas(tmp_path):
+    catalog = RecipeCatalog(RECIPE_CSV, catalog_dir=str(tmp_path / 'recipes.catalog'))
+    snapshot_dir = str(tmp_path / 'recipes.snapshot')
+    ContentBasedRecommender.from_catalog(catalog, mmap_mode='r', lazy_text=True).save_snapshot(snapshot_dir)
+    script = f'''
+import json, sys
+sys.path.insert(0, {REPO_DIR!r})
+from content_based_recommender import ContentBasedRecommender
+recommender = ContentBasedRecommender.from_snapshot({snapshot_dir!r})
+recommender.generate_meal_plan({make_profile()!r}, recent_recipes=['x', 'Paneer Rezala Recipe'])
+print(json.dumps('pandas' in sys.modules))
+'''
+
+    result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+
+    assert json.loads(result.stdout) is False
+
+
+def test_snapshot_finds_similar_recipes_without_importing_pandas(tmp_path, recommender):
+    catalog = RecipeCatalog(RECIPE_CSV, catalog_dir=str(tmp_path / 'recipes.catalog'))
+    snapshot_dir = str(tmp_path / 'recipes.snapshot')
+    ContentBasedRecommender.from_catalog(catalog, mmap_mode='r', lazy_text=True).save_snapshot(snapshot_dir)
+    script = f'''
+import json, sys
+sys.path.insert(0, {REPO_DIR!r})
+from content_based_recommender import ContentBasedRecommender
+recommender = ContentBasedRecommender.from_snapshot({snapshot_dir!r})
+similar = recommender.find_similar_recipes(0, k=5, user_profile={make_profile(dietary_pref='vegetarian')!r})
+print(json.dumps({{'similar': similar, 'pandas': 'pandas' in sys.modules}}))
+'''
+
+    result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+
+    output = json.loads(result.stdout)
+    assert output['pandas'] is False
+    assert output['similar'] == recommender.find_similar_recipes(0, k=5, user_profile=make_profile(dietary_pref='vegetarian'))
+
+
+def test_name_hashes_are_stable_and_treat_missing_names_as_empty():
+    hashes = hash_names(['Toast', 'toast', '', None, float('nan'), 'Crème brûlée'])
+
+    assert hashes.dtype == np.uint64
+    assert len(set(hashes[:2].tolist() + hashes[5:].tolist())) == 3
+    assert hashes[2] == hashes[3] == hashes[4]
+    np.testing.assert_array_equal(hash_names(['Toast']), hashes[:1])
@@ -0,0 +1,61 @@
+import copy
+
+import numpy as np
+
+from conftest import make_profile
+
+PROFILE = make_profile()
+
+
+def plan_slots(recommender, meal_plan):
+    return {
+        (day_key, meal_type): meal['name'] for day_key, daily_meals in meal_plan.items()
+        for meal_type, meal in daily_meals.items() if meal_type in recommender.MEAL_TYPES
+    }
+
+
+def test_rejected_recipe_is_replaced_and_other_meals_kept(recommender):
+    meal_plan, _ = recommender.generate_meal_plan(PROFILE, rng=np.random.default_rng(0), alternates=2)
+    previous = copy.deepcopy(meal_plan)
+    rejected = meal_plan['day_1']['lunch']['name']
+
+    new_plan, summary, replanned = recommender.update_meal_plan(
+        meal_plan, PROFILE, rejected_recipes=[rejected], rng=np.random.default_rng(1), alternates=2
+    )
+
+    old_slots, new_slots = plan_slots(recommender, meal_plan), plan_slots(recommender, new_plan)
+    assert rejected not in new_slots.values()
+    assert set(replanned) == {slot for slot, name in old_slots.items() if name == rejected}
+    assert all(new_slots[slot] == name for slot, name in old_slots.items() if slot not in replanned)
+    assert all(
+        alternate['name'] != rejected
+        for daily_meals in new_plan.values() for meal_type, meal in daily_meals.items()
+        if meal_type in recommender.MEAL_TYPES for alternate in meal['alternates']
+    )
+    assert meal_plan == previous
+    assert summary['plan_duration'] == len(meal_plan)
+
+
+def test_calorie_delta_replans_only_meals_out_of_tolerance(recommender):
+    meal_plan, _ = recommender.generate_meal_plan(PROFILE, rng=np.random.default_rng(0))
+    target_calories = recommender.calculate_user_targets(PROFILE)['target_calories']
+
+    new_plan, _, replanned = recommender.update_meal_plan(
+        meal_plan, PROFILE, calorie_delta=-300, rng=np.random.default_rng(1)
+    )
+
+    assert replanned
+    for day_key, meal_type in plan_slots(recommender, meal_plan):
+        if (day_key, meal_type) not in replanned:
+            assert new_plan[day_key][meal_type] == meal_plan[day_key][meal_type]
+    assert new_plan['day_1']['daily_summary']['target_calories'] == round(target_calories - 300, 2)
+
+
+def test_no_feedback_replans_nothing(recommender):
+    meal_plan, summary = recommender.generate_meal_plan(PROFILE, rng=np.random.default_rng(0))
+
+    new_plan, new_summary, replanned = recommender.update_meal_plan(meal_plan, PROFILE)
+
+    assert replanned == []
+    assert new_plan == meal_plan
+    assert new_summary == summary